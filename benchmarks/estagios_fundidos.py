@@ -0,0 +1,103 @@
+# benchmarks/estagios_fundidos.py
+"""
+Compara a latência ponta a ponta do pipeline com e sem estágios fundidos
+
+Executa a definição real da Step Function no executor local (tools.pipeline_local),
+com os substitutos de S3, Textract e Groq. Cada Task soma um custo fixo simulando a
+invocação da Lambda e a transição de estado (--overhead-ms); os payloads entre estados
+passam por JSON como na Step Function.
+
+O corpus é um diretório de imagens com o texto OCR em um .txt de mesmo nome. Sem
+diretório, usa notas sintéticas.
+
+Uso:
+    python -m benchmarks.estagios_fundidos [diretorio/das/notas] [--overhead-ms 30] [--repeticoes 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from benchmarks.regex_scanner import synthetic_note
+from tools.pipeline_local import build_local_pipeline, load_lambda_modules
+from tools.stand_ins import FakeGroq, FakeS3, FakeTextract, install_stand_ins
+
+BUCKET = 'bucket-benchmark'
+
+# Layouts comparados: nome -> estágios fundidos
+LAYOUTS = {
+    'sem fusão': {},
+    'textract+regex': {'textract_regex': ['textract', 'regex']},
+    'textract+regex, llm+mover': {
+        'textract_regex': ['textract', 'regex'],
+        'llm_mover': ['llm', 'mover_imagem'],
+    },
+}
+
+LLM_RESPONSE = {
+    "nome_emissor": "SUPERMERCADO BOM PRECO LTDA",
+    "CNPJ_emissor": "12345678000190",
+    "endereco_emissor": "RUA DAS FLORES, 123",
+    "CNPJ_CPF_consumidor": "12345678909",
+    "data_emissao": "12/03/2024",
+    "numero_nota_fiscal": "123456",
+    "serie_nota_fiscal": "001",
+    "valor_total": "45.90",
+    "forma_pgto": "dinheiropix",
+}
+
+def load_corpus(directory):
+    if not directory:
+        return {f"sintetica_{items}.jpg": synthetic_note(items) for items in (5, 20, 60, 200)}
+    corpus = {}
+    for name in sorted(os.listdir(directory)):
+        base, extension = os.path.splitext(name)
+        ocr_path = os.path.join(directory, base + '.txt')
+        if extension.lower() != '.txt' and os.path.exists(ocr_path):
+            with open(ocr_path, encoding='utf-8') as f:
+                corpus[name] = f.read()
+    return corpus
+
+def run_layout(modules, corpus, fused_stages, overhead, repetitions):
+    timings = []
+    for _ in range(repetitions):
+        for file_name, text in corpus.items():
+            # Objetos novos a cada execução: o MoverIMG remove a imagem da raiz do bucket
+            s3 = FakeS3()
+            s3.put_object(Bucket=BUCKET, Key=file_name, Body=b'imagem')
+            textract = FakeTextract({file_name: text})
+            install_stand_ins(modules, s3=s3, textract=textract, groq=FakeGroq(lambda messages: json.dumps(LLM_RESPONSE)))
+
+            pipeline = build_local_pipeline(modules, fused_stages=fused_stages, task_overhead=overhead)
+            started = time.perf_counter()
+            pipeline.run({'file_name': file_name, 'bucket_name': BUCKET})
+            timings.append(time.perf_counter() - started)
+
+    tasks = sum(entry['type'] == 'Task' for entry in pipeline.report)
+    payload = sum(entry['input_bytes'] for entry in pipeline.report if entry['type'] == 'Task')
+    return statistics.median(timings), tasks, payload
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de estágios fundidos')
+    parser.add_argument('diretorio', nargs='?', help='Diretório com imagens e textos OCR (.txt)')
+    parser.add_argument('--overhead-ms', type=float, default=30.0, help='Custo simulado por Task (ms)')
+    parser.add_argument('--repeticoes', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    # Sem cache entre execuções para medir o caminho completo
+    os.environ['TEXTRACT_CACHE'] = 'off'
+    os.environ['LLM_CACHE'] = 'off'
+    modules = load_lambda_modules()
+    modules['llm'].memoria_cache.max_entries = 0
+    corpus = load_corpus(args.diretorio)
+
+    print(f"{'Layout':<28} {'Mediana (ms)':>13} {'Tasks':>6} {'Payload (B)':>12}")
+    for name, fused_stages in LAYOUTS.items():
+        median, tasks, payload = run_layout(
+            modules, corpus, fused_stages, args.overhead_ms / 1000, args.repeticoes
+        )
+        print(f"{name:<28} {median * 1000:>13.2f} {tasks:>6} {payload:>12}")
+
+if __name__ == '__main__':
+    main()
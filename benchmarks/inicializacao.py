@@ -0,0 +1,133 @@
+# benchmarks/inicializacao.py
+"""
+Mede o custo de inicialização (cold start) de cada Lambda
+
+Para cada Lambda implantada (build_lambda_specs), importa os módulos dela em um
+processo Python novo, como na fase de inicialização da Lambda, e registra a mediana do
+tempo de importação (inclui a criação dos clientes feita na importação). Também mostra
+o tamanho do zip da função e dos layers: o zip atual em layers/ e o layer mínimo
+montado por tools.empacotar a partir dos imports reais.
+
+Com --comparar, mede também os arquivos das Lambdas em outra revisão do git (ex.: o
+commit anterior às importações sob demanda).
+
+Uso:
+    python -m benchmarks.inicializacao [--repeticoes 5] [--comparar HEAD~1]
+"""
+import argparse
+import io
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+from tools.empacotar import (
+    LAMBDA_DIR, LAYERS_DIR, ROOT_DIR, arquivos_do_layer, distribuicoes_necessarias, gravar_zip, planejar_layers
+)
+
+IMPORT_SCRIPT = """
+import sys, time
+sys.path.insert(0, sys.argv[1])
+inicio = time.perf_counter()
+for modulo in sys.argv[2:]:
+    __import__(modulo)
+print(time.perf_counter() - inicio)
+"""
+
+def tempo_importacao(diretorio, modulos, environment, repeticoes):
+    """Mediana (ms) do tempo de importação dos módulos em processos novos"""
+    env = {**os.environ, 'AWS_DEFAULT_REGION': 'us-east-1', **environment}
+    tempos = []
+    for _ in range(repeticoes):
+        saida = subprocess.run(
+            [sys.executable, '-c', IMPORT_SCRIPT, diretorio, *modulos],
+            env=env, capture_output=True, text=True
+        )
+        if saida.returncode != 0:
+            return None
+        tempos.append(float(saida.stdout.strip().splitlines()[-1]) * 1000)
+    return statistics.median(tempos)
+
+def tamanho_zip_funcao(diretorio, files):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for filename in files:
+            zipf.write(os.path.join(diretorio, filename), filename)
+    return len(buffer.getvalue())
+
+def extrair_revisao(revisao, destino):
+    """Extrai lambda_functions/ da revisão do git para o diretório destino"""
+    archive = subprocess.run(
+        ['git', 'archive', revisao, 'lambda_functions'], cwd=ROOT_DIR, capture_output=True, check=True
+    )
+    with tempfile.TemporaryFile() as tar:
+        tar.write(archive.stdout)
+        tar.seek(0)
+        subprocess.run(['tar', '-x', '-C', destino], stdin=tar, check=True)
+    return os.path.join(destino, 'lambda_functions')
+
+def tamanhos_layers(specs):
+    """Tamanho (bytes) do zip atual e do zip mínimo de cada layer"""
+    from config.settings import LAYERS_CONFIG
+
+    modulos_por_layer, _ = planejar_layers(specs)
+    tamanhos = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for layer in {layer for spec in specs.values() for layer in spec['layers']}:
+            atual_path = os.path.join(LAYERS_DIR, LAYERS_CONFIG[layer]['zip_file'])
+            atual = os.path.getsize(atual_path) if os.path.exists(atual_path) else None
+            minimo = 0
+            if layer in modulos_por_layer:
+                distribuicoes, nao_instalados = distribuicoes_necessarias(sorted(modulos_por_layer[layer]))
+                minimo_path = os.path.join(temp_dir, f'{layer}.zip')
+                gravar_zip(arquivos_do_layer(distribuicoes), minimo_path)
+                minimo = None if nao_instalados else os.path.getsize(minimo_path)
+            tamanhos[layer] = (atual, minimo)
+    return tamanhos
+
+def formatar_kb(valor):
+    return f"{valor / 1024:.0f}" if valor is not None else '-'
+
+def formatar_ms(valor):
+    return f"{valor:.0f}" if valor is not None else 'erro'
+
+def main(argv=None):
+    from infrastructure.lambdas import build_lambda_specs
+
+    parser = argparse.ArgumentParser(description='Benchmark de inicialização das Lambdas')
+    parser.add_argument('--repeticoes', type=int, default=5)
+    parser.add_argument('--comparar', help='Revisão do git para comparar o tempo de importação')
+    args = parser.parse_args(argv)
+
+    specs = build_lambda_specs()
+    layers = tamanhos_layers(specs)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        anterior_dir = extrair_revisao(args.comparar, temp_dir) if args.comparar else None
+
+        coluna_anterior = f" {'Import ' + args.comparar + ' (ms)':>22}" if args.comparar else ''
+        print(
+            f"{'Lambda':<26} {'Import (ms)':>12}{coluna_anterior} {'Zip (KB)':>9} "
+            f"{'Layers atuais (KB)':>19} {'Layers mínimos (KB)':>20}"
+        )
+        for spec in specs.values():
+            modulos = [filename.replace('.py', '') for filename in spec['files']]
+            atual = tempo_importacao(LAMBDA_DIR, modulos, spec['environment'], args.repeticoes)
+            linha = f"{spec['name']:<26} {formatar_ms(atual):>12}"
+            if anterior_dir:
+                presentes = all(os.path.exists(os.path.join(anterior_dir, filename)) for filename in spec['files'])
+                anterior = tempo_importacao(anterior_dir, modulos, spec['environment'], args.repeticoes) if presentes else None
+                linha += f" {formatar_ms(anterior):>22}"
+
+            layers_atuais = [layers[layer][0] for layer in spec['layers']]
+            layers_minimos = [layers[layer][1] for layer in spec['layers']]
+            print(
+                f"{linha} {formatar_kb(tamanho_zip_funcao(LAMBDA_DIR, spec['files'])):>9} "
+                f"{formatar_kb(None if None in layers_atuais else sum(layers_atuais)):>19} "
+                f"{formatar_kb(None if None in layers_minimos else sum(layers_minimos)):>20}"
+            )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+# benchmarks/llm_lote.py
+"""
+Mede notas por segundo da etapa da LLM: chamadas sequenciais (uma nota por invocação)
+contra o processamento em lote concorrente, com e sem agrupamento de notas no prompt
+
+A Groq é simulada com latência fixa por chamada, então o resultado mostra o ganho de
+concorrência/agrupamento e não o tempo real do modelo.
+
+Uso:
+    python -m benchmarks.llm_lote [--notas 64] [--latencia 0.4] [--concorrencia 8] [--agrupar 4]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'lambda_functions'))
+
+from tools.stand_ins import FakeAsyncGroq, FakeGroq, ensure_groq_module  # noqa: E402
+
+ensure_groq_module()
+import llm_finetune  # noqa: E402
+
+def build_registros(quantidade):
+    return [
+        {
+            "nome_emissor": "SUPERMERCADO BOM PRECO LTDA",
+            "CNPJ_emissor": "11222333000181",
+            "endereco_emissor": "RUA DAS FLORES, 123, CENTRO CEP 58000-000",
+            "CNPJ_CPF_consumidor": "12345678909",
+            "data_emissao": "12/03/2024",
+            "numero_nota_fiscal": str(100000 + indice),
+            "serie_nota_fiscal": "001",
+            "valor_total": "45.90",
+            "forma_pgto": "dinheiropix",
+        }
+        for indice in range(quantidade)
+    ]
+
+def responder(messages):
+    # Prompt agrupado recebe um array com um objeto por nota
+    resposta = dict(build_registros(1)[0])
+    if messages[0]['content'] == llm_finetune.SYSTEM_PROMPT_AGRUPADO:
+        return json.dumps([resposta] * messages[1]['content'].count("Nota "))
+    return json.dumps(resposta)
+
+def run_sequential(registros, latencia):
+    groq = FakeGroq(responder)
+    original = groq._create
+
+    def slow_create(model, messages, **kwargs):
+        time.sleep(latencia)
+        return original(model, messages, **kwargs)
+
+    groq.chat.completions.create = slow_create
+    llm_finetune.client = groq
+    inicio = time.perf_counter()
+    for registro in registros:
+        llm_finetune.processar_nota_com_llm(registro)
+    return time.perf_counter() - inicio, len(groq.calls)
+
+def run_batch(registros, latencia, concorrencia, agrupar):
+    groq = FakeGroq(responder)
+    llm_finetune.criar_cliente_async = lambda: FakeAsyncGroq(groq, latency=latencia)
+    llm_finetune.LLM_CONCORRENCIA = concorrencia
+    llm_finetune.LLM_NOTAS_POR_PROMPT = agrupar
+    inicio = time.perf_counter()
+    llm_finetune.processar_lote_com_llm(registros)
+    return time.perf_counter() - inicio, len(groq.calls)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark do processamento em lote da LLM')
+    parser.add_argument('--notas', type=int, default=64)
+    parser.add_argument('--latencia', type=float, default=0.4, help='Latência simulada por chamada (s)')
+    parser.add_argument('--concorrencia', type=int, default=8)
+    parser.add_argument('--agrupar', type=int, default=4, help='Notas por prompt no modo agrupado')
+    args = parser.parse_args(argv)
+
+    registros = build_registros(args.notas)
+    cenarios = [
+        ('sequencial', lambda: run_sequential(registros, args.latencia)),
+        (f'lote (concorrência {args.concorrencia})',
+         lambda: run_batch(registros, args.latencia, args.concorrencia, 1)),
+        (f'lote + {args.agrupar} notas/prompt',
+         lambda: run_batch(registros, args.latencia, args.concorrencia, args.agrupar)),
+    ]
+
+    print(f"{'Cenário':<32} {'Tempo (s)':>10} {'Chamadas':>9} {'Notas/s':>9}")
+    for nome, executar in cenarios:
+        segundos, chamadas = executar()
+        print(f"{nome:<32} {segundos:>10.2f} {chamadas:>9} {args.notas / segundos:>9.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+# benchmarks/preprocessamento.py
+"""
+Compara o Textract com e sem o pré-processamento das imagens
+
+Para cada imagem do diretório, gera o derivado com
+preprocessamento_imagem.preprocessar_imagem, envia a original e o derivado para o
+bucket configurado e processa os dois com o Textract (perfil padrão), usando as
+credenciais do settings. Mede o tamanho enviado, a latência do Textract e a acurácia
+dos campos extraídos pela etapa de regex.
+
+A acurácia compara os campos com o gabarito em um .json de mesmo nome da imagem
+(chaves do JSON final, ex.: nota.json). Sem gabarito, mede a concordância do derivado
+com a original. Requer o Pillow instalado localmente.
+
+Uso:
+    python -m benchmarks.preprocessamento caminho/das/notas [--repeticoes 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'lambda_functions'))
+
+import preprocessamento_imagem  # noqa: E402
+import regex_nota_fiscal  # noqa: E402
+import textract_function  # noqa: E402
+from benchmarks.textract_perfis import IMAGE_EXTENSIONS, percentile  # noqa: E402
+from config.settings import BUCKET_NAME  # noqa: E402
+from deploy import get_boto3_client  # noqa: E402
+
+# Campos comparados; CNPJ/CPF já vêm só com dígitos do processar_nota
+CAMPOS = [
+    'nome_emissor', 'CNPJ_emissor', 'endereco_emissor', 'CNPJ_CPF_consumidor', 'data_emissao',
+    'numero_nota_fiscal', 'serie_nota_fiscal', 'valor_total', 'forma_pgto',
+]
+
+def load_expected(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        expected = json.load(f)
+    for campo in ('CNPJ_emissor', 'CNPJ_CPF_consumidor'):
+        if expected.get(campo):
+            expected[campo] = regex_nota_fiscal.somente_digitos(expected[campo])
+    return expected
+
+def run_textract(bucket_name, key, repetitions):
+    """Processa o objeto repetidas vezes; retorna as latências (ms) e os campos extraídos"""
+    latencies = []
+    response = None
+    for _ in range(repetitions):
+        started = time.perf_counter()
+        response = textract_function.process_document(bucket_name, key)
+        latencies.append((time.perf_counter() - started) * 1000)
+    lines = textract_function.extract_important_data(response) or []
+    return latencies, regex_nota_fiscal.processar_nota("\n".join(lines))
+
+def count_matches(fields, reference):
+    return sum(fields.get(campo) == reference.get(campo) for campo in CAMPOS)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark do pré-processamento das imagens')
+    parser.add_argument('diretorio', help='Diretório com as imagens das notas (gabarito opcional em .json)')
+    parser.add_argument('--bucket', default=BUCKET_NAME)
+    parser.add_argument('--prefixo', default='benchmark/preprocessamento/')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    s3_client = get_boto3_client('s3')
+    textract_function.client = get_boto3_client('textract')
+
+    modes = {'original': ([], [], [0, 0]), 'pré-processada': ([], [], [0, 0])}
+    for name in sorted(os.listdir(args.diretorio)):
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        with open(os.path.join(args.diretorio, name), 'rb') as f:
+            original = f.read()
+        derived = preprocessamento_imagem.preprocessar_imagem(original)
+        expected = load_expected(os.path.join(args.diretorio, os.path.splitext(name)[0] + '.json'))
+
+        fields_by_mode = {}
+        for mode, content in (('original', original), ('pré-processada', derived)):
+            key = f"{args.prefixo}{mode}/{name}"
+            s3_client.put_object(Bucket=args.bucket, Key=key, Body=content)
+            sizes, latencies, _ = modes[mode]
+            sizes.append(len(content))
+            mode_latencies, fields_by_mode[mode] = run_textract(args.bucket, key, args.repeticoes)
+            latencies.extend(mode_latencies)
+
+        # Sem gabarito, a referência é o resultado da original
+        reference = expected or fields_by_mode['original']
+        for mode, fields in fields_by_mode.items():
+            accuracy = modes[mode][2]
+            accuracy[0] += count_matches(fields, reference)
+            accuracy[1] += len(CAMPOS)
+
+    if not modes['original'][0]:
+        print("Nenhuma imagem encontrada")
+        return
+
+    print(f"{'Modo':<16} {'Tamanho (KB)':>13} {'Mediana (ms)':>13} {'p90 (ms)':>10} {'Campos corretos':>16}")
+    for mode, (sizes, latencies, (matches, total)) in modes.items():
+        print(
+            f"{mode:<16} {statistics.mean(sizes) / 1024:>13.1f} {statistics.median(latencies):>13.0f} "
+            f"{percentile(latencies, 0.9):>10.0f} {matches / total:>16.1%}"
+        )
+
+if __name__ == '__main__':
+    main()
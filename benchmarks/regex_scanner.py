@@ -0,0 +1,107 @@
+# benchmarks/regex_scanner.py
+"""
+Mede o custo por nota da extração por regex: nove re.search sobre o texto completo,
+um por campo (extract_field), contra scan_fields, que testa os campos âncora só nas
+posições dos literais e busca os demais com os padrões pré-compilados
+
+O corpus é um diretório de textos OCR (.txt, um por nota, como o important_data gerado
+pelo Textract). Sem diretório, usa notas sintéticas de tamanhos variados.
+
+Uso:
+    python -m benchmarks.regex_scanner [diretorio/com/textos] [--repeticoes 200]
+"""
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import timeit
+
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'lambda_functions'))
+
+import regex_nota_fiscal  # noqa: E402
+
+# Extrator anterior a scan_fields: um re.search por campo, sem compilar os padrões
+def extract_field(pattern, text, default="<none>"):
+    match = re.search(pattern, text, re.IGNORECASE)
+    return match.group(0) if match else default
+
+def legacy_fields(text):
+    return {
+        campo: extract_field(padrao, text, None)
+        for campo, padrao in regex_nota_fiscal.REGEX_PATTERNS.items()
+    }
+
+def synthetic_note(items, with_ltda=True):
+    rng = random.Random(items)
+    lines = [
+        "SUPERMERCADO BOM PRECO LTDA" if with_ltda else "SUPERMERCADO BOM PRECO",
+        "CNPJ: 12.345.678/0001-90 IE: 123456789",
+        "RUA DAS FLORES, 123, CENTRO CEP 58000-000 JOAO PESSOA PB",
+        "Extrato No. 123456",
+        "CUPOM FISCAL ELETRONICO - SAT",
+        "CPF/CNPJ do Consumidor: 123.456.789-09",
+        "# | COD | DESC | QTD | UN | VL UN R$ | (VL TR R$)* | VL ITEM R$",
+    ]
+    for index in range(items):
+        lines.append(
+            f"{index + 1:03d} 789{rng.randint(10**9, 10**10 - 1)} PRODUTO "
+            f"{rng.choice(['ARROZ', 'FEIJAO', 'LEITE', 'PAO', 'CAFE'])} 1 UN X "
+            f"{rng.randint(1, 99)},{rng.randint(10, 99)} ({rng.randint(0, 9)},{rng.randint(10, 99)})"
+        )
+    lines += [
+        "TOTAL R$ : 145,90",
+        "Dinheiro 150,00",
+        "SAT No. 000123456",
+        "12/03/2024 - 10:33:12",
+    ]
+    return "\n".join(lines)
+
+def load_corpus(directory):
+    if not directory:
+        return {
+            f"sintetica_{items}_itens{'' if ltda else '_sem_ltda'}": synthetic_note(items, ltda)
+            for items in (5, 20, 60, 200)
+            for ltda in (True, False)
+        }
+    corpus = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.txt'):
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                corpus[name] = f.read()
+    return corpus
+
+def per_call_us(function, text, repetitions):
+    timings = timeit.repeat(lambda: function(text), number=repetitions, repeat=5)
+    return min(timings) / repetitions * 1e6
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark da extração por regex')
+    parser.add_argument('diretorio', nargs='?', help='Diretório com textos OCR (.txt)')
+    parser.add_argument('--repeticoes', type=int, default=200)
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.diretorio)
+    before, after = [], []
+    print(f"{'Nota':<32} {'Bytes':>7} {'Antes (us)':>11} {'Depois (us)':>12} {'Ganho':>7}")
+    for name, text in corpus.items():
+        # Os dois caminhos precisam extrair exatamente os mesmos campos
+        legacy = legacy_fields(text)
+        scanned = regex_nota_fiscal.scan_fields(text)
+        legacy["FORMA_PGTO"] = legacy["FORMA_PGTO"] and legacy["FORMA_PGTO"].lower()
+        scanned["FORMA_PGTO"] = scanned["FORMA_PGTO"] and scanned["FORMA_PGTO"].lower()
+        if legacy != scanned:
+            print(f"⚠️ Resultado divergente em {name}: {legacy} != {scanned}")
+
+        old = per_call_us(legacy_fields, text, args.repeticoes)
+        new = per_call_us(regex_nota_fiscal.scan_fields, text, args.repeticoes)
+        before.append(old)
+        after.append(new)
+        print(f"{name:<32} {len(text.encode('utf-8')):>7} {old:>11.1f} {new:>12.1f} {old / new:>6.1f}x")
+
+    print(f"Mediana por nota: {statistics.median(before):.1f} us -> {statistics.median(after):.1f} us")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/textract_perfis.py
+"""
+Compara latência e tamanho da resposta dos perfis de extração do Textract
+
+Envia as imagens de um diretório para o bucket configurado e processa cada uma com
+todos os perfis de textract_function.TEXTRACT_PROFILES, usando as credenciais do settings.
+
+Uso:
+    python -m benchmarks.textract_perfis caminho/das/notas [--repeticoes 3]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'lambda_functions'))
+
+import textract_function  # noqa: E402
+from config.settings import BUCKET_NAME  # noqa: E402
+from deploy import get_boto3_client  # noqa: E402
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+def upload_images(s3_client, bucket_name, directory, prefix):
+    keys = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith(IMAGE_EXTENSIONS):
+            key = f"{prefix}{name}"
+            with open(os.path.join(directory, name), 'rb') as f:
+                s3_client.put_object(Bucket=bucket_name, Key=key, Body=f.read())
+            keys.append(key)
+    return keys
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark dos perfis de extração do Textract')
+    parser.add_argument('diretorio', help='Diretório com as imagens das notas')
+    parser.add_argument('--bucket', default=BUCKET_NAME)
+    parser.add_argument('--prefixo', default='benchmark/')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--perfis', nargs='+', default=list(textract_function.TEXTRACT_PROFILES))
+    args = parser.parse_args(argv)
+
+    textract_function.client = get_boto3_client('textract')
+    keys = upload_images(get_boto3_client('s3'), args.bucket, args.diretorio, args.prefixo)
+    if not keys:
+        print("Nenhuma imagem encontrada")
+        return
+
+    results = {}
+    lines_by_profile = {}
+    for profile in args.perfis:
+        latencies, sizes, blocks = [], [], []
+        for key in keys:
+            for _ in range(args.repeticoes):
+                started = time.perf_counter()
+                response = textract_function.process_document(args.bucket, key, profile)
+                latencies.append((time.perf_counter() - started) * 1000)
+                if response is None:
+                    continue
+                sizes.append(len(json.dumps(response, default=str)))
+                blocks.append(len(response.get('Blocks', [])))
+            lines_by_profile.setdefault(profile, {})[key] = textract_function.extract_important_data(response)
+        results[profile] = (latencies, sizes, blocks)
+
+    print(f"{'Perfil':<22} {'Mediana (ms)':>13} {'p90 (ms)':>10} {'Resposta (KB)':>14} {'Blocos':>8}")
+    for profile, (latencies, sizes, blocks) in results.items():
+        print(
+            f"{profile:<22} {statistics.median(latencies):>13.0f} {percentile(latencies, 0.9):>10.0f} "
+            f"{statistics.mean(sizes) / 1024 if sizes else 0:>14.1f} {statistics.mean(blocks) if blocks else 0:>8.0f}"
+        )
+
+    # As linhas (LINE) extraídas devem ser as mesmas em todos os perfis
+    reference = lines_by_profile[args.perfis[0]]
+    for profile in args.perfis[1:]:
+        divergent = [key for key in keys if lines_by_profile[profile][key] != reference[key]]
+        print(f"Linhas divergentes entre {args.perfis[0]} e {profile}: {len(divergent)} de {len(keys)}")
+
+if __name__ == '__main__':
+    main()
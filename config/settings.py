@@ -22,15 +22,19 @@ LAMBDA_NAMES = {
     'regex': 'regex_nota_fiscal',
     'llm': 'llm_finetune',
     'mover_imagem': 'mover-imagem-s3',
+    'ingestao': 'ingestao-s3',
+    'preprocessamento': 'preprocessamento-imagem',
 }
 
 # Mapeamento de Layers para cada Lambda
 LAMBDA_LAYERS = {
-    'integracao': ['RequestToolbelt'],
+    'integracao': [],
     'textract': [],
-    'regex': ['NLTK'],
+    'regex': [],
     'llm': ['GROQ'],
     'mover_imagem': [],
+    'ingestao': [],
+    'preprocessamento': ['PILLOW'],
 }
 
 # Mapeamento dos arquivos Lambda
@@ -40,33 +44,113 @@ LAMBDA_FILES = {
     'regex': 'regex_nota_fiscal.py',
     'llm': 'llm_finetune.py',
     'mover_imagem': 'mover_imagem_s3.py',
+    'ingestao': 'ingestao_s3.py',
+    'preprocessamento': 'preprocessamento_imagem.py',
 }
 
+# Pré-processamento das imagens antes do Textract (orientação, recorte, tons de cinza e
+# redução para PREPROCESSING_DPI). Quando ativo, a etapa entra no início do pipeline e o
+# Textract lê o derivado gravado em derivados/; PDFs e TIFFs passam sem alteração
+IMAGE_PREPROCESSING = False
+PREPROCESSING_DPI = 300
+
+# Validade (em dias) das imagens derivadas do pré-processamento (prefixo derivados/)
+DERIVED_TTL_DAYS = 7
+
+# Estágios fundidos: cada entrada vira uma única Lambda que executa em processo os
+# handlers dos estágios listados (consecutivos no pipeline [preprocessamento ->] textract
+# -> regex -> llm -> mover_imagem), evitando uma transição da Step Function e a serialização do payload
+# entre eles. A Lambda fundida usa a role do primeiro estágio e a soma dos layers e das
+# variáveis de ambiente dos estágios. Ex.: 'textract_regex': ['textract', 'regex'].
+# Vazio mantém uma Lambda por etapa
+FUSED_STAGES = {}
+
 # Mapeamento de qual Lambda usa qual Role
 LAMBDA_ROLES = {
     'integracao': 'RoleS3Step',
     'textract': 'RoleS3Textract',
     'regex': 'RoleS3Textract',
-    'llm': 'RoleDefault',
+    'llm': 'RoleS3',
     'mover_imagem': 'RoleS3',
+    'ingestao': 'RoleStep',
+    'preprocessamento': 'RoleS3',
 }
 
 STEP_FUNCTION_NAME = 'notas-fiscais-step-function'
+
+# State machine EXPRESS implantada ao lado da STANDARD, com a mesma definição. Requisições
+# síncronas usam start_sync_execution nela (resultado em uma chamada, sem polling); as
+# assíncronas e os lotes continuam na STANDARD
+DEPLOY_EXPRESS_STEP_FUNCTION = True
+EXPRESS_STEP_FUNCTION_NAME = 'notas-fiscais-step-function-express'
 API_NAME = 'NotasFiscaisAPI'
 
+# Modo de execução do POST /invoice: False retorna 202 com o job id (consultado via
+# GET /invoice/{id}); True mantém o comportamento síncrono, aguardando a Step Function
+INVOICE_SYNC_MODE = False
+
+# Número máximo de notas de um lote processadas em paralelo pelo estado Map
+BATCH_MAX_CONCURRENCY = 10
+
+# Intervalo (em segundos) entre as consultas a um job assíncrono do Textract (PDFs e
+# imagens acima de 5 MB)
+TEXTRACT_POLL_SECONDS = 5
+
+# Validade (em dias) das entradas de cache guardadas no bucket (prefixo cache/)
+CACHE_TTL_DAYS = 30
+
+# Ingestão em massa: objetos criados sob INGESTION_PREFIX disparam a Lambda de ingestão
+# (notificação do S3), que executa o pipeline sem passar pela API. A concorrência
+# reservada da Lambda limita quantas notas são processadas ao mesmo tempo (cotas do
+# Textract e da Groq); com a state machine EXPRESS cada invocação aguarda a nota terminar
+INGESTION_PREFIX = 'entrada/'
+INGESTION_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.pdf', '.tif', '.tiff']
+INGESTION_MAX_CONCURRENCY = 5
+
+# Timeout (segundos) de cada Lambda; as ausentes usam o padrão de 30 segundos
+LAMBDA_TIMEOUTS = {
+    'ingestao': 300,
+    'preprocessamento': 60,
+}
+
+# Concorrência reservada de cada Lambda (ausentes: sem reserva)
+LAMBDA_RESERVED_CONCURRENCY = {
+    'ingestao': INGESTION_MAX_CONCURRENCY,
+}
+
+# Variáveis de ambiente de cada Lambda
+LAMBDA_ENVIRONMENT = {
+    'integracao': {
+        'S3_BUCKET_NAME': BUCKET_NAME,
+        'STEP_FUNCTION_NAME': STEP_FUNCTION_NAME,
+        'EXPRESS_STEP_FUNCTION_NAME': EXPRESS_STEP_FUNCTION_NAME if DEPLOY_EXPRESS_STEP_FUNCTION else '',
+        'INVOICE_SYNC_MODE': str(INVOICE_SYNC_MODE).lower(),
+    },
+    'textract': {
+        'TEXTRACT_PROFILE': 'linhas',
+        'TEXTRACT_CACHE': 's3',
+        'TEXTRACT_CACHE_TTL': str(CACHE_TTL_DAYS * 24 * 3600),
+    },
+    'ingestao': {
+        'STEP_FUNCTION_NAME': STEP_FUNCTION_NAME,
+        'EXPRESS_STEP_FUNCTION_NAME': EXPRESS_STEP_FUNCTION_NAME if DEPLOY_EXPRESS_STEP_FUNCTION else '',
+    },
+    'preprocessamento': {
+        'PREPROC_DPI': str(PREPROCESSING_DPI),
+    },
+    'llm': {
+        'LLM_CACHE': 's3',
+        'LLM_CACHE_TTL': str(CACHE_TTL_DAYS * 24 * 3600),
+    },
+}
+
 # Configuração dos Layers
 LAYERS_CONFIG = {
-    'RequestToolbelt': {
-        'description': 'Layer contendo o Request Toolbelt para chamadas HTTP avançadas',
-        'zip_file': 'request_toolbelt.zip',
-        'compatible_runtimes': [PYTHON_VERSION],
-        'license_info': 'Apache-2.0'
-    },
-    'NLTK': {
-        'description': 'Layer contendo o NLTK para processamento de linguagem natural',
-        'zip_file': 'nltk.zip',
+    'PILLOW': {
+        'description': 'Layer contendo o Pillow para o pré-processamento das imagens',
+        'zip_file': 'pillow.zip',
         'compatible_runtimes': [PYTHON_VERSION],
-        'license_info': 'Apache-2.0'
+        'license_info': 'HPND'
     },
     'GROQ': {
         'description': 'Layer contendo o GROQQ para processamento de linguagem natural',
@@ -1,13 +1,20 @@
 # deploy.py (atualizado)
+import argparse
 import boto3
 import time
-from infrastructure.s3 import create_s3_bucket
-from infrastructure.iam import create_iam_roles
-from infrastructure.lambdas import create_lambda_functions
-from infrastructure.step_function import create_step_function 
+from infrastructure.s3 import create_s3_bucket, configure_ingestion_notifications
+from infrastructure.iam import create_iam_roles, role_arn, STEPFUNCTIONS_ROLE_NAME
+from infrastructure.lambdas import deploy_lambda_function, build_lambda_specs, plan_lambda_function, describe_plan
+from infrastructure.step_function import (
+    create_step_function, build_pipeline_groups, build_definition, state_machine_arn, state_machine_changed
+)
 from infrastructure.api_gateway import create_rest_api
-from infrastructure.layers import create_layers, attach_layers_to_functions  # Adicionado
-from config.settings import AWS_CREDENTIALS, LAMBDA_NAMES, LAMBDA_LAYERS, BUCKET_NAME, REGION
+from infrastructure.layers import create_layers, plan_layer, required_layers
+from infrastructure.orchestration import run_steps, print_timings
+from config.settings import (
+    AWS_CREDENTIALS, BUCKET_NAME, REGION, DEPLOY_EXPRESS_STEP_FUNCTION, EXPRESS_STEP_FUNCTION_NAME,
+    STEP_FUNCTION_NAME, AWS_ACCOUNT_ID
+)
 
 def get_boto3_client(service_name):
     """Configura o cliente AWS com credenciais temporárias"""
@@ -19,77 +26,142 @@ def get_boto3_client(service_name):
         aws_session_token=AWS_CREDENTIALS['aws_session_token']
     )
 
-def main():
-    print("--------------------------------------------------------")
-    print("Iniciando implantação da infraestrutura...")
-    print("--------------------------------------------------------")
-    
-    try:
-        # 1. Criação do S3
-        s3_client = get_boto3_client('s3')
-        create_s3_bucket(s3_client, BUCKET_NAME, REGION)
-        print("--------------------------------------------------------")
-        print("Bucket S3 criado")
-        print("--------------------------------------------------------")
+def build_deploy_steps(clients):
+    """
+    Etapas do deploy e suas dependências
 
-        # 2. Criação de políticas e roles IAM
-        iam_client = get_boto3_client('iam')
-        lambda_roles, stepfunctions_role_arn = create_iam_roles(iam_client)
-        print("--------------------------------------------------------")
-        print("Permissões IAM configuradas")
-        print("--------------------------------------------------------")
+    Cada Lambda é uma etapa própria: a API só aguarda a Lambda de integração, a Step
+    Function aguarda as Lambdas do pipeline e a ingestão aguarda o bucket e a Lambda de
+    ingestão. Layers e roles IAM não dependem de nada e rodam junto com o bucket.
+    """
+    s3_client = clients['s3']
+    lambda_client = clients['lambda']
+    stepfunctions_client = clients['stepfunctions']
+    lambda_specs = build_lambda_specs()
+
+    # Lambdas executadas pela Step Function (etapas ou estágios fundidos)
+    pipeline_types = [lambda_type for lambda_type, _ in build_pipeline_groups()]
+    pipeline_lambdas = [f'lambda:{lambda_type}' for lambda_type in pipeline_types]
 
-        # Pausa para propagação das roles IAM
-        print("Aguardando 5 segundos para propagação das roles IAM...")
-        time.sleep(5)
+    def lambda_arns(results):
+        return {lambda_type: results[f'lambda:{lambda_type}'] for lambda_type in pipeline_types}
 
+    steps = {
+        # 1. Criação do S3
+        's3': ([], lambda results: create_s3_bucket(s3_client, BUCKET_NAME, REGION)),
+        # 2. Criação de políticas e roles IAM
+        'iam': ([], lambda results: create_iam_roles(clients['iam'])),
         # 3. Criação dos Layers
-        lambda_client = get_boto3_client('lambda')
-        layer_arns = create_layers(lambda_client)
-        print("--------------------------------------------------------")
-        print("Layers criados")
-        print("--------------------------------------------------------")
+        'layers': ([], lambda results: create_layers(lambda_client)),
+    }
 
-        # 4. Criação das funções Lambda
-        lambda_arns = create_lambda_functions(lambda_client, lambda_roles)
-
-        
-        # Anexa layers específicos a cada função
-        if layer_arns:
-            from config import settings
-            attach_layers_to_functions(
-                lambda_client,
-                {
-                    'LAMBDA_NAMES': LAMBDA_NAMES,
-                    'LAMBDA_LAYERS': LAMBDA_LAYERS
-                },
-                layer_arns
+    # 4. Criação das funções Lambda, já com os layers anexados
+    for lambda_type, spec in lambda_specs.items():
+        steps[f'lambda:{lambda_type}'] = (
+            ['iam', 'layers'],
+            lambda results, spec=spec: deploy_lambda_function(
+                lambda_client, spec, results['iam'][0], results['layers']
             )
-            
-        print("--------------------------------------------------------")
-        print("Funções Lambda criadas com as roles específicas")
-        print("--------------------------------------------------------")
+        )
 
-        # 5. Criação da Step Function
-        stepfunctions_client = get_boto3_client('stepfunctions')
-        step_function_arn = create_step_function(
-            stepfunctions_client,
-            stepfunctions_role_arn,
-            lambda_arns
+    # 5. Criação da Step Function (STANDARD e, quando habilitada, EXPRESS)
+    steps['step_function'] = (
+        ['iam'] + pipeline_lambdas,
+        lambda results: create_step_function(stepfunctions_client, results['iam'][1], lambda_arns(results))
+    )
+    if DEPLOY_EXPRESS_STEP_FUNCTION:
+        steps['step_function_express'] = (
+            ['iam'] + pipeline_lambdas,
+            lambda results: create_step_function(
+                stepfunctions_client,
+                results['iam'][1],
+                lambda_arns(results),
+                name=EXPRESS_STEP_FUNCTION_NAME,
+                workflow_type='EXPRESS'
+            )
         )
-        print("--------------------------------------------------------")
-        print("Step Function criada")
-        print("--------------------------------------------------------")
 
-        # 6. Criação da API Gateway
-        apigateway_client = get_boto3_client('apigateway')
-        api_url = create_rest_api(
-            apigateway_client, 
-            lambda_client, 
-            lambda_arns['integracao']
+    # 6. Criação da API Gateway
+    steps['api'] = (
+        ['lambda:integracao'],
+        lambda results: create_rest_api(clients['apigateway'], lambda_client, results['lambda:integracao'])
+    )
+
+    # 7. Ingestão em massa: objetos enviados ao prefixo de entrada disparam o pipeline
+    steps['ingestao'] = (
+        ['s3', 'lambda:ingestao'],
+        lambda results: configure_ingestion_notifications(
+            s3_client, lambda_client, BUCKET_NAME, results['lambda:ingestao']
         )
-        print("--------------------------------------------------------")
-        print(f"API Gateway criada\nURL: {api_url}/invoice")
+    )
+    return steps
+
+def print_deploy_plan(clients):
+    """
+    Exibe o que o deploy alteraria, sem criar nem atualizar nada
+
+    Compara os ZIPs locais (CodeSha256) e a configuração das Lambdas, os ZIPs dos layers
+    e as definições das Step Functions com o que está implantado. Bucket, roles, API e
+    notificações não entram no plano: o deploy os reaplica sempre.
+    """
+    lambda_client = clients['lambda']
+    stepfunctions_client = clients['stepfunctions']
+
+    print("Layers:")
+    layer_arns = {}
+    for layer_name, config in required_layers().items():
+        try:
+            plan = plan_layer(lambda_client, layer_name, config)
+        except FileNotFoundError as e:
+            print(f"  ⚠️ {layer_name}: {e}")
+            continue
+        # Uma versão ainda não publicada não tem ARN; o marcador faz as Lambdas que usam o layer aparecerem no plano
+        layer_arns[layer_name] = plan['layer_arn'] if plan['action'] == 'unchanged' else f"{layer_name}:nova-versao"
+        action = 'sem alterações' if plan['action'] == 'unchanged' else 'publicar'
+        print(f"  {layer_name:<28} {action} ({plan['reason']})")
+
+    print("Lambdas:")
+    function_arns = {}
+    for lambda_type, spec in build_lambda_specs().items():
+        plan = plan_lambda_function(lambda_client, spec, role_arn(spec['role']), layer_arns)
+        function_arns[lambda_type] = plan['function_arn'] or f"arn:aws:lambda:{REGION}:{AWS_ACCOUNT_ID}:function:{spec['name']}"
+        print(f"  {spec['name']:<28} {describe_plan(plan)}")
+
+    print("Step Functions:")
+    lambda_arns = {lambda_type: function_arns[lambda_type] for lambda_type, _ in build_pipeline_groups()}
+    names = [STEP_FUNCTION_NAME] + ([EXPRESS_STEP_FUNCTION_NAME] if DEPLOY_EXPRESS_STEP_FUNCTION else [])
+    for name in names:
+        changed = state_machine_changed(
+            stepfunctions_client, state_machine_arn(name), build_definition(lambda_arns), role_arn(STEPFUNCTIONS_ROLE_NAME)
+        )
+        action = 'criar' if changed is None else 'atualizar' if changed else 'sem alterações'
+        print(f"  {name:<28} {action}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Implanta a infraestrutura na AWS')
+    parser.add_argument('--dry-run', action='store_true', help='Exibe o plano de alterações sem implantar')
+    args = parser.parse_args(argv)
+
+    print("--------------------------------------------------------")
+    print("Plano de implantação (dry-run)..." if args.dry_run else "Iniciando implantação da infraestrutura...")
+    print("--------------------------------------------------------")
+    
+    try:
+        # Clientes criados antes das threads (a criação de clientes não é thread-safe)
+        clients = {
+            service_name: get_boto3_client(service_name)
+            for service_name in ('s3', 'iam', 'lambda', 'stepfunctions', 'apigateway')
+        }
+
+        if args.dry_run:
+            print_deploy_plan(clients)
+            return
+
+        started = time.perf_counter()
+        results, timings = run_steps(build_deploy_steps(clients))
+        print_timings(timings, time.perf_counter() - started)
+
+        print(f"API Gateway criada\nURL: {results['api']}/invoice")
         print("--------------------------------------------------------")
 
     except Exception as e:
@@ -97,4 +169,4 @@ def main():
         raise
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -2,12 +2,92 @@ import time
 from botocore.exceptions import ClientError
 from config.settings import AWS_ACCOUNT_ID, API_NAME, LAMBDA_NAMES, REGION
 
+# Rotas expostas pela API (caminho, método HTTP), todas integradas à Lambda de integração
+INVOICE_ROUTES = [
+    ('/invoice', 'POST'),
+    ('/invoice/{id}', 'GET'),
+    ('/invoice/upload-url', 'POST'),
+    ('/invoice/{id}/start', 'POST'),
+]
+
+def get_or_create_resource(apigateway_client, api_id, resources, path):
+    """Retorna o ID do recurso no caminho informado, criando-o (e seus pais) se necessário"""
+    resource = next((res for res in resources if res.get('path') == path), None)
+    if resource:
+        print(f"🔄 Recurso {path} já existe")
+        return resource['id']
+
+    parent_path, path_part = path.rsplit('/', 1)
+    if parent_path:
+        parent_id = get_or_create_resource(apigateway_client, api_id, resources, parent_path)
+    else:
+        parent_id = next(res['id'] for res in resources if res['path'] == '/')
+
+    resource = apigateway_client.create_resource(
+        restApiId=api_id,
+        parentId=parent_id,
+        pathPart=path_part
+    )
+    resources.append(resource)
+    print(f"✅ Recurso {path} criado")
+    return resource['id']
+
+def configure_lambda_route(apigateway_client, lambda_client, api_id, resources, path, http_method, lambda_arn):
+    """Configura método, integração proxy e permissão de invocação de uma rota"""
+    resource_id = get_or_create_resource(apigateway_client, api_id, resources, path)
+
+    # Parâmetros de caminho (ex.: {id}) são declarados como obrigatórios; o Content-Type
+    # só é exigido no envio do arquivo
+    request_parameters = {'method.request.header.Content-Type': http_method == 'POST' and path == '/invoice'}
+    for part in path.split('/'):
+        if part.startswith('{') and part.endswith('}'):
+            request_parameters[f'method.request.path.{part[1:-1]}'] = True
+
+    # Configuração do método
+    try:
+        apigateway_client.put_method(
+            restApiId=api_id,
+            resourceId=resource_id,
+            httpMethod=http_method,
+            authorizationType='NONE',
+            requestParameters=request_parameters
+        )
+        print(f"✅ Método {http_method} {path} configurado")
+    except apigateway_client.exceptions.ConflictException:
+        print(f"🔄 Método {http_method} {path} já existe")
+
+    # Configuração da integração como proxy
+    apigateway_client.put_integration(
+        restApiId=api_id,
+        resourceId=resource_id,
+        httpMethod=http_method,
+        type='AWS_PROXY',
+        integrationHttpMethod='POST',
+        uri=f'arn:aws:apigateway:{REGION}:lambda:path/2015-03-31/functions/{lambda_arn}/invocations',
+        contentHandling='CONVERT_TO_BINARY'  # Converte o payload para binário
+    )
+    print(f"✅ Integração Lambda proxy configurada para {http_method} {path}")
+
+    # Configuração de permissões (com ID único)
+    source_path = '/'.join('*' if part.startswith('{') else part for part in path.split('/'))
+    try:
+        lambda_client.add_permission(
+            FunctionName=LAMBDA_NAMES['integracao'],
+            StatementId=f"apigateway-invoke-{http_method.lower()}-{int(time.time() * 1000)}",
+            Action='lambda:InvokeFunction',
+            Principal='apigateway.amazonaws.com',
+            SourceArn=f"arn:aws:execute-api:{REGION}:{AWS_ACCOUNT_ID}:{api_id}/*/{http_method}{source_path}"
+        )
+        print(f"✅ Permissão Lambda configurada para {http_method} {path}")
+    except lambda_client.exceptions.ResourceConflictException:
+        print("🔒 Permissão já existe - continuando")
+
 def create_rest_api(apigateway_client, lambda_client, lambda_arn):
     try:
         # 1. Verifica se a API já existe
         apis = apigateway_client.get_rest_apis()['items']
         api = next((api for api in apis if api['name'] == API_NAME), None)
-        
+
         if api:
             api_id = api['id']
             print(f"🔄 API '{API_NAME}' já existe (ID: {api_id})")
@@ -21,68 +101,20 @@ def create_rest_api(apigateway_client, lambda_client, lambda_arn):
             api_id = api['id']
             print(f"✅ API '{API_NAME}' criada (ID: {api_id})")
 
-        # 2. Configuração do recurso /invoice
+        # 2. Configuração das rotas de INVOICE_ROUTES
         resources = apigateway_client.get_resources(restApiId=api_id)['items']
-        root_id = next(res['id'] for res in resources if res['path'] == '/')
-        
-        resource = next(
-            (res for res in resources if res.get('path') == '/invoice'),
-            None
-        )
-        
-        if resource:
-            resource_id = resource['id']
-            print("🔄 Recurso /invoice já existe")
-        else:
-            resource = apigateway_client.create_resource(
-                restApiId=api_id,
-                parentId=root_id,
-                pathPart='invoice'
-            )
-            resource_id = resource['id']
-            print("✅ Recurso /invoice criado")
-
-        # 3. Configuração do método POST
-        try:
-            apigateway_client.put_method(
-                restApiId=api_id,
-                resourceId=resource_id,
-                httpMethod='POST',
-                authorizationType='NONE',
-                requestParameters={
-                    'method.request.header.Content-Type': True
-                }
-            )
-            print("✅ Método POST configurado")
-        except apigateway_client.exceptions.ConflictException:
-            print("🔄 Método POST já existe")
-
-        # 4. Configuração da integração como proxy
-        apigateway_client.put_integration(
-            restApiId=api_id,
-            resourceId=resource_id,
-            httpMethod='POST',
-            type='AWS_PROXY',
-            integrationHttpMethod='POST',
-            uri=f'arn:aws:apigateway:{REGION}:lambda:path/2015-03-31/functions/{lambda_arn}/invocations',
-            contentHandling='CONVERT_TO_BINARY'  # Converte o payload para binário
-        )
-        print("✅ Integração Lambda proxy configurada")
-
-        # 5. Configuração de permissões (com ID único)
-        try:
-            lambda_client.add_permission(
-                FunctionName=LAMBDA_NAMES['integracao'],
-                StatementId=f"apigateway-invoke-{int(time.time())}",
-                Action='lambda:InvokeFunction',
-                Principal='apigateway.amazonaws.com',
-                SourceArn=f"arn:aws:execute-api:{REGION}:{AWS_ACCOUNT_ID}:{api_id}/*/POST/invoice"
+        for path, http_method in INVOICE_ROUTES:
+            configure_lambda_route(
+                apigateway_client,
+                lambda_client,
+                api_id,
+                resources,
+                path,
+                http_method,
+                lambda_arn
             )
-            print("✅ Permissão Lambda configurada")
-        except lambda_client.exceptions.ResourceConflictException:
-            print("🔒 Permissão já existe - continuando")
 
-        # 6. Atualiza a configuração binária da API se ela já existia
+        # 3. Atualiza a configuração binária da API se ela já existia
         if api:
             apigateway_client.update_rest_api(
                 restApiId=api_id,
@@ -95,7 +127,7 @@ def create_rest_api(apigateway_client, lambda_client, lambda_arn):
             )
             print("✅ Configuração de mídia binária atualizada para aceitar */*")
 
-        # 7. Implantação
+        # 4. Implantação
         deployment = apigateway_client.create_deployment(
             restApiId=api_id,
             stageName='v1',
@@ -109,4 +141,4 @@ def create_rest_api(apigateway_client, lambda_client, lambda_arn):
 
     except Exception as e:
         print(f"❌ Erro fatal na API Gateway: {str(e)}")
-        raise
\ No newline at end of file
+        raise
@@ -2,6 +2,51 @@ import json
 from botocore.exceptions import ClientError
 from config.settings import AWS_ACCOUNT_ID
 
+# Role da Step Function (as das Lambdas vêm de LAMBDA_ROLES)
+STEPFUNCTIONS_ROLE_NAME = 'StepFunctionExecutionRole'
+
+# Roles das Lambdas e as políticas anexadas a cada uma
+LAMBDA_ROLES_CONFIG = {
+    'RoleDefault': {
+        'description': 'Role com acesso apenas ao CloudWatch',
+        'policies': ['arn:aws:iam::aws:policy/CloudWatchFullAccess']
+    },
+    'RoleS3': {
+        'description': 'Role com acesso ao CloudWatch e S3',
+        'policies': [
+            'arn:aws:iam::aws:policy/CloudWatchFullAccess',
+            'arn:aws:iam::aws:policy/AmazonS3FullAccess'
+        ]
+    },
+    'RoleStep': {
+        'description': 'Role com acesso ao CloudWatch, S3 e StepFunctions',
+        'policies': [
+            'arn:aws:iam::aws:policy/CloudWatchFullAccess',
+            'arn:aws:iam::aws:policy/AWSStepFunctionsFullAccess'
+        ]
+    },
+    'RoleS3Textract': {
+        'description': 'Role com acesso ao CloudWatch, S3 e Textract',
+        'policies': [
+            'arn:aws:iam::aws:policy/CloudWatchFullAccess',
+            'arn:aws:iam::aws:policy/AmazonS3FullAccess',
+            f'arn:aws:iam::{AWS_ACCOUNT_ID}:policy/TextractFullAccessPolicy'
+        ]
+    },
+    'RoleS3Step': {
+        'description': 'Role com acesso ao CloudWatch, S3 e StepFunctions',
+        'policies': [
+            'arn:aws:iam::aws:policy/CloudWatchFullAccess',
+            'arn:aws:iam::aws:policy/AmazonS3FullAccess',
+            'arn:aws:iam::aws:policy/AWSStepFunctionsFullAccess'
+        ]
+    },
+}
+
+def role_arn(role_name):
+    """ARN de uma role pelo nome, sem consultar o IAM (usado no plano do deploy)"""
+    return f"arn:aws:iam::{AWS_ACCOUNT_ID}:role/{role_name}"
+
 def create_custom_iam_policies(iam_client):
     """Cria políticas personalizadas além das políticas gerenciadas da AWS"""
     policies = {
@@ -28,43 +73,6 @@ def create_custom_iam_policies(iam_client):
 
 def create_lambda_roles(iam_client):
     """Cria as 4 roles específicas para as Lambdas"""
-    roles_config = {
-        'RoleDefault': {
-            'description': 'Role com acesso apenas ao CloudWatch',
-            'policies': ['arn:aws:iam::aws:policy/CloudWatchFullAccess']
-        },
-        'RoleS3': {
-            'description': 'Role com acesso ao CloudWatch e S3',
-            'policies': [
-                'arn:aws:iam::aws:policy/CloudWatchFullAccess',
-                'arn:aws:iam::aws:policy/AmazonS3FullAccess'
-            ]
-        },
-        'RoleStep': {
-            'description': 'Role com acesso ao CloudWatch, S3 e StepFunctions',
-            'policies': [
-                'arn:aws:iam::aws:policy/CloudWatchFullAccess',
-                'arn:aws:iam::aws:policy/AWSStepFunctionsFullAccess'
-            ]
-        },
-        'RoleS3Textract': {
-            'description': 'Role com acesso ao CloudWatch, S3 e Textract',
-            'policies': [
-                'arn:aws:iam::aws:policy/CloudWatchFullAccess',
-                'arn:aws:iam::aws:policy/AmazonS3FullAccess',
-                f'arn:aws:iam::{AWS_ACCOUNT_ID}:policy/TextractFullAccessPolicy'
-            ]
-        },
-        'RoleS3Step': {
-            'description': 'Role com acesso ao CloudWatch, S3 e StepFunctions',
-            'policies': [
-                'arn:aws:iam::aws:policy/CloudWatchFullAccess',
-                'arn:aws:iam::aws:policy/AmazonS3FullAccess',
-                'arn:aws:iam::aws:policy/AWSStepFunctionsFullAccess'
-            ]
-        },
-    }
-
     role_arns = {}
     trust_policy = {
         "Version": "2012-10-17",
@@ -78,7 +86,7 @@ def create_lambda_roles(iam_client):
     # Cria políticas personalizadas primeiro
     create_custom_iam_policies(iam_client)
 
-    for role_name, config in roles_config.items():
+    for role_name, config in LAMBDA_ROLES_CONFIG.items():
         try:
             response = iam_client.create_role(
                 RoleName=role_name,
@@ -120,7 +128,7 @@ def create_stepfunctions_execution_role(iam_client):
 
     try:
         response = iam_client.create_role(
-            RoleName='StepFunctionExecutionRole',
+            RoleName=STEPFUNCTIONS_ROLE_NAME,
             AssumeRolePolicyDocument=json.dumps(trust_policy),
             Description='Role para execução de Step Functions com acesso às Lambdas'
         )
@@ -128,13 +136,13 @@ def create_stepfunctions_execution_role(iam_client):
         print("✅ Role Step Functions criada")
     except iam_client.exceptions.EntityAlreadyExistsException:
         print("🔄 Role Step Functions já existe - continuando")
-        role = iam_client.get_role(RoleName='StepFunctionExecutionRole')
+        role = iam_client.get_role(RoleName=STEPFUNCTIONS_ROLE_NAME)
         role_arn = role['Role']['Arn']
 
     # Anexa política de acesso às Lambdas
     try:
         iam_client.attach_role_policy(
-            RoleName='StepFunctionExecutionRole',
+            RoleName=STEPFUNCTIONS_ROLE_NAME,
             PolicyArn='arn:aws:iam::aws:policy/AWSLambda_FullAccess'
         )
         print("✅ Política AWSLambda_FullAccess anexada à Role Step Functions")
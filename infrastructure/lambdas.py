@@ -1,65 +1,284 @@
+import io
 import os
+import base64
+import hashlib
 import zipfile
-import tempfile
-import time
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
-from config.settings import LAMBDA_NAMES, PYTHON_VERSION, LAMBDA_FILES, LAMBDA_ROLES
+from config.settings import (
+    LAMBDA_NAMES, PYTHON_VERSION, LAMBDA_FILES, LAMBDA_ROLES, LAMBDA_ENVIRONMENT,
+    LAMBDA_LAYERS, FUSED_STAGES, LAMBDA_TIMEOUTS, LAMBDA_RESERVED_CONCURRENCY, IMAGE_PREPROCESSING
+)
+from infrastructure.iam import LAMBDA_ROLES_CONFIG
+from infrastructure.orchestration import retry_on_iam_propagation
 
-def create_lambda_functions(lambda_client, lambda_roles):
-    lambda_arns = {}
-    
-    with tempfile.TemporaryDirectory() as temp_dir:
-        for lambda_type, filename in LAMBDA_FILES.items():
+# Ordem das etapas do pipeline de uma nota (estágios fundidos devem ser consecutivos)
+PIPELINE_STAGES = (['preprocessamento'] if IMAGE_PREPROCESSING else []) + ['textract', 'regex', 'llm', 'mover_imagem']
+
+# Lambdas de etapas opcionais desativadas no settings, que não são implantadas
+DISABLED_LAMBDAS = set() if IMAGE_PREPROCESSING else {'preprocessamento'}
+FUSED_HANDLER_FILE = 'estagio_fundido.py'
+
+# Data fixa das entradas do ZIP: o mesmo código gera o mesmo arquivo (e o mesmo CodeSha256)
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+def validate_fused_stages(fused_stages=FUSED_STAGES):
+    """Confere se cada grupo fundido é uma sequência consecutiva do pipeline, sem repetições"""
+    used = set()
+    for fused_type, stages in fused_stages.items():
+        start = PIPELINE_STAGES.index(stages[0]) if stages and stages[0] in PIPELINE_STAGES else -1
+        if len(stages) < 2 or start < 0 or PIPELINE_STAGES[start:start + len(stages)] != stages:
+            raise ValueError(f"Estágio fundido '{fused_type}' deve listar etapas consecutivas de {PIPELINE_STAGES}")
+        if used & set(stages):
+            raise ValueError(f"Etapa repetida em mais de um estágio fundido: {fused_type}")
+        used.update(stages)
+
+def fused_role(fused_type, stages):
+    """
+    Role de um estágio fundido: a de menos políticas entre as que cobrem as políticas
+    das roles de todas as etapas (ValueError se nenhuma role cobre todas)
+    """
+    required = {policy for stage in stages for policy in LAMBDA_ROLES_CONFIG[LAMBDA_ROLES[stage]]['policies']}
+    candidates = [
+        role_name for role_name, config in LAMBDA_ROLES_CONFIG.items()
+        if required <= set(config['policies'])
+    ]
+    if not candidates:
+        roles = ', '.join(sorted({LAMBDA_ROLES[stage] for stage in stages}))
+        raise ValueError(f"Nenhuma role cobre as etapas do estágio fundido '{fused_type}' ({roles})")
+    return min(candidates, key=lambda role_name: len(LAMBDA_ROLES_CONFIG[role_name]['policies']))
+
+def build_lambda_specs(fused_stages=FUSED_STAGES):
+    """
+    Monta a especificação de cada Lambda a implantar: as Lambdas de LAMBDA_FILES cujas
+    etapas não estão fundidas e uma Lambda por estágio fundido
+
+    Returns:
+        Dicionário tipo da Lambda -> {name, files, handler, role, layers, environment,
+        timeout, reserved_concurrency}
+    """
+    validate_fused_stages(fused_stages)
+    fused = {stage for stages in fused_stages.values() for stage in stages}
+
+    specs = {
+        lambda_type: {
+            'name': LAMBDA_NAMES[lambda_type],
+            'files': [filename],
+            'handler': f"{filename.replace('.py', '')}.lambda_handler",
+            'role': LAMBDA_ROLES[lambda_type],
+            'layers': LAMBDA_LAYERS.get(lambda_type, []),
+            'environment': LAMBDA_ENVIRONMENT.get(lambda_type, {}),
+            'timeout': LAMBDA_TIMEOUTS.get(lambda_type, 30),
+            'reserved_concurrency': LAMBDA_RESERVED_CONCURRENCY.get(lambda_type),
+        }
+        for lambda_type, filename in LAMBDA_FILES.items()
+        if lambda_type not in fused and lambda_type not in DISABLED_LAMBDAS
+    }
+
+    for fused_type, stages in fused_stages.items():
+        environment = {}
+        layers = []
+        for stage in stages:
+            environment.update(LAMBDA_ENVIRONMENT.get(stage, {}))
+            layers += [layer for layer in LAMBDA_LAYERS.get(stage, []) if layer not in layers]
+        environment['ESTAGIOS_FUNDIDOS'] = ','.join(LAMBDA_FILES[stage].replace('.py', '') for stage in stages)
+
+        specs[fused_type] = {
+            'name': f"estagio-{fused_type.replace('_', '-')}",
+            'files': [LAMBDA_FILES[stage] for stage in stages] + [FUSED_HANDLER_FILE],
+            'handler': f"{FUSED_HANDLER_FILE.replace('.py', '')}.lambda_handler",
+            'role': fused_role(fused_type, stages),
+            'layers': layers,
+            'environment': environment,
+            'timeout': max(LAMBDA_TIMEOUTS.get(stage, 30) for stage in stages),
+            'reserved_concurrency': LAMBDA_RESERVED_CONCURRENCY.get(fused_type),
+        }
+
+    return specs
+
+def build_lambda_zip(spec):
+    """
+    Monta em memória o ZIP com os arquivos da Lambda (vários no caso de estágios fundidos)
+
+    O ZIP é determinístico (ordem, data e permissões fixas): o mesmo código gera o mesmo
+    CodeSha256, comparado com o da função implantada para pular uploads sem alteração.
+    """
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for filename in sorted(spec['files']):
             # Caminho absoluto do arquivo
             source_path = os.path.join(os.path.dirname(__file__), '..', 'lambda_functions', filename)
             source_path = os.path.normpath(source_path)
-            
+
             if not os.path.exists(source_path):
                 raise FileNotFoundError(f"Arquivo Lambda não encontrado: {source_path}")
+            info = zipfile.ZipInfo(os.path.basename(source_path), ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            with open(source_path, 'rb') as f:
+                zipf.writestr(info, f.read())
+    return buffer.getvalue()
+
+def code_sha256(content):
+    """SHA-256 em Base64, no formato do CodeSha256 da Lambda"""
+    return base64.b64encode(hashlib.sha256(content).digest()).decode()
+
+def resolve_layer_arns(spec, layer_arns):
+    """ARNs dos layers da Lambda (None mantém os layers já anexados)"""
+    if layer_arns is None:
+        return None
+    missing = [layer for layer in spec['layers'] if layer not in layer_arns]
+    if missing:
+        print(f"⚠️ Layers não encontrados para {spec['name']}: {', '.join(missing)}")
+    return [layer_arns[layer] for layer in spec['layers'] if layer in layer_arns]
+
+def build_configuration(spec, role_arn, layer_arns=None):
+    """Parâmetros de configuração da Lambda (comuns à criação e à atualização)"""
+    configuration = {
+        'FunctionName': spec['name'],
+        'Role': role_arn,
+        'Handler': spec['handler'],
+        'Timeout': spec['timeout'],
+        # Variáveis de ambiente configuradas para esta Lambda
+        'Environment': {'Variables': spec['environment']},
+    }
+    layers = resolve_layer_arns(spec, layer_arns)
+    if layers is not None:
+        configuration['Layers'] = layers
+    return configuration
+
+def get_deployed_function(lambda_client, function_name):
+    """Configuração e concorrência da função implantada (None se ainda não existe)"""
+    try:
+        return lambda_client.get_function(FunctionName=function_name)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ResourceNotFoundException':
+            return None
+        raise
+
+def plan_lambda_function(lambda_client, spec, role_arn, layer_arns=None):
+    """
+    Compara a Lambda local com a implantada
+
+    Returns:
+        Dicionário com action ('create', 'update' ou 'unchanged'), zip_content,
+        configuration, code_changed, config_changes (campos alterados),
+        concurrency_changed e function_arn (da função implantada)
+    """
+    zip_content = build_lambda_zip(spec)
+    configuration = build_configuration(spec, role_arn, layer_arns)
+    plan = {
+        'zip_content': zip_content,
+        'configuration': configuration,
+        'code_changed': True,
+        'config_changes': [],
+        'concurrency_changed': spec['reserved_concurrency'] is not None,
+        'function_arn': None,
+    }
+
+    deployed = get_deployed_function(lambda_client, spec['name'])
+    if deployed is None:
+        return {**plan, 'action': 'create'}
+
+    current = deployed['Configuration']
+    current_values = {
+        'Role': current['Role'],
+        'Handler': current['Handler'],
+        'Timeout': current['Timeout'],
+        'Environment': {'Variables': current.get('Environment', {}).get('Variables', {})},
+        'Layers': [layer['Arn'] for layer in current.get('Layers', [])],
+    }
+    plan['function_arn'] = current['FunctionArn']
+    plan['code_changed'] = current['CodeSha256'] != code_sha256(zip_content)
+    plan['config_changes'] = [
+        key for key, value in configuration.items()
+        if key != 'FunctionName' and current_values[key] != value
+    ]
+    reserved = deployed.get('Concurrency', {}).get('ReservedConcurrentExecutions')
+    plan['concurrency_changed'] = spec['reserved_concurrency'] is not None and reserved != spec['reserved_concurrency']
+
+    changed = plan['code_changed'] or plan['config_changes'] or plan['concurrency_changed']
+    return {**plan, 'action': 'update' if changed else 'unchanged'}
+
+def describe_plan(plan):
+    """Resumo de uma linha do plano de uma Lambda"""
+    if plan['action'] != 'update':
+        return {'create': 'criar', 'unchanged': 'sem alterações'}[plan['action']]
+    changes = (['código'] if plan['code_changed'] else []) + plan['config_changes']
+    if plan['concurrency_changed']:
+        changes.append('concorrência')
+    return f"atualizar ({', '.join(changes)})"
+
+def deploy_lambda_function(lambda_client, spec, lambda_roles, layer_arns=None):
+    """
+    Cria ou atualiza uma Lambda (código, configuração, layers e concorrência reservada)
+
+    Só envia o que mudou: o código quando o CodeSha256 do ZIP determinístico difere do
+    implantado e a configuração quando algum campo difere. As atualizações aguardam o
+    LastUpdateStatus (waiter function_updated_v2) em vez de uma pausa fixa, e a criação
+    repete enquanto a role recém-criada não propagou.
+
+    Returns:
+        ARN da função
+    """
+    function_name = spec['name']
+
+    # Obtém a ARN da role correta para esta Lambda
+    role_name = spec['role']
+    plan = plan_lambda_function(lambda_client, spec, lambda_roles[role_name], layer_arns)
+    configuration = plan['configuration']
+
+    if plan['action'] == 'create':
+        response = retry_on_iam_propagation(
+            lambda: lambda_client.create_function(
+                Runtime=PYTHON_VERSION,
+                Code={'ZipFile': plan['zip_content']},
+                **configuration
+            ),
+            function_name
+        )
+        function_arn = response['FunctionArn']
+        lambda_client.get_waiter('function_active_v2').wait(FunctionName=function_name)
+        print(f"✅ Lambda {function_name} criada com sucesso (Role: {role_name}).")
+
+    elif plan['action'] == 'unchanged':
+        print(f"✅ Lambda {function_name} sem alterações.")
+        return plan['function_arn']
+
+    else:
+        print(f"🔄 Lambda {function_name}: {describe_plan(plan)}...")
+        function_arn = plan['function_arn']
+        updated_waiter = lambda_client.get_waiter('function_updated_v2')
+        if plan['code_changed']:
+            lambda_client.update_function_code(
+                FunctionName=function_name,
+                ZipFile=plan['zip_content']
+            )
+            # A configuração só pode ser alterada depois que a atualização do código termina
+            updated_waiter.wait(FunctionName=function_name)
+        if plan['config_changes']:
+            retry_on_iam_propagation(
+                lambda: lambda_client.update_function_configuration(**configuration),
+                function_name
+            )
+            updated_waiter.wait(FunctionName=function_name)
+
+    # Limita as execuções simultâneas da Lambda, quando configurado
+    if plan['concurrency_changed']:
+        lambda_client.put_function_concurrency(
+            FunctionName=function_name,
+            ReservedConcurrentExecutions=spec['reserved_concurrency']
+        )
+        print(f"✅ Concorrência reservada de {function_name}: {spec['reserved_concurrency']}")
+
+    return function_arn
 
-            # Cria o ZIP
-            zip_path = os.path.join(temp_dir, f'{lambda_type}.zip')
-            with zipfile.ZipFile(zip_path, 'w') as zipf:
-                zipf.write(source_path, os.path.basename(source_path))
-            
-            # Lê o conteúdo do ZIP
-            with open(zip_path, 'rb') as f:
-                zip_content = f.read()
-            
-            # Obtém a ARN da role correta para esta Lambda
-            role_name = LAMBDA_ROLES[lambda_type]
-            role_arn = lambda_roles[role_name]
-            
-            try:
-                response = lambda_client.create_function(
-                    FunctionName=LAMBDA_NAMES[lambda_type],
-                    Runtime=PYTHON_VERSION,
-                    Role=role_arn,
-                    Handler=f"{filename.replace('.py', '')}.lambda_handler",
-                    Code={'ZipFile': zip_content},
-                    Timeout=30
-                )
-                lambda_arns[lambda_type] = response['FunctionArn']
-                print(f"✅ Lambda {LAMBDA_NAMES[lambda_type]} criada com sucesso (Role: {role_name}).")
-                
-            except ClientError as e:
-                if e.response['Error']['Code'] == 'ResourceConflictException':
-                    print(f"🔄 Lambda {LAMBDA_NAMES[lambda_type]} já existe. Atualizando...")
-                    lambda_client.update_function_code(
-                        FunctionName=LAMBDA_NAMES[lambda_type],
-                        ZipFile=zip_content
-                    )
-                    # Atualiza também a role se necessário apos alguns 2 segundos de propagação
-                    time.sleep(2)
-                    lambda_client.update_function_configuration(
-                        FunctionName=LAMBDA_NAMES[lambda_type],
-                        Role=role_arn
-                    )
-                    lambda_info = lambda_client.get_function(FunctionName=LAMBDA_NAMES[lambda_type])
-                    lambda_arns[lambda_type] = lambda_info['Configuration']['FunctionArn']
-                    
-                else:
-                    print(f"❌ Erro na Lambda {LAMBDA_NAMES[lambda_type]}: {e}")
-                    raise
-    
-    return lambda_arns
\ No newline at end of file
+def create_lambda_functions(lambda_client, lambda_roles, layer_arns=None, max_workers=8):
+    """Cria ou atualiza todas as Lambdas em paralelo; retorna tipo da Lambda -> ARN"""
+    specs = build_lambda_specs()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            lambda_type: executor.submit(deploy_lambda_function, lambda_client, spec, lambda_roles, layer_arns)
+            for lambda_type, spec in specs.items()
+        }
+    return {lambda_type: future.result() for lambda_type, future in futures.items()}
@@ -1,122 +1,107 @@
 # infrastructure/layers.py
 import os
-import time
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
 from config.settings import PYTHON_VERSION, LAYERS_CONFIG  # Importando do settings
+from infrastructure.lambdas import code_sha256, build_lambda_specs
 
-def create_layer(lambda_client, layer_name, config):
-    """Cria ou atualiza um Lambda Layer"""
-    # Primeiro verifica se o layer já existe
+def layer_zip_path(config):
+    zip_path = os.path.join(os.path.dirname(__file__), '..', 'layers', config['zip_file'])
+    return os.path.normpath(zip_path)
+
+def get_latest_layer_version(lambda_client, layer_name):
+    """Versão mais recente do layer, com o CodeSha256 do conteúdo (None se não existe)"""
     try:
-        # Lista todas as versões do layer (ordena decrescente por versão)
+        # Lista as versões do layer (ordena decrescente por versão)
         response = lambda_client.list_layer_versions(
             LayerName=layer_name,
             MaxItems=1  # Pega apenas a versão mais recente
         )
-        
-        # Se encontrou versões existentes, retorna a ARN da mais recente
-        if response.get('LayerVersions'):
-            latest_version = response['LayerVersions'][0]
-            print(f"ℹ️ Layer {layer_name} já existe (versão {latest_version['Version']}) - usando versão existente")
-            return latest_version['LayerVersionArn']
-            
     except ClientError as e:
-        # Se o erro for que o layer não existe, continuamos para criá-lo
-        if e.response['Error']['Code'] != 'ResourceNotFoundException':
-            print(f"❌ Erro ao verificar layer existente {layer_name}: {e}")
-            raise
+        if e.response['Error']['Code'] == 'ResourceNotFoundException':
+            return None
+        print(f"❌ Erro ao verificar layer existente {layer_name}: {e}")
+        raise
+
+    if not response.get('LayerVersions'):
+        return None
+    latest_version = response['LayerVersions'][0]
+    return lambda_client.get_layer_version(
+        LayerName=layer_name,
+        VersionNumber=latest_version['Version']
+    )
+
+def plan_layer(lambda_client, layer_name, config):
+    """
+    Compara o ZIP local do layer com a versão mais recente publicada
+
+    Returns:
+        Dicionário com action ('publish' ou 'unchanged'), reason, zip_content e
+        layer_arn (da versão publicada, quando existe)
+    """
+    latest = get_latest_layer_version(lambda_client, layer_name)
+    zip_path = layer_zip_path(config)
 
-    # Se chegou aqui, o layer não existe ou ocorreu um erro que podemos ignorar
-    zip_path = os.path.join(os.path.dirname(__file__), '..', 'layers', config['zip_file'])
-    zip_path = os.path.normpath(zip_path)
-    
     if not os.path.exists(zip_path):
+        if latest:
+            # Sem o ZIP local, mantém a versão publicada
+            return {'action': 'unchanged', 'reason': 'ZIP local ausente', 'zip_content': None,
+                    'layer_arn': latest['LayerVersionArn']}
         raise FileNotFoundError(f"Arquivo ZIP do layer não encontrado: {zip_path}")
 
     with open(zip_path, 'rb') as f:
         zip_content = f.read()
 
+    plan = {'zip_content': zip_content, 'layer_arn': latest['LayerVersionArn'] if latest else None}
+    if latest is None:
+        return {**plan, 'action': 'publish', 'reason': 'novo'}
+    if latest['Content']['CodeSha256'] != code_sha256(zip_content):
+        return {**plan, 'action': 'publish', 'reason': 'conteúdo alterado'}
+    if sorted(latest.get('CompatibleRuntimes', [])) != sorted(config['compatible_runtimes']):
+        return {**plan, 'action': 'publish', 'reason': 'runtimes alterados'}
+    return {**plan, 'action': 'unchanged', 'reason': f"versão {latest['Version']}"}
+
+def create_layer(lambda_client, layer_name, config):
+    """Publica uma nova versão do layer apenas quando o ZIP local mudou"""
+    plan = plan_layer(lambda_client, layer_name, config)
+
+    if plan['action'] == 'unchanged':
+        print(f"ℹ️ Layer {layer_name} sem alterações ({plan['reason']}) - usando versão existente")
+        return plan['layer_arn']
+
     try:
         response = lambda_client.publish_layer_version(
             LayerName=layer_name,
             Description=config['description'],
-            Content={'ZipFile': zip_content},
+            Content={'ZipFile': plan['zip_content']},
             CompatibleRuntimes=config['compatible_runtimes'],
             LicenseInfo=config['license_info']
         )
         layer_arn = response['LayerVersionArn']
-        print(f"✅ Layer {layer_name} criado com sucesso. ARN: {layer_arn}")
+        print(f"✅ Layer {layer_name} publicado ({plan['reason']}). ARN: {layer_arn}")
         return layer_arn
         
     except ClientError as e:
         print(f"❌ Erro ao criar layer {layer_name}: {e}")
         raise
 
-def create_layers(lambda_client):
-    """Cria todos os layers configurados e retorna seus ARNs"""
+def required_layers():
+    """Layers de LAYERS_CONFIG anexados a alguma das Lambdas implantadas"""
+    used = {layer for spec in build_lambda_specs().values() for layer in spec['layers']}
+    return {layer_name: config for layer_name, config in LAYERS_CONFIG.items() if layer_name in used}
+
+def create_layers(lambda_client, max_workers=4):
+    """Cria os layers usados pelas Lambdas, em paralelo, e retorna seus ARNs"""
     layer_arns = {}
-    
-    for layer_name, config in LAYERS_CONFIG.items():  # Usando LAYERS_CONFIG do settings
+
+    def process(layer_name, config):
         try:
-            layer_arn = create_layer(lambda_client, layer_name, config)
-            layer_arns[layer_name] = layer_arn
-            # Pequena pausa para evitar throttling
-            time.sleep(1)
-            
+            layer_arns[layer_name] = create_layer(lambda_client, layer_name, config)
         except Exception as e:
             print(f"⚠️ Falha ao processar layer {layer_name}: {e}")
-            continue
-    
-    return layer_arns
 
-def attach_layers_to_functions(lambda_client, lambda_config, layer_arns):
-    """
-    Anexa os layers específicos a cada função Lambda conforme configuração
-    
-    Args:
-        lambda_client: Cliente boto3 para Lambda
-        lambda_config: Dicionário com:
-            - 'LAMBDA_NAMES': Mapeamento de tipos para nomes de funções
-            - 'LAMBDA_LAYERS': Mapeamento de tipos para lists de layers requeridos
-        layer_arns: Dicionário de ARNs dos layers criados
-    """
-    for lambda_type, function_name in lambda_config['LAMBDA_NAMES'].items():
-        # Obtém lista de layers necessários para esta função
-        layers_needed = lambda_config['LAMBDA_LAYERS'].get(lambda_type, [])
-        
-        if not layers_needed:
-            print(f"ℹ️ Lambda {function_name} não requer layers - pulando")
-            continue
-        
-        # Filtra apenas layers que existem
-        layer_arns_to_attach = [
-            layer_arns[layer_name] 
-            for layer_name in layers_needed 
-            if layer_name in layer_arns
-        ]
-        
-        if not layer_arns_to_attach:
-            print(f"⚠️ Nenhum layer válido encontrado para {function_name}")
-            continue
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for layer_name, config in required_layers().items():
+            executor.submit(process, layer_name, config)
 
-        try:
-            lambda_client.update_function_configuration(
-                FunctionName=function_name,
-                Layers=layer_arns_to_attach
-            )
-            print(f"✅ Layers anexados à {function_name}: {', '.join(layers_needed)}")
-            
-            # Pequena pausa entre atualizações
-            time.sleep(0.5)
-            
-        except ClientError as e:
-            error_code = e.response.get('Error', {}).get('Code', '')
-            if error_code == 'ResourceConflictException':
-                print(f"🔄 Tentando novamente para {function_name} após conflito...")
-                time.sleep(2)
-                lambda_client.update_function_configuration(
-                    FunctionName=function_name,
-                    Layers=layer_arns_to_attach
-                )
-            else:
-                print(f"❌ Erro ao anexar layers à {function_name}: {e}")
\ No newline at end of file
+    return layer_arns
@@ -0,0 +1,90 @@
+# infrastructure/orchestration.py
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from botocore.exceptions import ClientError
+
+# Erros devolvidos enquanto uma role recém-criada ainda não propagou no IAM
+IAM_PROPAGATION_ERRORS = {
+    'InvalidParameterValueException': 'cannot be assumed',  # Lambda
+    'AccessDeniedException': 'assume',                      # Step Functions
+}
+
+def retry_on_iam_propagation(action, description, timeout=60, interval=2):
+    """
+    Executa a ação repetindo-a enquanto o erro indicar role ainda não propagada
+
+    Substitui a espera fixa após criar as roles: quando as roles já existem, a primeira
+    tentativa passa direto.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return action()
+        except ClientError as e:
+            error = e.response['Error']
+            fragment = IAM_PROPAGATION_ERRORS.get(error['Code'])
+            propagating = fragment is not None and fragment in error.get('Message', '')
+            if not propagating or time.monotonic() >= deadline:
+                raise
+            print(f"⏱️ Aguardando propagação da role IAM para {description}...")
+            time.sleep(interval)
+
+def run_steps(steps, max_workers=8):
+    """
+    Executa as etapas do deploy respeitando as dependências, em paralelo quando possível
+
+    Args:
+        steps: Dicionário nome -> (lista de dependências, função). A função recebe o
+            dicionário com os resultados das etapas já concluídas
+        max_workers: Número máximo de etapas simultâneas
+
+    Returns:
+        Tupla (resultados por etapa, duração em segundos por etapa)
+    """
+    unknown = {dep for deps, _ in steps.values() for dep in deps} - set(steps)
+    if unknown:
+        raise ValueError(f"Dependências inexistentes: {sorted(unknown)}")
+
+    results = {}
+    timings = {}
+    pending = dict(steps)
+    running = {}
+
+    def timed(name, function):
+        started = time.perf_counter()
+        try:
+            return function(results)
+        finally:
+            timings[name] = time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            ready = [name for name, (deps, _) in pending.items() if all(dep in results for dep in deps)]
+            for name in ready:
+                _, function = pending.pop(name)
+                running[executor.submit(timed, name, function)] = name
+
+            if not running:
+                raise ValueError(f"Dependências circulares entre as etapas: {sorted(pending)}")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                except Exception:
+                    # Não inicia novas etapas; as que já estão em execução terminam antes de propagar
+                    pending.clear()
+                    wait(running)
+                    raise
+
+    return results, timings
+
+def print_timings(timings, total):
+    """Exibe a duração de cada etapa, da mais lenta para a mais rápida"""
+    print("--------------------------------------------------------")
+    print(f"{'Etapa':<28} {'Tempo (s)':>10}")
+    for name, seconds in sorted(timings.items(), key=lambda item: item[1], reverse=True):
+        print(f"{name:<28} {seconds:>10.1f}")
+    print(f"{'Total (paralelo)':<28} {total:>10.1f}")
+    print("--------------------------------------------------------")
@@ -1,5 +1,6 @@
 from botocore.exceptions import ClientError
-from config.settings import BUCKET_NAME, REGION
+import time
+from config.settings import BUCKET_NAME, REGION, CACHE_TTL_DAYS, DERIVED_TTL_DAYS, AWS_ACCOUNT_ID, INGESTION_PREFIX, INGESTION_EXTENSIONS
 
 def create_s3_bucket(s3_client, BUCKET_NAME, REGION):
     try:
@@ -22,9 +23,82 @@ def create_s3_bucket(s3_client, BUCKET_NAME, REGION):
 
     # Cria as pastas independentemente se o bucket é novo ou existente
     try:
-        s3_client.put_object(Bucket=BUCKET_NAME, Key='dinheiro/')
-        s3_client.put_object(Bucket=BUCKET_NAME, Key='outros/')
-        print("✅ Pastas 'dinheiro' e 'outros' criadas/verificadas")
+        s3_client.put_object(Bucket=BUCKET_NAME, Key='resultados/')
+        s3_client.put_object(Bucket=BUCKET_NAME, Key='classificacao/dinheiro/')
+        s3_client.put_object(Bucket=BUCKET_NAME, Key='classificacao/outros/')
+        s3_client.put_object(Bucket=BUCKET_NAME, Key=INGESTION_PREFIX)
+        print(f"✅ Pastas 'resultados', 'classificacao' e '{INGESTION_PREFIX}' criadas/verificadas")
     except ClientError as e:
         print(f"❌ Erro ao criar pastas: {e}")
-        raise
\ No newline at end of file
+        raise
+
+    # Expira automaticamente as entradas de cache (resultados do Textract e da LLM) e as
+    # imagens derivadas do pré-processamento, usadas apenas pelo Textract
+    try:
+        s3_client.put_bucket_lifecycle_configuration(
+            Bucket=BUCKET_NAME,
+            LifecycleConfiguration={
+                'Rules': [
+                    {
+                        'ID': 'expirar-cache',
+                        'Filter': {'Prefix': 'cache/'},
+                        'Status': 'Enabled',
+                        'Expiration': {'Days': CACHE_TTL_DAYS}
+                    },
+                    {
+                        'ID': 'expirar-derivados',
+                        'Filter': {'Prefix': 'derivados/'},
+                        'Status': 'Enabled',
+                        'Expiration': {'Days': DERIVED_TTL_DAYS}
+                    },
+                ]
+            }
+        )
+        print(f"✅ Expiração dos prefixos 'cache/' ({CACHE_TTL_DAYS} dias) e 'derivados/' ({DERIVED_TTL_DAYS} dias) configurada")
+    except ClientError as e:
+        print(f"❌ Erro ao configurar o ciclo de vida do bucket: {e}")
+        raise
+
+def configure_ingestion_notifications(s3_client, lambda_client, bucket_name, lambda_arn):
+    """
+    Dispara a Lambda de ingestão para cada objeto criado sob INGESTION_PREFIX
+
+    Substitui a configuração de notificações do bucket por uma regra por extensão
+    aceita (o filtro do S3 aceita um único sufixo por regra).
+    """
+    # Permite que o S3 invoque a Lambda
+    try:
+        lambda_client.add_permission(
+            FunctionName=lambda_arn,
+            StatementId=f"s3-ingestao-{int(time.time() * 1000)}",
+            Action='lambda:InvokeFunction',
+            Principal='s3.amazonaws.com',
+            SourceArn=f"arn:aws:s3:::{bucket_name}",
+            SourceAccount=AWS_ACCOUNT_ID
+        )
+        print("✅ Permissão de invocação pelo S3 configurada")
+    except lambda_client.exceptions.ResourceConflictException:
+        print("🔒 Permissão já existe - continuando")
+
+    try:
+        s3_client.put_bucket_notification_configuration(
+            Bucket=bucket_name,
+            NotificationConfiguration={
+                'LambdaFunctionConfigurations': [
+                    {
+                        'Id': f"ingestao{extension.replace('.', '-')}",
+                        'LambdaFunctionArn': lambda_arn,
+                        'Events': ['s3:ObjectCreated:*'],
+                        'Filter': {'Key': {'FilterRules': [
+                            {'Name': 'prefix', 'Value': INGESTION_PREFIX},
+                            {'Name': 'suffix', 'Value': extension},
+                        ]}}
+                    }
+                    for extension in INGESTION_EXTENSIONS
+                ]
+            }
+        )
+        print(f"✅ Notificações de '{INGESTION_PREFIX}' configuradas para a Lambda de ingestão")
+    except ClientError as e:
+        print(f"❌ Erro ao configurar as notificações do bucket: {e}")
+        raise
@@ -1,58 +1,241 @@
 import json
 from botocore.exceptions import ClientError
-from config.settings import STEP_FUNCTION_NAME, REGION, AWS_ACCOUNT_ID
+from config.settings import (
+    STEP_FUNCTION_NAME, REGION, AWS_ACCOUNT_ID, BATCH_MAX_CONCURRENCY, TEXTRACT_POLL_SECONDS, FUSED_STAGES
+)
+from infrastructure.lambdas import PIPELINE_STAGES, validate_fused_stages
+from infrastructure.orchestration import retry_on_iam_propagation
 
-def create_step_function(stepfunctions_client, stepfunctions_role_arn, lambda_arns):
-    definition = {
-        "Comment": "Step Function para processamento de notas fiscais",
-        "StartAt": "Textract",
-        "States": {
-            "Textract": {
-                "Type": "Task",
-                "Resource": lambda_arns['textract'],
-                "Next": "REGEX"
-            },
-            "REGEX": {
-                "Type": "Task",
-                "Resource": lambda_arns['regex'],
-                "Next": "LLM"
-            },
-            "LLM": {
-                "Type": "Task",
-                "Resource": lambda_arns['llm'],
-                "Next": "MoverIMG"
+# Nome do estado de cada etapa do pipeline (estágios fundidos juntam os nomes com "_")
+STAGE_STATE_NAMES = {
+    'preprocessamento': 'PreProcessamento',
+    'textract': 'Textract',
+    'regex': 'REGEX',
+    'llm': 'LLM',
+    'mover_imagem': 'MoverIMG',
+}
+
+def build_pipeline_groups(fused_stages=FUSED_STAGES):
+    """Agrupa as etapas do pipeline em Tasks: (tipo da Lambda, etapas executadas por ela)"""
+    validate_fused_stages(fused_stages)
+    groups = []
+    for stage in PIPELINE_STAGES:
+        lambda_type = next((fused for fused, stages in fused_stages.items() if stage in stages), stage)
+        if groups and groups[-1][0] == lambda_type:
+            groups[-1][1].append(stage)
+        else:
+            groups.append((lambda_type, [stage]))
+    return groups
+
+def build_pipeline_states(lambda_arns, prefix='', catch_state=None, fused_stages=FUSED_STAGES):
+    """
+    Monta os estados do pipeline de uma nota ([PreProcessamento ->] Textract -> REGEX ->
+    LLM -> MoverIMG)
+
+    Documentos processados pelo job assíncrono do Textract passam por um laço de
+    espera (Wait) e nova consulta até o job terminar. Notas que a etapa de regex já
+    resolveu por completo (com result_json) seguem direto para a Task que contém
+    MoverIMG; quando ela é a própria Task seguinte (ex.: LLM fundida a MoverIMG), a nota
+    segue para ela e a etapa da LLM a repassa sem chamar o modelo. Etapas fundidas
+    (FUSED_STAGES) viram uma única Task.
+
+    Args:
+        lambda_arns: Dicionário de ARNs das Lambdas
+        prefix: Prefixo dos nomes dos estados (nomes devem ser únicos na state machine)
+        catch_state: Estado para onde desviar em caso de erro (None propaga o erro)
+        fused_stages: Estágios fundidos (padrão: FUSED_STAGES do settings)
+
+    Returns:
+        Tupla (nome do estado inicial, dicionário de estados)
+    """
+    def name(state_name):
+        return f"{prefix}{state_name}"
+
+    def task(lambda_type, next_state=None):
+        state = {
+            "Type": "Task",
+            "Resource": lambda_arns[lambda_type],
+        }
+        if next_state:
+            state["Next"] = name(next_state)
+        else:
+            state["End"] = True
+
+        if catch_state:
+            state["Catch"] = [{
+                "ErrorEquals": ["States.ALL"],
+                "ResultPath": "$.erro",
+                "Next": catch_state
+            }]
+        return state
+
+    groups = build_pipeline_groups(fused_stages)
+    task_names = ["_".join(STAGE_STATE_NAMES[stage] for stage in stages) for _, stages in groups]
+    mover_task = next(task_names[index] for index, (_, stages) in enumerate(groups) if 'mover_imagem' in stages)
+
+    states = {}
+    for index, (lambda_type, stages) in enumerate(groups):
+        task_name = task_names[index]
+        next_task = task_names[index + 1] if index + 1 < len(groups) else None
+
+        # Escolhas feitas depois da Task, na ordem em que são avaliadas
+        choices = []
+        if 'textract' in stages:
+            choices.append(("TextractConcluido", {
+                "Type": "Choice",
+                "Choices": [{
+                    "And": [
+                        {"Variable": "$.textract_status", "IsPresent": True},
+                        {"Variable": "$.textract_status", "StringEquals": "IN_PROGRESS"}
+                    ],
+                    "Next": name("AguardarTextract")
+                }],
+            }))
+            states[name("AguardarTextract")] = {
+                "Type": "Wait",
+                "Seconds": TEXTRACT_POLL_SECONDS,
+                "Next": name(task_name)
+            }
+        if stages[-1] == 'regex' and next_task and next_task != mover_task:
+            choices.append(("RegexCompleto", {
+                "Type": "Choice",
+                "Choices": [{
+                    "Variable": "$.result_json",
+                    "IsPresent": True,
+                    "Next": name(mover_task)
+                }],
+            }))
+
+        # Encadeia Task -> escolhas -> próxima Task; depois da última Task, as escolhas
+        # terminam em um estado Succeed
+        follow = next_task
+        if choices and follow is None:
+            follow = "Concluido"
+            states[name(follow)] = {"Type": "Succeed"}
+        for choice_name, choice in reversed(choices):
+            choice["Default"] = name(follow)
+            states[name(choice_name)] = choice
+            follow = choice_name
+        states[name(task_name)] = task(lambda_type, follow)
+
+    return name(task_names[0]), states
+
+def build_definition(lambda_arns, fused_stages=FUSED_STAGES):
+    """Monta a definição da Step Function (nota única ou lote via Map)"""
+    start_state, states = build_pipeline_states(lambda_arns, fused_stages=fused_stages)
+
+    # Pipeline aplicado a cada arquivo do lote; falhas viram um resultado com erro
+    batch_start_state, batch_states = build_pipeline_states(
+        lambda_arns,
+        prefix='Lote',
+        catch_state='LoteFalha',
+        fused_stages=fused_stages
+    )
+    batch_states['LoteFalha'] = {
+        "Type": "Pass",
+        "Parameters": {
+            "file_name.$": "$.file_name",
+            "error.$": "$.erro.Error",
+            "cause.$": "$.erro.Cause"
+        },
+        "End": True
+    }
+
+    states.update({
+        "TipoEntrada": {
+            "Type": "Choice",
+            "Choices": [{
+                "Variable": "$.files",
+                "IsPresent": True,
+                "Next": "ProcessarLote"
+            }],
+            "Default": start_state
+        },
+        "ProcessarLote": {
+            "Type": "Map",
+            "ItemsPath": "$.files",
+            "ItemSelector": {
+                "file_name.$": "$$.Map.Item.Value",
+                "bucket_name.$": "$.bucket_name"
             },
-            "MoverIMG": {
-                "Type": "Task",
-                "Resource": lambda_arns['mover_imagem'],
-                "End": True
+            "MaxConcurrency": BATCH_MAX_CONCURRENCY,
+            "ItemProcessor": {
+                "ProcessorConfig": {"Mode": "INLINE"},
+                "StartAt": batch_start_state,
+                "States": batch_states
             },
-        }
+            "End": True
+        },
+    })
+
+    return {
+        "Comment": "Step Function para processamento de notas fiscais",
+        "StartAt": "TipoEntrada",
+        "States": states
     }
 
+def state_machine_arn(name):
+    return f"arn:aws:states:{REGION}:{AWS_ACCOUNT_ID}:stateMachine:{name}"
+
+def state_machine_changed(stepfunctions_client, arn, definition, stepfunctions_role_arn):
+    """
+    Indica se a definição ou a role da state machine implantada diferem das locais
+
+    Returns:
+        True/False, ou None se a state machine não existe
+    """
+    try:
+        current = stepfunctions_client.describe_state_machine(stateMachineArn=arn)
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'StateMachineDoesNotExist':
+            return None
+        raise
+    return json.loads(current['definition']) != definition or current['roleArn'] != stepfunctions_role_arn
+
+def create_step_function(stepfunctions_client, stepfunctions_role_arn, lambda_arns,
+                         name=STEP_FUNCTION_NAME, workflow_type='STANDARD'):
+    """
+    Cria (ou atualiza) a state machine do pipeline
+
+    Args:
+        name: Nome da state machine
+        workflow_type: 'STANDARD' (execuções longas e consultáveis, usada no modo
+            assíncrono e em lotes) ou 'EXPRESS' (start_sync_execution, modo síncrono)
+    """
+    definition = build_definition(lambda_arns)
+
     try:
         # Tenta criar nova Step Function
-        response = stepfunctions_client.create_state_machine(
-            name=STEP_FUNCTION_NAME,
-            definition=json.dumps(definition),
-            roleArn=stepfunctions_role_arn,
-            type='STANDARD'
+        response = retry_on_iam_propagation(
+            lambda: stepfunctions_client.create_state_machine(
+                name=name,
+                definition=json.dumps(definition),
+                roleArn=stepfunctions_role_arn,
+                type=workflow_type
+            ),
+            name
         )
-        print(f"✅ Step Function '{STEP_FUNCTION_NAME}' criada com sucesso.")
+        print(f"✅ Step Function '{name}' ({workflow_type}) criada com sucesso.")
         return response['stateMachineArn']
 
     except stepfunctions_client.exceptions.StateMachineAlreadyExists:
-        # Se já existir, atualiza a definição
-        existing_arn = f"arn:aws:states:{REGION}:{AWS_ACCOUNT_ID}:stateMachine:{STEP_FUNCTION_NAME}"
-        
-        response = stepfunctions_client.update_state_machine(
-            stateMachineArn=existing_arn,
-            definition=json.dumps(definition),
-            roleArn=stepfunctions_role_arn
+        # Se já existir, atualiza a definição (somente se mudou)
+        existing_arn = state_machine_arn(name)
+        if not state_machine_changed(stepfunctions_client, existing_arn, definition, stepfunctions_role_arn):
+            print(f"✅ Step Function '{name}' sem alterações.")
+            return existing_arn
+
+        retry_on_iam_propagation(
+            lambda: stepfunctions_client.update_state_machine(
+                stateMachineArn=existing_arn,
+                definition=json.dumps(definition),
+                roleArn=stepfunctions_role_arn
+            ),
+            name
         )
-        print(f"🔄 Step Function existente '{STEP_FUNCTION_NAME}' foi atualizada.")
+        print(f"🔄 Step Function existente '{name}' foi atualizada.")
         return existing_arn
 
     except Exception as e:
         print(f"❌ Erro ao processar Step Function: {e}")
-        raise
\ No newline at end of file
+        raise
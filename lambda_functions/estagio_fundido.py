@@ -0,0 +1,37 @@
+import os
+import logging
+import importlib
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Módulos das Lambdas executadas em sequência por esta Lambda, separados por vírgula
+# (ex.: "textract_function,regex_nota_fiscal"). Os arquivos vão no mesmo zip
+ESTAGIOS_FUNDIDOS = [
+    modulo.strip()
+    for modulo in os.environ.get('ESTAGIOS_FUNDIDOS', '').split(',')
+    if modulo.strip()
+]
+
+_handlers = None
+
+# Carrega os handlers dos módulos fundidos na primeira invocação do container
+def carregar_handlers():
+    global _handlers
+    if _handlers is None:
+        _handlers = [importlib.import_module(modulo).lambda_handler for modulo in ESTAGIOS_FUNDIDOS]
+        logger.info(f"ℹ️ Estágios fundidos: {ESTAGIOS_FUNDIDOS}")
+    return _handlers
+
+# Executa os handlers em sequência, repassando a saída de um como entrada do próximo.
+# A cadeia para quando o job assíncrono do Textract ainda está em andamento: a Step
+# Function aguarda e chama esta Lambda de novo
+def executar_cadeia(handlers, event, context):
+    for handler in handlers:
+        event = handler(event, context)
+        if event.get('textract_status') == 'IN_PROGRESS':
+            break
+    return event
+
+def lambda_handler(event, context):
+    return executar_cadeia(carregar_handlers(), event, context)
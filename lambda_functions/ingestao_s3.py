@@ -0,0 +1,81 @@
+import json
+import os
+import logging
+import uuid
+import boto3
+import threading
+from urllib.parse import unquote_plus
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+class LazyClient:
+    """
+    Cliente criado no primeiro uso, fora da importação do módulo (cold start)
+
+    O lock garante um único cliente quando threads fazem o primeiro acesso ao mesmo tempo.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return getattr(self._client, name)
+
+stepfunctions = LazyClient(lambda: boto3.client('stepfunctions'))
+
+# State machines do pipeline. Com a EXPRESS, cada invocação aguarda a nota terminar
+# (start_sync_execution), então a concorrência reservada desta Lambda limita quantas
+# notas são processadas ao mesmo tempo; os eventos excedentes ficam na fila de
+# invocações assíncronas do S3 e são reenviados pela própria Lambda
+STEP_FUNCTION_NAME = os.environ.get('STEP_FUNCTION_NAME', 'notas-fiscais-step-function')
+EXPRESS_STEP_FUNCTION_NAME = os.environ.get('EXPRESS_STEP_FUNCTION_NAME', '')
+
+def get_step_function_arn(context, name):
+    """Monta o ARN da Step Function a partir do ARN da própria Lambda"""
+    aws_region = context.invoked_function_arn.split(':')[3]
+    aws_account_id = context.invoked_function_arn.split(':')[4]
+    return f'arn:aws:states:{aws_region}:{aws_account_id}:stateMachine:{name}'
+
+def process_record(context, record):
+    """Executa o pipeline para o objeto criado informado no evento do S3"""
+    bucket_name = record['s3']['bucket']['name']
+    # Chaves chegam codificadas no evento (espaço vira "+")
+    file_name = unquote_plus(record['s3']['object']['key'])
+    step_function_input = {
+        'file_name': file_name,
+        'bucket_name': bucket_name,
+    }
+    job_id = str(uuid.uuid4())
+
+    if not EXPRESS_STEP_FUNCTION_NAME:
+        stepfunctions.start_execution(
+            stateMachineArn=get_step_function_arn(context, STEP_FUNCTION_NAME),
+            name=job_id,
+            input=json.dumps(step_function_input)
+        )
+        logger.info(f"ℹ️ Execução {job_id} iniciada para {file_name}")
+        return {'file_name': file_name, 'job_id': job_id, 'status': 'RUNNING'}
+
+    response = stepfunctions.start_sync_execution(
+        stateMachineArn=get_step_function_arn(context, EXPRESS_STEP_FUNCTION_NAME),
+        name=job_id,
+        input=json.dumps(step_function_input)
+    )
+    if response['status'] != 'SUCCEEDED':
+        # Erro propagado para a Lambda reenviar o evento
+        raise RuntimeError(f"Execução {job_id} de {file_name} terminou com status {response['status']}: {response.get('cause')}")
+
+    logger.info(f"✅ {file_name} processado: {response['output']}")
+    return {'file_name': file_name, 'job_id': job_id, 'status': response['status']}
+
+def lambda_handler(event, context):
+    records = event.get('Records', [])
+    logger.info(f"🔄 Recebidos {len(records)} objetos para ingestão.")
+    return {'results': [process_record(context, record) for record in records]}
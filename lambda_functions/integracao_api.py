@@ -1,128 +1,510 @@
 import json
 import os
+import io
 import base64
+import binascii
+import hashlib
 import logging
 import boto3
 import time
-from botocore.exceptions import NoCredentialsError
-from requests_toolbelt.multipart import decoder
+import uuid
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+from botocore.exceptions import ClientError, NoCredentialsError
 
 # Configuração do logger
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Clientes AWS
-s3 = boto3.client('s3')
-stepfunctions = boto3.client('stepfunctions')
+class LazyClient:
+    """
+    Cliente criado no primeiro uso, fora da importação do módulo (cold start)
+
+    O lock garante um único cliente quando threads fazem o primeiro acesso ao mesmo tempo.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return getattr(self._client, name)
+
+# Clientes AWS, criados no primeiro uso: GET /invoice/{id} não usa o S3 e uploads já
+# processados não usam a Step Function
+s3 = LazyClient(lambda: boto3.client('s3'))
+stepfunctions = LazyClient(lambda: boto3.client('stepfunctions'))
+
+# Configuração da Step Function e do modo de execução
+STEP_FUNCTION_NAME = os.environ.get('STEP_FUNCTION_NAME', 'notas-fiscais-step-function')
+# State machine EXPRESS usada nas requisições síncronas (vazio: polling na STANDARD)
+EXPRESS_STEP_FUNCTION_NAME = os.environ.get('EXPRESS_STEP_FUNCTION_NAME', '')
+SYNC_MODE = os.environ.get('INVOICE_SYNC_MODE', 'false').lower() == 'true'
+JOB_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,80}')
+# Job ids de upload são sempre UUIDs gerados em create_upload_url
+UPLOAD_JOB_ID_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+SHA256_PATTERN = re.compile(r'[0-9a-f]{64}')
+
+# Número de uploads simultâneos para o S3 em requisições com vários arquivos
+UPLOAD_MAX_WORKERS = int(os.environ.get('UPLOAD_MAX_WORKERS', '8'))
+
+# Tamanho máximo do corpo da requisição (já decodificado)
+MAX_UPLOAD_BYTES = int(os.environ.get('MAX_UPLOAD_BYTES', str(10 * 1024 * 1024)))
+
+# Upload direto ao S3 por URL pré-assinada (POST /invoice/upload-url): o arquivo vai para
+# UPLOAD_PREFIX e o processamento começa em POST /invoice/{id}/start
+UPLOAD_PREFIX = os.environ.get('UPLOAD_PREFIX', 'uploads/')
+UPLOAD_URL_EXPIRES = int(os.environ.get('UPLOAD_URL_EXPIRES', '900'))
+
+# Arquivos enviados no POST /invoice ficam em IMAGENS_PREFIX com chave pelo SHA-256 do
+# conteúdo, então nomes iguais não se sobrescrevem. Antes de enviar, a API procura o
+# resultado do mesmo conteúdo em RESULTADOS_PREFIX (gravado pelo MoverIMG) e, se existir,
+# responde com ele sem iniciar a Step Function
+IMAGENS_PREFIX = os.environ.get('IMAGENS_PREFIX', 'imagens/')
+RESULTADOS_PREFIX = os.environ.get('RESULTADOS_PREFIX', 'resultados/')
+
+ALLOWED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.pdf', '.tif', '.tiff')
+IMAGE_EXTENSIONS = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/jpg': '.jpg',
+    'image/tiff': '.tiff',
+    'application/pdf': '.pdf',
+}
+BOUNDARY_PATTERN = re.compile(r'boundary=(?:"([^"]+)"|([^;\s]+))', re.IGNORECASE)
+
+class MemoryViewReader(io.RawIOBase):
+    """Leitor de arquivo sobre um memoryview, usado como Body do S3 sem copiar os bytes"""
+
+    def __init__(self, view):
+        self._view = view
+        self._position = 0
+
+    def __len__(self):
+        return len(self._view)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), len(self._view) - self._position)
+        buffer[:size] = self._view[self._position:self._position + size]
+        self._position += size
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, min(offset, len(self._view)))
+        return self._position
+
+    def tell(self):
+        return self._position
+
+def content_key(file_name, sha256):
+    """Chave do arquivo no S3 a partir do SHA-256 do conteúdo (mantém a extensão)"""
+    return f"{IMAGENS_PREFIX}{sha256}{os.path.splitext(file_name)[1].lower()}"
+
+def get_previous_result(bucket_name, sha256):
+    """
+    Retorna o resultado validado já gravado para o conteúdo
+
+    Resultados parciais (campos que a LLM não conseguiu validar) não são reaproveitados:
+    o conteúdo volta a passar pelo pipeline. Returns None nesses casos e quando o
+    conteúdo ainda não foi processado.
+    """
+    try:
+        response = s3.get_object(Bucket=bucket_name, Key=f"{RESULTADOS_PREFIX}{sha256}.json")
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+    registro = json.loads(response['Body'].read())
+    if registro.get('status') != 'validado':
+        return None
+    return registro['result_json']
 
 def upload_to_s3(bucket_name, file_name, file_content):
-    """Faz upload de um arquivo para o S3"""
+    """
+    Faz upload de um arquivo para o S3, com chave pelo SHA-256 do conteúdo
+
+    Conteúdos já processados não são enviados de novo.
+
+    Returns:
+        Dicionário com file_name (chave no S3), original_name (nome enviado pelo cliente),
+        sha256 e result (resultado anterior ou None)
+    """
+    sha256 = hashlib.sha256(file_content).hexdigest()
+    key = content_key(file_name, sha256)
+
+    previous_result = get_previous_result(bucket_name, sha256)
+    if previous_result is not None:
+        logger.info(f"Arquivo {file_name} já processado ({sha256}); reaproveitando o resultado")
+        return {'file_name': key, 'original_name': file_name, 'sha256': sha256, 'result': previous_result}
+
+    logger.info(f"Iniciando upload do arquivo {file_name} para o S3 ({key})")
+    s3.put_object(
+        Bucket=bucket_name,
+        Key=key,
+        Body=MemoryViewReader(memoryview(file_content)),
+        ChecksumAlgorithm='SHA256',  # Guarda o SHA-256, usado como chave do cache do Textract
+        Metadata={'nome-original': quote(file_name)}
+    )
+    logger.info(f"Upload do arquivo {file_name} concluído com sucesso")
+    return {'file_name': key, 'original_name': file_name, 'sha256': sha256, 'result': None}
+
+def upload_files_to_s3(bucket_name, files):
+    """
+    Faz upload concorrente de vários arquivos para o S3
+
+    Returns:
+        Tupla (lista de uploads de upload_to_s3, resposta de erro ou None)
+    """
     try:
-        logger.info(f"Iniciando upload do arquivo {file_name} para o S3")
-        s3.put_object(
-            Bucket=bucket_name,
-            Key=file_name,
-            Body=file_content
-        )
-        logger.info(f"Upload do arquivo {file_name} concluído com sucesso")
-        return {
-            'statusCode': 200,
-            'body': json.dumps({'file_name': file_name})
-        }
+        if len(files) == 1:
+            file_name, file_content = files[0]
+            return [upload_to_s3(bucket_name, file_name, file_content)], None
+
+        with ThreadPoolExecutor(max_workers=min(UPLOAD_MAX_WORKERS, len(files))) as executor:
+            uploads = list(executor.map(
+                lambda file: upload_to_s3(bucket_name, file[0], file[1]),
+                files
+            ))
+        return uploads, None
+
     except Exception as e:
         logger.error(f"Erro ao fazer upload: {str(e)}")
-        return {
+        return None, {
             'statusCode': 500,
             'body': json.dumps({'error': 'Erro interno no servidor'})
         }
 
-def validate_and_extract_file(event):
-    """Valida o evento e extrai o arquivo"""
+def previous_results_response(uploads, sync=False):
+    """Resposta com os resultados já gravados, no formato da execução correspondente (lotes com o nome original)"""
+    if len(uploads) > 1:
+        body = {
+            'results': [
+                {'file_name': upload['original_name'], 'result': upload['result']}
+                for upload in uploads
+            ]
+        }
+    elif sync:
+        body = uploads[0]['result']
+    else:
+        body = {'status': 'SUCCEEDED', 'sha256': uploads[0]['sha256'], 'result': uploads[0]['result']}
+
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps(body)
+    }
+
+def get_header(event, name):
+    """Obtém um cabeçalho da requisição sem diferenciar maiúsculas e minúsculas"""
+    headers = event.get('headers') or {}
+    return next((value for key, value in headers.items() if key.lower() == name.lower()), '')
+
+def check_body_size(event):
+    """Verifica o tamanho do corpo antes de decodificá-lo"""
+    body = event.get('body') or ''
+    size = len(body)
+    if event.get('isBase64Encoded', False):
+        # Cada 4 caracteres Base64 correspondem a 3 bytes
+        size = size * 3 // 4
+    return size <= MAX_UPLOAD_BYTES
+
+def decode_body(event):
+    """Decodifica o corpo da requisição, liberando a string Base64 original do evento"""
+    body = event.pop('body')
+    if event.get('isBase64Encoded', False):
+        return binascii.a2b_base64(body)
+    if isinstance(body, str):
+        return body.encode('utf-8')
+    return body
+
+def parse_part_headers(raw_headers):
+    """Converte os cabeçalhos de uma parte do multipart em dicionário (chaves minúsculas)"""
+    headers = {}
+    for line in raw_headers.decode('utf-8', errors='replace').split('\r\n'):
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    return headers
+
+def parse_multipart(body, content_type):
+    """
+    Separa as partes de um corpo multipart/form-data
+
+    O conteúdo de cada parte é um memoryview sobre o corpo original, sem cópias.
+    """
+    match = BOUNDARY_PATTERN.search(content_type)
+    if not match:
+        raise ValueError('Boundary não encontrado no Content-Type')
+
+    delimiter = b'--' + (match.group(1) or match.group(2)).encode()
+    view = memoryview(body)
+    parts = []
+
+    position = body.find(delimiter)
+    if position < 0:
+        raise ValueError('Delimitador do multipart não encontrado')
+
+    while True:
+        position += len(delimiter)
+        if body[position:position + 2] == b'--':
+            break
+
+        headers_end = body.find(b'\r\n\r\n', position)
+        if headers_end < 0:
+            raise ValueError('Cabeçalhos do multipart incompletos')
+
+        headers = parse_part_headers(body[position:headers_end])
+        content_start = headers_end + 4
+        content_end = body.find(b'\r\n' + delimiter, content_start)
+        if content_end < 0:
+            raise ValueError('Delimitador final do multipart não encontrado')
+
+        parts.append((headers, view[content_start:content_end]))
+        position = content_end + 2
+
+    return parts
+
+def validate_and_extract_files(event):
+    """Valida o evento e extrai todos os arquivos enviados (multipart ou imagem direta)"""
     if 'body' not in event:
         logger.warning("Evento sem corpo")
         return False, 'Formato de requisição inválido'
     
-    content_type = event['headers'].get('Content-Type', '')
-    if 'multipart/form-data' not in content_type:
+    content_type = get_header(event, 'Content-Type')
+    is_raw_image = content_type.lower().startswith(('image/', 'application/pdf'))
+    if 'multipart/form-data' not in content_type and not is_raw_image:
         logger.warning(f"Formato de conteúdo inválido: {content_type}")
-        return False, 'Formato inválido. Use multipart/form-data'
-    
-    body = event['body']
-    if event.get('isBase64Encoded', False):
-        try:
-            body = base64.b64decode(body)
-        except Exception as e:
-            logger.error(f"Erro ao decodificar Base64: {str(e)}")
-            return False, 'Erro ao processar o arquivo'
+        return False, 'Formato inválido. Use multipart/form-data ou envie o arquivo diretamente (image/* ou application/pdf)'
     
     try:
-        multipart_data = decoder.MultipartDecoder(body, content_type)
+        body = decode_body(event)
+    except Exception as e:
+        logger.error(f"Erro ao decodificar Base64: {str(e)}")
+        return False, 'Erro ao processar o arquivo'
+
+    # Imagem enviada diretamente no corpo, sem multipart
+    if is_raw_image:
+        query = event.get('queryStringParameters') or {}
+        extension = IMAGE_EXTENSIONS.get(content_type.split(';')[0].strip().lower(), '')
+        file_name = (
+            get_header(event, 'X-File-Name')
+            or query.get('file_name')
+            or f"{uuid.uuid4()}{extension}"
+        )
+        if not file_name.lower().endswith(ALLOWED_EXTENSIONS):
+            logger.warning(f"Arquivo {file_name} não é uma imagem válida")
+            return False, 'O arquivo deve ser uma imagem (PNG, JPG, JPEG, TIFF) ou PDF'
+        return True, [(file_name, memoryview(body))]
+
+    try:
+        parts = parse_multipart(body, content_type)
     except Exception as e:
         logger.error(f"Erro ao decodificar multipart: {str(e)}")
         return False, 'Erro ao processar arquivo'
     
-    for part in multipart_data.parts:
-        if part.headers.get(b'Content-Disposition'):
-            disposition = part.headers[b'Content-Disposition'].decode()
-            if 'filename=' in disposition:
-                file_name = disposition.split('filename=')[-1].strip().replace('"', '')
-                file_content = part.content
-                
-                if not file_name.lower().endswith(('.png', '.jpg', '.jpeg')):
-                    logger.warning(f"Arquivo {file_name} não é uma imagem válida")
-                    return False, 'O arquivo deve ser uma imagem (PNG, JPG, JPEG)'
-                
-                return True, (file_name, file_content)
-    
-    logger.warning("Nenhum arquivo encontrado no corpo da requisição")
-    return False, 'Nenhum arquivo encontrado'
+    files = []
+    for headers, file_content in parts:
+        disposition = headers.get('content-disposition', '')
+        if 'filename=' in disposition:
+            file_name = disposition.split('filename=')[-1].strip().replace('"', '')
+            
+            if not file_name.lower().endswith(ALLOWED_EXTENSIONS):
+                logger.warning(f"Arquivo {file_name} não é uma imagem válida")
+                return False, 'O arquivo deve ser uma imagem (PNG, JPG, JPEG, TIFF) ou PDF'
 
-def execute_step_function(context, bucket_name, file_name):
-    """Executa a Step Function e aguarda seu resultado"""
-    try:
-        # Extrai o ARN da Step Function
-        aws_region = context.invoked_function_arn.split(':')[3]
-        aws_account_id = context.invoked_function_arn.split(':')[4]
-        arn_step_function = f'arn:aws:states:{aws_region}:{aws_account_id}:stateMachine:notas-fiscais-step-function'
-
-        # Prepara a entrada para a Step Function
-        step_function_input = {
-            "file_name": file_name,
-            "bucket_name": bucket_name,
+            if any(name == file_name for name, _ in files):
+                logger.warning(f"Arquivo {file_name} enviado mais de uma vez")
+                return False, f'Arquivo duplicado na requisição: {file_name}'
+            
+            files.append((file_name, file_content))
+
+    if not files:
+        logger.warning("Nenhum arquivo encontrado no corpo da requisição")
+        return False, 'Nenhum arquivo encontrado'
+
+    return True, files
+
+def get_step_function_arn(context, name=STEP_FUNCTION_NAME):
+    """Monta o ARN da Step Function a partir do ARN da própria Lambda"""
+    aws_region = context.invoked_function_arn.split(':')[3]
+    aws_account_id = context.invoked_function_arn.split(':')[4]
+    return f'arn:aws:states:{aws_region}:{aws_account_id}:stateMachine:{name}'
+
+def get_execution_arn(context, job_id):
+    """Monta o ARN de uma execução da Step Function a partir do job id"""
+    state_machine_arn = get_step_function_arn(context)
+    return state_machine_arn.replace(':stateMachine:', ':execution:') + f':{job_id}'
+
+def is_sync_request(event):
+    """Define se a requisição aguarda o resultado (modo síncrono) ou retorna 202"""
+    query = event.get('queryStringParameters') or {}
+    sync = query.get('sync')
+    if sync is None:
+        return SYNC_MODE
+    return sync.lower() in ('true', '1', 'sim')
+
+def format_execution_output(execution_status):
+    """Formata a saída da execução; lotes viram uma lista de resultados por arquivo"""
+    output = json.loads(execution_status['output'])
+    execution_input = json.loads(execution_status.get('input') or '{}')
+
+    if 'files' not in execution_input:
+        return output
+
+    # Lotes enviados pela API guardam os nomes originais (as chaves no S3 são pelo SHA-256)
+    # e, em lotes mistos, os resultados já gravados na ordem da requisição (None nos
+    # arquivos processados por esta execução)
+    file_names = execution_input.get('original_names') or execution_input['files']
+    previous_results = execution_input.get('previous_results')
+    if previous_results:
+        processed = iter(output)
+        output = [result if result is not None else next(processed) for result in previous_results]
+    return {
+        'results': [
+            {'file_name': file_name, 'result': result}
+            for file_name, result in zip(file_names, output)
+        ]
+    }
+
+def wait_for_execution(execution_arn):
+    """Monitora a execução até seu término (modo síncrono)"""
+    while True:
+        execution_status = stepfunctions.describe_execution(executionArn=execution_arn)
+        status = execution_status['status']
+
+        if status == 'SUCCEEDED':
+            output = format_execution_output(execution_status)
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps(output)
+            }
+        elif status in ['FAILED', 'TIMED_OUT', 'ABORTED']:
+            return {
+                'statusCode': 500,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({
+                    'error': 'Step Function execution failed',
+                    'executionArn': execution_arn,
+                    'status': status
+                })
+            }
+        time.sleep(1)
+
+def execute_express_step_function(context, job_id, step_function_input):
+    """Executa a state machine EXPRESS e devolve o resultado na mesma chamada"""
+    response = stepfunctions.start_sync_execution(
+        stateMachineArn=get_step_function_arn(context, EXPRESS_STEP_FUNCTION_NAME),
+        name=job_id,
+        input=json.dumps(step_function_input)
+    )
+
+    if response['status'] == 'SUCCEEDED':
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json'},
+            'body': json.dumps(format_execution_output(response))
         }
 
-        # Inicia a execução da Step Function
+    logger.error(f"Execução {job_id} terminou com status {response['status']}: {response.get('cause')}")
+    return {
+        'statusCode': 500,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({
+            'error': 'Step Function execution failed',
+            'executionArn': response['executionArn'],
+            'status': response['status']
+        })
+    }
+
+def execute_step_function(context, bucket_name, file_names, sync=False, textract_profile=None, job_id=None, sha256=None,
+                          original_names=None, previous_results=None):
+    """
+    Executa a Step Function; no modo síncrono aguarda o resultado, senão retorna o job id
+
+    Args:
+        file_names: Chaves no S3 dos arquivos a processar
+        original_names: Nomes enviados pelo cliente, de todos os arquivos do lote
+        previous_results: Em lotes mistos, os resultados já gravados na ordem da
+            requisição (None nos arquivos de file_names); a execução é sempre um lote
+    """
+    try:
+        arn_step_function = get_step_function_arn(context)
+
+        # Prepara a entrada para a Step Function (lotes são processados pelo estado Map)
+        if len(file_names) == 1 and not previous_results:
+            step_function_input = {
+                "file_name": file_names[0],
+                "bucket_name": bucket_name,
+            }
+            if textract_profile:
+                step_function_input["textract_profile"] = textract_profile
+            if sha256:
+                step_function_input["sha256"] = sha256
+        else:
+            step_function_input = {
+                "files": file_names,
+                "bucket_name": bucket_name,
+            }
+            if original_names:
+                step_function_input["original_names"] = original_names
+            if previous_results:
+                step_function_input["previous_results"] = previous_results
+
+        # Inicia a execução da Step Function (o nome da execução é o job id)
+        job_id = job_id or str(uuid.uuid4())
+
+        # Requisições síncronas usam a state machine EXPRESS, quando implantada
+        if sync and EXPRESS_STEP_FUNCTION_NAME:
+            return execute_express_step_function(context, job_id, step_function_input)
+
         response = stepfunctions.start_execution(
             stateMachineArn=arn_step_function,
+            name=job_id,
             input=json.dumps(step_function_input)
         )
 
         execution_arn = response['executionArn']
-        
-        # Monitora a execução
-        while True:
-            execution_status = stepfunctions.describe_execution(executionArn=execution_arn)
-            status = execution_status['status']
-
-            if status == 'SUCCEEDED':
-                output = json.loads(execution_status['output'])
-                return {
-                    'statusCode': 200,
-                    'headers': {'Content-Type': 'application/json'},
-                    'body': json.dumps(output)
-                }
-            elif status in ['FAILED', 'TIMED_OUT', 'ABORTED']:
-                return {
-                    'statusCode': 500,
-                    'headers': {'Content-Type': 'application/json'},
-                    'body': json.dumps({
-                        'error': 'Step Function execution failed',
-                        'executionArn': execution_arn,
-                        'status': status
-                    })
-                }
-            time.sleep(1)
+
+        if sync:
+            return wait_for_execution(execution_arn)
+
+        logger.info(f"Execução {job_id} iniciada em modo assíncrono")
+        return {
+            'statusCode': 202,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Location': f'/invoice/{job_id}'
+            },
+            'body': json.dumps({
+                'job_id': job_id,
+                'status': 'RUNNING'
+            })
+        }
             
+    except stepfunctions.exceptions.ExecutionAlreadyExists:
+        logger.warning(f"Execução {job_id} já foi iniciada")
+        return {
+            'statusCode': 409,
+            'body': json.dumps({'error': 'Job já iniciado', 'job_id': job_id})
+        }
     except Exception as e:
         logger.error(f"Erro na execução da Step Function: {str(e)}")
         return {
@@ -130,13 +512,187 @@ def execute_step_function(context, bucket_name, file_name):
             'body': json.dumps({'error': 'Erro ao executar Step Function'})
         }
 
+def create_upload_url(event, bucket_name):
+    """Gera uma URL pré-assinada de PUT no S3 e o job id do upload (POST /invoice/upload-url)"""
+    try:
+        request = json.loads(decode_body(event) or b'{}') if event.get('body') else {}
+    except Exception:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Corpo da requisição deve ser JSON'})
+        }
+
+    content_type = (request.get('content_type') or 'image/jpeg').lower()
+    file_name = request.get('file_name') or ''
+    extension = os.path.splitext(file_name)[1].lower() or IMAGE_EXTENSIONS.get(content_type, '')
+    if extension not in ALLOWED_EXTENSIONS:
+        logger.warning(f"Extensão inválida para upload: {file_name or content_type}")
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'O arquivo deve ser uma imagem (PNG, JPG, JPEG, TIFF) ou PDF'})
+        }
+
+    # SHA-256 opcional do arquivo: conteúdos já processados dispensam o upload, e os demais
+    # são enviados com o checksum, conferido pelo S3 e usado no início do job
+    sha256 = (request.get('sha256') or '').lower()
+    headers = {'Content-Type': content_type}
+    params = {'Bucket': bucket_name, 'ContentType': content_type}
+    if sha256:
+        if not SHA256_PATTERN.fullmatch(sha256):
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'sha256 deve ter 64 caracteres hexadecimais'})
+            }
+        previous_result = get_previous_result(bucket_name, sha256)
+        if previous_result is not None:
+            logger.info(f"Arquivo {sha256} já processado; upload dispensado")
+            return previous_results_response([{'file_name': None, 'sha256': sha256, 'result': previous_result}])
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+        params['ChecksumSHA256'] = checksum
+        headers['x-amz-checksum-sha256'] = checksum
+
+    # O job id também nomeia o objeto, então nomes iguais de usuários diferentes não colidem
+    job_id = str(uuid.uuid4())
+    key = f"{UPLOAD_PREFIX}{job_id}{extension}"
+    upload_url = s3.generate_presigned_url(
+        'put_object',
+        Params={**params, 'Key': key},
+        ExpiresIn=UPLOAD_URL_EXPIRES
+    )
+    logger.info(f"URL de upload gerada para o job {job_id}")
+
+    return {
+        'statusCode': 201,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({
+            'job_id': job_id,
+            'upload_url': upload_url,
+            'method': 'PUT',
+            'headers': headers,
+            'expires_in': UPLOAD_URL_EXPIRES,
+            'start_url': f'/invoice/{job_id}/start'
+        })
+    }
+
+def get_uploaded_sha256(bucket_name, key):
+    """SHA-256 de um objeto pelo checksum guardado no S3 (None se o upload não enviou)"""
+    head = s3.head_object(Bucket=bucket_name, Key=key, ChecksumMode='ENABLED')
+    checksum = head.get('ChecksumSHA256')
+    # Checksums de uploads multipart são compostos ("<hash>-<partes>") e não identificam o conteúdo
+    if checksum and '-' not in checksum:
+        return base64.b64decode(checksum).hex()
+    return None
+
+def start_uploaded_job(event, context, bucket_name, job_id):
+    """Inicia o processamento de um arquivo enviado pela URL pré-assinada (POST /invoice/{id}/start)"""
+    if not UPLOAD_JOB_ID_PATTERN.fullmatch(job_id or ''):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Job id inválido'})
+        }
+
+    # O objeto deve ser exatamente uploads/{job_id}{extensão}, nunca outro com o mesmo prefixo
+    prefix = f"{UPLOAD_PREFIX}{job_id}"
+    response = s3.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
+    uploaded = [
+        item['Key'] for item in response.get('Contents', [])
+        if item['Key'][len(prefix):].lower() in ALLOWED_EXTENSIONS
+    ]
+    if not uploaded:
+        logger.warning(f"Arquivo do job {job_id} não encontrado")
+        return {
+            'statusCode': 404,
+            'body': json.dumps({'error': 'Arquivo não enviado para este job'})
+        }
+
+    # Com o checksum SHA-256 enviado no PUT, conteúdos já processados não executam o pipeline
+    key = uploaded[0]
+    sync = is_sync_request(event)
+    sha256 = get_uploaded_sha256(bucket_name, key)
+    if sha256:
+        previous_result = get_previous_result(bucket_name, sha256)
+        if previous_result is not None:
+            logger.info(f"Arquivo do job {job_id} já processado ({sha256}); reaproveitando o resultado")
+            return previous_results_response([{'file_name': key, 'sha256': sha256, 'result': previous_result}], sync)
+
+    query = event.get('queryStringParameters') or {}
+    return execute_step_function(
+        context,
+        bucket_name,
+        [key],
+        sync=sync,
+        textract_profile=query.get('textract_profile'),
+        job_id=job_id,
+        sha256=sha256
+    )
+
+def get_execution_result(context, job_id):
+    """Consulta o status e o resultado de uma execução (GET /invoice/{id})"""
+    if not JOB_ID_PATTERN.fullmatch(job_id or ''):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Job id inválido'})
+        }
+
+    try:
+        execution_status = stepfunctions.describe_execution(
+            executionArn=get_execution_arn(context, job_id)
+        )
+    except stepfunctions.exceptions.ExecutionDoesNotExist:
+        logger.warning(f"Execução {job_id} não encontrada")
+        return {
+            'statusCode': 404,
+            'body': json.dumps({'error': 'Job não encontrado'})
+        }
+    except Exception as e:
+        logger.error(f"Erro ao consultar a Step Function: {str(e)}")
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': 'Erro ao consultar Step Function'})
+        }
+
+    status = execution_status['status']
+    body = {'job_id': job_id, 'status': status}
+
+    if status == 'SUCCEEDED':
+        body['result'] = format_execution_output(execution_status)
+    elif status in ['FAILED', 'TIMED_OUT', 'ABORTED']:
+        body['error'] = 'Step Function execution failed'
+
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps(body)
+    }
+
 def lambda_handler(event, context):
     """Função principal da Lambda"""
     logger.info(f"Lambda iniciada. Request ID: {context.aws_request_id}")
     
     try:
+        # GET /invoice/{id}: consulta o resultado de uma execução assíncrona
+        if event.get('httpMethod') == 'GET':
+            job_id = (event.get('pathParameters') or {}).get('id')
+            return get_execution_result(context, job_id)
+
         bucket_name = os.environ.get('S3_BUCKET_NAME', 'grupo-1-notas-fiscais-s3') # Passar para variavel ambiente
-        is_valid, validation_message = validate_and_extract_file(event)
+
+        # Upload direto ao S3: gera a URL pré-assinada ou inicia o job já enviado
+        resource = event.get('resource', '')
+        if resource == '/invoice/upload-url':
+            return create_upload_url(event, bucket_name)
+        if resource == '/invoice/{id}/start':
+            job_id = (event.get('pathParameters') or {}).get('id')
+            return start_uploaded_job(event, context, bucket_name, job_id)
+
+        if not check_body_size(event):
+            logger.warning("Corpo da requisição excede o tamanho máximo")
+            return {
+                'statusCode': 413,
+                'body': json.dumps({'error': f'Arquivo excede o tamanho máximo de {MAX_UPLOAD_BYTES} bytes'})
+            }
+
+        is_valid, validation_message = validate_and_extract_files(event)
         
         if not is_valid:
             logger.warning("Upload não foi bem-sucedido - validação falhou")
@@ -145,14 +701,35 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': validation_message})
             }
         
-        file_name, file_content = validation_message
-        upload_response = upload_to_s3(bucket_name, file_name, file_content)
+        files = validation_message
+        uploads, error_response = upload_files_to_s3(bucket_name, files)
         
-        if upload_response['statusCode'] != 200:
-            return upload_response
+        if error_response:
+            return error_response
+
+        # Conteúdo já processado: responde com o resultado gravado, sem executar o pipeline
+        sync = is_sync_request(event)
+        if all(upload['result'] is not None for upload in uploads):
+            logger.info(f"{len(uploads)} arquivo(s) já processado(s), retornando os resultados gravados")
+            return previous_results_response(uploads, sync)
         
-        logger.info("Upload bem sucedido, iniciando Step Function")
-        return execute_step_function(context, bucket_name, file_name)
+        # Lote misto: só os arquivos ainda não processados (os únicos enviados ao S3) vão
+        # para a execução; os resultados gravados entram na resposta na ordem da requisição
+        pending = [upload for upload in uploads if upload['result'] is None]
+        previous_results = [upload['result'] for upload in uploads] if len(pending) < len(uploads) else None
+
+        logger.info(f"Upload de {len(pending)} arquivo(s) bem sucedido, iniciando Step Function")
+        query = event.get('queryStringParameters') or {}
+        return execute_step_function(
+            context,
+            bucket_name,
+            [upload['file_name'] for upload in pending],
+            sync=sync,
+            textract_profile=query.get('textract_profile'),
+            sha256=uploads[0]['sha256'] if len(uploads) == 1 else None,
+            original_names=[upload['original_name'] for upload in uploads],
+            previous_results=previous_results
+        )
         
     except NoCredentialsError:
         logger.error("Credenciais da AWS não encontradas")
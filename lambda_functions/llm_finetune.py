@@ -1,10 +1,65 @@
 import json
+import os
+import asyncio
+import contextlib
 import re
+import time
+import hashlib
 import logging
-from groq import Groq
+import sqlite3
+import threading
+from collections import OrderedDict
+import boto3
+from botocore.exceptions import ClientError
 
 logger = logging.getLogger()
 
+# Configuração da LLM e da política de novas tentativas
+GROQ_API_KEY = os.environ.get('GROQ_API_KEY', "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")
+LLM_MODEL = os.environ.get('LLM_MODEL', "llama3-8b-8192")
+LLM_MAX_TENTATIVAS = int(os.environ.get('LLM_MAX_TENTATIVAS', '4'))
+LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', '10'))
+LLM_BACKOFF_SEGUNDOS = float(os.environ.get('LLM_BACKOFF_SEGUNDOS', '0.5'))
+# Margem reservada para concluir a Lambda e tempo máximo quando não há contexto
+LLM_MARGEM_SEGUNDOS = float(os.environ.get('LLM_MARGEM_SEGUNDOS', '2'))
+LLM_TEMPO_MAXIMO = float(os.environ.get('LLM_TEMPO_MAXIMO', '25'))
+
+# Processamento em lote: chamadas simultâneas por container e agrupamento de notas curtas
+# em um único prompt (1 desativa o agrupamento)
+LLM_CONCORRENCIA = int(os.environ.get('LLM_CONCORRENCIA', '8'))
+LLM_NOTAS_POR_PROMPT = int(os.environ.get('LLM_NOTAS_POR_PROMPT', '1'))
+LLM_AGRUPAR_MAX_CARACTERES = int(os.environ.get('LLM_AGRUPAR_MAX_CARACTERES', '600'))
+
+# Configuração do cache de respostas da LLM (chaveado pelo texto normalizado, modelo e
+# versão do prompt). Apenas resultados validados são guardados
+LLM_CACHE = os.environ.get('LLM_CACHE', 's3')  # s3, sqlite ou off
+LLM_CACHE_PREFIX = os.environ.get('LLM_CACHE_PREFIX', 'cache/llm/')
+LLM_CACHE_DB = os.environ.get('LLM_CACHE_DB', '/tmp/llm-cache.sqlite')
+LLM_CACHE_TTL = int(os.environ.get('LLM_CACHE_TTL', str(30 * 24 * 3600)))
+LLM_CACHE_MEMORIA = int(os.environ.get('LLM_CACHE_MEMORIA', '256'))
+
+class LazyClient:
+    """
+    Cliente criado no primeiro uso, fora da importação do módulo (cold start)
+
+    O lock garante um único cliente quando threads fazem o primeiro acesso ao mesmo tempo.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return getattr(self._client, name)
+
+# O cliente do S3 só é usado pelo cache em S3 (LLM_CACHE=s3)
+s3 = LazyClient(lambda: boto3.client("s3"))
+
 def formatar_cnpj_cpf(valor):
     if len(valor) == 14:
         return f"{valor[:2]}.{valor[2:5]}.{valor[5:8]}/{valor[8:12]}-{valor[12:]}"
@@ -12,126 +67,112 @@ def formatar_cnpj_cpf(valor):
         return f"{valor[:3]}.{valor[3:6]}.{valor[6:9]}-{valor[9:]}"
     return valor
 
-# Valida o formato da nota
-def validar_nota_fiscal(dados, texto):
+# Campos da nota, na ordem do JSON final, e os rótulos usados no texto enviado à LLM
+CAMPOS_NOTA = {
+    "nome_emissor": "Nome do Emissor",
+    "CNPJ_emissor": "CNPJ do Emissor",
+    "endereco_emissor": "Endereço do Emissor",
+    "CNPJ_CPF_consumidor": "CNPJ/CPF do Consumidor",
+    "data_emissao": "Data de Emissão",
+    "numero_nota_fiscal": "Número da Nota Fiscal",
+    "serie_nota_fiscal": "Série da Nota Fiscal",
+    "valor_total": "Valor Total",
+    "forma_pgto": "Forma de Pagamento",
+}
+
+# Campos em que o valor extraído por regex é mais preciso que o da LLM, quando válido
+CAMPOS_REGEX_CONFIAVEIS = {
+    "CNPJ_emissor": r"\d{14}",
+    "CNPJ_CPF_consumidor": r"\d{11}|\d{14}",
+    "numero_nota_fiscal": r"\d{6}|\d{9}",
+    "serie_nota_fiscal": r"\d{3}",
+    "valor_total": r"\d+([,.]\d{2})?",
+}
+
+# Renderiza o registro da etapa de regex no formato "Chave: valor" usado no prompt
+def renderizar_nota(registro):
+    return "\n".join(
+        f"{rotulo}: {registro.get(campo) if registro.get(campo) is not None else '<none>'}"
+        for campo, rotulo in CAMPOS_NOTA.items()
+    )
+
+# Valida o formato da nota campo a campo, normalizando os campos válidos no próprio
+# dicionário. Retorna a lista dos campos inválidos (vazia quando a nota é válida)
+def campos_invalidos(dados, registro):
     logger.info(f"ℹ️ Validando os dados gerados pela LLM.")
+    invalidos = []
 
-    # Define todos os valores como string
-    try:
-        logger.info(f"ℹ️ Validando formato do jason e reformatando campos como string.")
-        for chave in ["nome_emissor", "CNPJ_emissor", "endereco_emissor", "CNPJ_CPF_consumidor", "data_emissao", "numero_nota_fiscal", "serie_nota_fiscal", "valor_total", "forma_pgto"]:
-            if dados[chave] is not None and not isinstance(dados[chave], str):
-                dados[chave] = str(dados[chave])
-    except:
-        return 0
-
-    # Captura e mantém valores mais precisos do texto original feito com NLTK
-    logger.info(f"ℹ️ Capturando dados mais precisos gerados pelo NLTK.")
-    linhas = texto.split('\n')
-    for linha in linhas:
-        if "CNPJ do Emissor" in linha:
-            padrao_cnpj = r'(\b\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}\b|\b\d{14}\b)'
-            resultado_cnpj = re.search(padrao_cnpj, linha)
-            
-            if resultado_cnpj:
-                cnpj = resultado_cnpj.group(1)
-                # Remover os caracteres especiais, mantendo apenas os números
-                cnpj = re.sub(r'\D', '', cnpj)
-                dados["CNPJ_emissor"] = cnpj
-        
-        if "CNPJ/CPF do Consumidor" in linha:
-            padrao_cnpj_cpf = r'(\b\d{11}\b|\b\d{14}\b|\b\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}\b|\b\d{3}\.\d{3}\.\d{3}-\d{2}\b)'
-            resultado_cnpj_cpf = re.search(padrao_cnpj_cpf, linha)
-            
-            if resultado_cnpj_cpf:
-                cnpj_cpf = resultado_cnpj_cpf.group(1)
-                cnpj_cpf = re.sub(r'\D', '', cnpj_cpf)
-                dados["CNPJ_CPF_consumidor"] = cnpj_cpf
-
-        if "Número da Nota Fiscal" in linha:
-            padrao_num = r'(\b\d{6}|\d{9}\b)'
-            resultado_num = re.search(padrao_num, linha)
-            
-            if resultado_num:
-                dados["numero_nota_fiscal"] = resultado_num.group(1)
-
-        if "Série da Nota Fiscal" in linha:
-            padrao_serie = r'(\b\d{3}\b)'
-            resultado_serie = re.search(padrao_serie, linha)
-            
-            if resultado_serie:
-                dados["serie_nota_fiscal"] = resultado_serie.group(1)
-
-        if "Valor Total" in linha:
-            padrao_total = r'(\b\d+([,.]\d{2})?\b)'
-            resultado_total = re.search(padrao_total, linha)
-            
-            if resultado_total:
-                dados["valor_total"] = resultado_total.group(1)
+    # Define todos os valores como string; campos ausentes no JSON são inválidos
+    logger.info(f"ℹ️ Validando formato do jason e reformatando campos como string.")
+    for chave in CAMPOS_NOTA:
+        if chave not in dados:
+            invalidos.append(chave)
+        elif dados[chave] is not None and not isinstance(dados[chave], str):
+            dados[chave] = str(dados[chave])
+
+    # Captura e mantém valores mais precisos extraídos pela etapa de regex
+    logger.info(f"ℹ️ Capturando dados mais precisos extraídos por regex.")
+    for campo, padrao in CAMPOS_REGEX_CONFIAVEIS.items():
+        valor = registro.get(campo)
+        if valor is not None and re.fullmatch(padrao, valor):
+            dados[campo] = valor
+            if campo in invalidos:
+                invalidos.remove(campo)
+
+    def invalido(campo, mensagem):
+        logger.info(f"❌ {mensagem}")
+        if campo not in invalidos:
+            invalidos.append(campo)
 
     # Verifica a forma de pagamento
-    if dados["forma_pgto"] not in {"dinheiropix", "outros", None}:
-        logger.info(f"❌ Forma de pagamento inválida.")
-        return 0
+    if dados.get("forma_pgto") not in {"dinheiropix", "outros", None}:
+        invalido("forma_pgto", "Forma de pagamento inválida.")
     
     # Verifica o numero 
-    if dados["numero_nota_fiscal"] is not None and not re.fullmatch(r"\d{6}|\d{9}", dados["numero_nota_fiscal"]):
-        logger.info(f"❌ Número da nota fiscal inválida.")
-        return 0
+    if dados.get("numero_nota_fiscal") is not None and not re.fullmatch(r"\d{6}|\d{9}", dados["numero_nota_fiscal"]):
+        invalido("numero_nota_fiscal", "Número da nota fiscal inválida.")
     
     # Verifica a serie
-    if dados["serie_nota_fiscal"] is not None and not re.fullmatch(r"\d{3}", dados["serie_nota_fiscal"]):
-        logger.info(f"❌ Série da nota fiscal inválida.")
-        return 0
+    if dados.get("serie_nota_fiscal") is not None and not re.fullmatch(r"\d{3}", dados["serie_nota_fiscal"]):
+        invalido("serie_nota_fiscal", "Série da nota fiscal inválida.")
     
     # Verifica o valor total, tira zeros a esquerda e corrige , para .
-    if dados["valor_total"] is not None:
+    if dados.get("valor_total") is not None:
         if not re.fullmatch(r"\d+([,.]\d{2})?", dados["valor_total"]):
-            logger.info(f"❌ Valor total inválido.")
-            return 0
-        dados["valor_total"] = re.sub(r'^0+(\d+)', r'\1', dados["valor_total"])
-        dados["valor_total"] = dados["valor_total"].replace(",", ".")
-        if not dados["valor_total"].endswith('.00'):
-            dados["valor_total"] += '.00'
+            invalido("valor_total", "Valor total inválido.")
+        else:
+            dados["valor_total"] = re.sub(r'^0+(\d+)', r'\1', dados["valor_total"])
+            dados["valor_total"] = dados["valor_total"].replace(",", ".")
+            if "." not in dados["valor_total"]:
+                dados["valor_total"] += '.00'
     
     # Verifica o CNPJ/CPF do Consumidor e formata se necessário
-    if dados["CNPJ_CPF_consumidor"] is not None:
-        logger.info(f"❌ CPF/CNPJ do consumidor inválido.")
+    if dados.get("CNPJ_CPF_consumidor") is not None:
         if re.fullmatch(r"\d{11}|\d{14}", dados["CNPJ_CPF_consumidor"]):
             dados["CNPJ_CPF_consumidor"] = formatar_cnpj_cpf(dados["CNPJ_CPF_consumidor"])
         elif not re.fullmatch(r"\d{3}\.\d{3}\.\d{3}-\d{2}|\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}", dados["CNPJ_CPF_consumidor"]):
-            return 0
+            invalido("CNPJ_CPF_consumidor", "CPF/CNPJ do consumidor inválido.")
     
     # Verifica o CNPJ do Emissor e formata se necessário
-    if dados["CNPJ_emissor"] is not None:
+    if dados.get("CNPJ_emissor") is not None:
         if re.fullmatch(r"\d{14}", dados["CNPJ_emissor"]):
             dados["CNPJ_emissor"] = formatar_cnpj_cpf(dados["CNPJ_emissor"])
-        elif not re.fullmatch(r"\d{3}\.\d{3}\.\d{3}-\d{2}|\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}", dados["CNPJ_CPF_consumidor"]):
-            logger.info(f"❌ CNPJ do emissor inválido.")
-            return 0
+        elif not re.fullmatch(r"\d{2}\.\d{3}\.\d{3}/\d{4}-\d{2}", dados["CNPJ_emissor"]):
+            invalido("CNPJ_emissor", "CNPJ do emissor inválido.")
         
-    if dados["data_emissao"] is not None and not re.fullmatch(r"\d{2}/\d{2}/\d{4}", dados["data_emissao"]):
-        logger.info(f"❌ Data de emissão inválida.")
-        return 0
+    if dados.get("data_emissao") is not None and not re.fullmatch(r"\d{2}/\d{2}/\d{4}", dados["data_emissao"]):
+        invalido("data_emissao", "Data de emissão inválida.")
     
-    logger.info(f"✅ Validação bem sucedida.")
-    return 1
-
-# Processamento dos dados e refinamento com a LLM
-def processar_nota_com_llm(texto):
-    GROQ_API_KEY = "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"
+    if not invalidos:
+        logger.info(f"✅ Validação bem sucedida.")
+    return invalidos
 
-    client = Groq(api_key=GROQ_API_KEY)
-    
-    prompt = f'''
-Texto da nota fiscal:
+# Valida o formato da nota (1 se todos os campos são válidos, 0 caso contrário)
+def validar_nota_fiscal(dados, registro):
+    return 0 if campos_invalidos(dados, registro) else 1
 
-{texto}'''
-    
-    # Faz a chamada para a API da Groq e define a prompt
-    response = client.chat.completions.create(
-        model="llama3-8b-8192",
-        messages=[{"role": "system", "content": """
+# Prompt de sistema enviado em todas as chamadas
+SYSTEM_PROMPT = """
 Extraia os seguintes dados de uma nota fiscal e retorne em formato JSON:
 Nome do emissor, CNPJ do emissor, Endereço do emissor, CNPJ ou CPF do consumidor,
 Data de emissão, Número da nota fiscal, Valor total e Forma de pagamento.
@@ -172,45 +213,523 @@ Siga o Formato de Saída JSON desejado:
 }
                                       
 Não escreva nada além da saída em Json. Sem explicações ou textos adicionais. Não use { } no texto de saída.
-                   """},
-                  {"role": "user", "content": prompt}],
-        max_tokens=512
+                   """
+
+# Prompt usado para corrigir apenas os campos que falharam na validação
+SYSTEM_PROMPT_REPARO = """
+Corrija apenas os campos indicados de uma nota fiscal, usando o texto da nota.
+Responda somente com um JSON contendo exatamente as chaves pedidas, sem explicações.
+Se o valor não estiver no texto ou não seguir a regra do campo, use null. Não invente valores.
+"""
+
+# Regra de formato de cada campo, enviada no prompt de reparo
+REGRAS_CAMPOS = {
+    "nome_emissor": "nome da empresa emissora",
+    "CNPJ_emissor": "CNPJ no formato 00.000.000/0000-00",
+    "endereco_emissor": "endereço do emissor",
+    "CNPJ_CPF_consumidor": "CPF 000.000.000-00 ou CNPJ 00.000.000/0000-00",
+    "data_emissao": "data no formato DD/MM/AAAA",
+    "numero_nota_fiscal": "número com exatamente 6 ou 9 dígitos",
+    "serie_nota_fiscal": "número com exatamente 3 dígitos",
+    "valor_total": "valor no formato 0000.00",
+    "forma_pgto": "\"dinheiropix\" para Dinheiro ou PIX, \"outros\" para os demais",
+}
+
+# Prompt usado para extrair várias notas curtas em uma única chamada
+SYSTEM_PROMPT_AGRUPADO = SYSTEM_PROMPT + """
+Você receberá várias notas numeradas. Responda com um array JSON contendo um objeto no
+formato acima para cada nota, na mesma ordem. Use { } em cada objeto.
+"""
+
+# Versão do prompt: muda sempre que os prompts mudam, invalidando o cache da LLM
+PROMPT_VERSION = os.environ.get('LLM_PROMPT_VERSION') or hashlib.sha256(
+    (SYSTEM_PROMPT + SYSTEM_PROMPT_REPARO + SYSTEM_PROMPT_AGRUPADO + json.dumps(REGRAS_CAMPOS)).encode('utf-8')
+).hexdigest()[:12]
+
+# Cliente reutilizado entre invocações (conexão HTTP mantida aberta pelo keep-alive);
+# as novas tentativas são controladas por processar_nota_com_llm, não pelo SDK. O SDK da
+# Groq só é importado na primeira chamada: notas do cache e lotes (cliente assíncrono)
+# não pagam a importação nem a criação do cliente síncrono
+def criar_cliente():
+    from groq import Groq
+    return Groq(api_key=GROQ_API_KEY, max_retries=0, timeout=LLM_TIMEOUT)
+
+def criar_cliente_async():
+    from groq import AsyncGroq
+    return AsyncGroq(api_key=GROQ_API_KEY, max_retries=0, timeout=LLM_TIMEOUT)
+
+client = LazyClient(criar_cliente)
+
+# Monta as mensagens e o limite de tokens de uma chamada. Com campos informados, pede
+# apenas esses campos com o prompt de reparo (menor e com menos tokens de saída)
+def montar_mensagens(registro, campos=None):
+    prompt = f'''
+Texto da nota fiscal:
+
+{renderizar_nota(registro)}'''
+    system_prompt = SYSTEM_PROMPT
+    max_tokens = 512
+
+    if campos:
+        regras = "\n".join(f"- {campo}: {REGRAS_CAMPOS[campo]}" for campo in campos)
+        prompt += f"\n\nCampos a corrigir:\n{regras}"
+        system_prompt = SYSTEM_PROMPT_REPARO
+        max_tokens = 64 * len(campos)
+
+    mensagens = [{"role": "system", "content": system_prompt},
+                 {"role": "user", "content": prompt}]
+    return mensagens, max_tokens
+
+# Faz uma chamada à LLM e retorna o texto da resposta
+def chamar_llm(registro, timeout=LLM_TIMEOUT, campos=None):
+    mensagens, max_tokens = montar_mensagens(registro, campos)
+    
+    # Faz a chamada para a API da Groq e define a prompt
+    response = client.chat.completions.create(
+        model=LLM_MODEL,
+        messages=mensagens,
+        max_tokens=max_tokens,
+        timeout=timeout
     )
 
     # Pega a resposta gerada pelo modelo
-    resultado = response.choices[0].message.content
+    return response.choices[0].message.content
 
+# Converte a resposta da LLM em dicionário (None se não for um JSON válido)
+def interpretar_resposta(resultado):
     # Para evitar casos onde a LLM esqueceu os parênteses
     resultado = resultado.replace("{","")
     resultado = resultado.replace("}","")
     resultado = "{" + resultado + "\n}"
 
-    # Tenta transformar em Json se não for possível descarta a alteração da LLM
     try:
         dados_json = json.loads(resultado)
         logger.info(f"ℹ️ Tentativa da LLM:\n{resultado}")
-        if not validar_nota_fiscal(dados_json, texto):
-            logger.info(f"🔄 LLM iniciando nova tentativa.")
-            return processar_nota_com_llm(texto)
+        return dados_json
     except json.JSONDecodeError:
         logger.info(f"❌ Erro ao formatar json.")
-        logger.info(f"🔄 LLM iniciando nova tentativa.")
-        return processar_nota_com_llm(texto)
+        return None
+
+class MemoriaLLMCache:
+    """Cache LRU em memória, mantido entre invocações de um mesmo container"""
+
+    def __init__(self, max_entries=LLM_CACHE_MEMORIA, ttl=LLM_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry['created_at'] > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return entry['dados']
+
+    def put(self, key, dados):
+        with self.lock:
+            self.entries[key] = {'created_at': time.time(), 'dados': dados}
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
 
-    return dados_json
+class S3LLMCache:
+    """
+    Cache persistente guardado em um prefixo do bucket, separado por versão do prompt
+
+    Entradas de versões anteriores deixam de ser lidas e são apagadas pela regra de
+    ciclo de vida do prefixo cache/ no bucket (CACHE_TTL_DAYS).
+    """
+
+    def __init__(self, bucket_name, prefix=LLM_CACHE_PREFIX, ttl=LLM_CACHE_TTL):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _key(self, key):
+        return f"{self.prefix}{PROMPT_VERSION}/{key}.json"
+
+    def get(self, key):
+        try:
+            response = s3.get_object(Bucket=self.bucket_name, Key=self._key(key))
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None
+            raise
+        entry = json.loads(response['Body'].read())
+        if time.time() - entry['created_at'] > self.ttl:
+            return None
+        return entry['dados']
+
+    def put(self, key, dados):
+        s3.put_object(
+            Bucket=self.bucket_name,
+            Key=self._key(key),
+            Body=json.dumps({'created_at': time.time(), 'dados': dados}).encode('utf-8'),
+            ContentType='application/json'
+        )
+
+class SQLiteLLMCache:
+    """Cache persistente em SQLite local (testes e execução local)"""
+
+    def __init__(self, path=LLM_CACHE_DB, ttl=LLM_CACHE_TTL):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "chave TEXT PRIMARY KEY, versao TEXT, created_at REAL, dados TEXT)"
+            )
+            # Sem regra de ciclo de vida no disco: remove as entradas de versões do
+            # prompt diferentes da atual e as expiradas ao abrir o banco
+            self.connection.execute(
+                "DELETE FROM llm_cache WHERE versao != ? OR created_at < ?",
+                (PROMPT_VERSION, time.time() - self.ttl)
+            )
+
+    def get(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT created_at, dados FROM llm_cache WHERE chave = ? AND versao = ?",
+                (key, PROMPT_VERSION)
+            ).fetchone()
+        if row is None or time.time() - row[0] > self.ttl:
+            return None
+        return json.loads(row[1])
+
+    def put(self, key, dados):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?)",
+                (key, PROMPT_VERSION, time.time(), json.dumps(dados))
+            )
+
+memoria_cache = MemoriaLLMCache()
+_sqlite_cache = None
+
+def get_cache(bucket_name):
+    """Retorna o backend persistente configurado (ou None se desativado)"""
+    global _sqlite_cache
+    if LLM_CACHE == 'off':
+        return None
+    if LLM_CACHE == 'sqlite':
+        if _sqlite_cache is None:
+            _sqlite_cache = SQLiteLLMCache()
+        return _sqlite_cache
+    return S3LLMCache(bucket_name)
+
+def chave_cache(registro):
+    """Chave do cache: SHA-256 do texto enviado à LLM (espaços normalizados), do modelo e da versão do prompt"""
+    texto = " ".join(renderizar_nota(registro).split())
+    return hashlib.sha256(f"{LLM_MODEL}\n{PROMPT_VERSION}\n{texto}".encode('utf-8')).hexdigest()
+
+def buscar_no_cache(cache, chave):
+    dados = memoria_cache.get(chave)
+    if dados is None and cache is not None:
+        try:
+            dados = cache.get(chave)
+        except Exception as e:
+            logger.info(f"⚠️ Erro ao consultar o cache da LLM: {e}")
+            return None
+        if dados is not None:
+            memoria_cache.put(chave, dados)
+    return dados
+
+def salvar_no_cache(cache, chave, dados):
+    memoria_cache.put(chave, dados)
+    if cache is not None:
+        try:
+            cache.put(chave, dados)
+        except Exception as e:
+            logger.info(f"⚠️ Erro ao gravar no cache da LLM: {e}")
+
+# Monta o melhor resultado possível quando nenhuma tentativa da LLM foi validada: a
+# tentativa com mais campos válidos, com os inválidos nulos e as lacunas preenchidas
+# pelos campos válidos da etapa de regex
+def resultado_parcial(tentativas, registro):
+    def campos_validos(candidato):
+        dados = {campo: candidato.get(campo) for campo in CAMPOS_NOTA}
+        for campo in campos_invalidos(dados, registro):
+            dados[campo] = None
+        return dados
+
+    dados_regex = campos_validos(registro)
+    # Em caso de empate vale a tentativa mais recente, que já traz os campos corrigidos
+    dados = max(
+        (campos_validos(tentativa) for tentativa in reversed(tentativas)),
+        key=lambda dados: sum(valor is not None for valor in dados.values()),
+        default=dados_regex
+    )
+    for campo, valor in dados_regex.items():
+        if dados[campo] is None:
+            dados[campo] = valor
+    dados["forma_pgto"] = dados["forma_pgto"] or "outros"
+    return dados
+
+# Calcula o instante limite para novas tentativas a partir do tempo restante da Lambda
+def calcular_prazo(context):
+    if context is not None and hasattr(context, 'get_remaining_time_in_millis'):
+        restante = context.get_remaining_time_in_millis() / 1000 - LLM_MARGEM_SEGUNDOS
+    else:
+        restante = LLM_TEMPO_MAXIMO
+    return time.monotonic() + restante
+
+class TentativasLLM:
+    """
+    Estado das tentativas de uma nota: prazo, latências e campos pendentes. Depois da
+    primeira resposta interpretável, as novas tentativas pedem apenas os campos
+    inválidos e os mesclam aos campos já validados
+    """
+
+    def __init__(self, registro, context=None):
+        self.registro = registro
+        self.prazo = calcular_prazo(context)
+        self.latencias = []
+        self.invalidas = []
+        self.dados_atuais = None
+        self.pendentes = None
+        self.dados = None
+
+    def timeout(self):
+        """Timeout da próxima chamada (None quando o tempo ou as tentativas acabaram)"""
+        restante = self.prazo - time.monotonic()
+        if len(self.latencias) >= LLM_MAX_TENTATIVAS:
+            return None
+        if restante <= 0:
+            logger.info(f"⏱️ Tempo disponível para a LLM esgotado.")
+            return None
+        return min(LLM_TIMEOUT, restante)
+
+    def registrar(self, resultado, inicio):
+        """Registra a resposta de uma tentativa; retorna True quando a nota foi validada"""
+        self.latencias.append(round((time.monotonic() - inicio) * 1000))
+
+        dados_json = interpretar_resposta(resultado) if resultado else None
+        if dados_json is None or not isinstance(dados_json, dict):
+            return False
+        if self.pendentes:
+            # Mescla somente os campos pedidos aos campos já validados
+            dados_json = {**self.dados_atuais, **{campo: dados_json.get(campo) for campo in self.pendentes}}
+        invalidos = campos_invalidos(dados_json, self.registro)
+        if not invalidos:
+            self.dados = dados_json
+            return True
+        self.invalidas.append(dict(dados_json))
+        self.dados_atuais, self.pendentes = dados_json, invalidos
+        logger.info(f"ℹ️ Campos a corrigir na próxima tentativa: {self.pendentes}")
+        return False
+
+    def espera(self):
+        """Espera exponencial antes da próxima tentativa (None se não houver tempo)"""
+        espera = LLM_BACKOFF_SEGUNDOS * (2 ** (len(self.latencias) - 1))
+        if len(self.latencias) >= LLM_MAX_TENTATIVAS or time.monotonic() + espera >= self.prazo:
+            return None
+        logger.info(f"🔄 LLM iniciando nova tentativa em {espera:.1f}s.")
+        return espera
+
+    def resultado(self):
+        """Retorna (dados, métricas) da nota"""
+        if self.dados is not None:
+            return self.dados, {"tentativas": len(self.latencias), "latencias_ms": self.latencias, "status": "ok"}
+        logger.info(f"⚠️ Nenhuma tentativa da LLM foi validada, usando o melhor resultado parcial.")
+        metricas = {"tentativas": len(self.latencias), "latencias_ms": self.latencias, "status": "parcial"}
+        return resultado_parcial(self.invalidas, self.registro), metricas
+
+# Processamento dos dados e refinamento com a LLM, com número de tentativas e tempo limitados
+def processar_nota_com_llm(registro, context=None):
+    tentativas = TentativasLLM(registro, context)
+    while (timeout := tentativas.timeout()) is not None:
+        inicio = time.monotonic()
+        try:
+            resultado = chamar_llm(registro, timeout=timeout, campos=tentativas.pendentes)
+        except Exception as e:
+            logger.info(f"❌ Erro na chamada à LLM: {e}")
+            resultado = None
+        if tentativas.registrar(resultado, inicio):
+            break
+        espera = tentativas.espera()
+        if espera is None:
+            break
+        time.sleep(espera)
+    return tentativas.resultado()
+
+# Versão assíncrona de chamar_llm, usada no processamento em lote
+async def chamar_llm_async(async_client, registro, timeout=LLM_TIMEOUT, campos=None):
+    mensagens, max_tokens = montar_mensagens(registro, campos)
+    response = await async_client.chat.completions.create(
+        model=LLM_MODEL,
+        messages=mensagens,
+        max_tokens=max_tokens,
+        timeout=timeout
+    )
+    return response.choices[0].message.content
+
+# Sem semáforo (chamada fora de processar_lote_async), as chamadas não são limitadas
+async def processar_nota_com_llm_async(async_client, registro, context=None, semaforo=None):
+    if semaforo is None:
+        semaforo = contextlib.nullcontext()
+    tentativas = TentativasLLM(registro, context)
+    while (timeout := tentativas.timeout()) is not None:
+        inicio = time.monotonic()
+        try:
+            async with semaforo:
+                resultado = await chamar_llm_async(async_client, registro, timeout=timeout, campos=tentativas.pendentes)
+        except Exception as e:
+            logger.info(f"❌ Erro na chamada à LLM: {e}")
+            resultado = None
+        if tentativas.registrar(resultado, inicio):
+            break
+        espera = tentativas.espera()
+        if espera is None:
+            break
+        await asyncio.sleep(espera)
+    return tentativas.resultado()
+
+# Extrai um grupo de notas curtas em uma única chamada. Retorna, por nota, os dados
+# validados ou None (notas sem resposta válida voltam ao processamento individual)
+async def processar_grupo_async(async_client, registros, semaforo):
+    prompt = "\n\n".join(
+        f"Nota {indice}:\n{renderizar_nota(registro)}"
+        for indice, registro in enumerate(registros, start=1)
+    )
+
+    inicio = time.monotonic()
+    try:
+        async with semaforo:
+            response = await async_client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=[{"role": "system", "content": SYSTEM_PROMPT_AGRUPADO},
+                          {"role": "user", "content": prompt}],
+                max_tokens=512 * len(registros),
+                timeout=LLM_TIMEOUT
+            )
+        resultado = response.choices[0].message.content
+        respostas = json.loads(resultado[resultado.index("["):resultado.rindex("]") + 1])
+    except Exception as e:
+        logger.info(f"❌ Erro na chamada agrupada à LLM: {e}")
+        return [None] * len(registros)
+    latencia = round((time.monotonic() - inicio) * 1000)
+
+    saida = []
+    for indice, registro in enumerate(registros):
+        dados = respostas[indice] if indice < len(respostas) else None
+        if isinstance(dados, dict) and not campos_invalidos(dados, registro):
+            saida.append((dados, {"tentativas": 1, "latencias_ms": [latencia], "status": "ok", "agrupada": True}))
+        else:
+            saida.append(None)
+    return saida
+
+# Processa uma lista de registros em paralelo, com no máximo LLM_CONCORRENCIA chamadas
+# simultâneas. Com LLM_NOTAS_POR_PROMPT > 1, notas curtas são agrupadas em um só prompt
+async def processar_lote_async(registros, context=None):
+    semaforo = asyncio.Semaphore(LLM_CONCORRENCIA)
+    resultados = [None] * len(registros)
+
+    async with criar_cliente_async() as async_client:
+        if LLM_NOTAS_POR_PROMPT > 1:
+            curtas = [
+                indice for indice, registro in enumerate(registros)
+                if len(renderizar_nota(registro)) <= LLM_AGRUPAR_MAX_CARACTERES
+            ]
+            grupos = [curtas[i:i + LLM_NOTAS_POR_PROMPT] for i in range(0, len(curtas), LLM_NOTAS_POR_PROMPT)]
+            grupos = [grupo for grupo in grupos if len(grupo) > 1]
+            respostas = await asyncio.gather(*(
+                processar_grupo_async(async_client, [registros[indice] for indice in grupo], semaforo)
+                for grupo in grupos
+            ))
+            for grupo, resposta in zip(grupos, respostas):
+                for indice, resultado in zip(grupo, resposta):
+                    resultados[indice] = resultado
+
+        pendentes = [indice for indice, resultado in enumerate(resultados) if resultado is None]
+        individuais = await asyncio.gather(*(
+            processar_nota_com_llm_async(async_client, registros[indice], context, semaforo)
+            for indice in pendentes
+        ))
+        for indice, resultado in zip(pendentes, individuais):
+            resultados[indice] = resultado
+
+    return resultados
+
+# Ponto de entrada síncrono do processamento em lote: retorna (dados, métricas) por registro
+def processar_lote_com_llm(registros, context=None):
+    return asyncio.run(processar_lote_async(registros, context))
+
+# Processa um lote de notas ({"notas": [{"dados_nota", "file_name", "bucket_name"}, ...]}),
+# consultando o cache antes e chamando a LLM em paralelo só para as notas não encontradas
+def processar_evento_lote(event, context):
+    notas = event['notas']
+    logger.info(f"ℹ️ Processando lote de {len(notas)} notas.")
+    inicio = time.monotonic()
+
+    caches = [get_cache(nota['bucket_name']) for nota in notas]
+    chaves = [chave_cache(nota['dados_nota']) for nota in notas]
+    resultados = [buscar_no_cache(cache, chave) for cache, chave in zip(caches, chaves)]
+    metricas = [
+        {"tentativas": 0, "latencias_ms": [], "status": "cache"} if resultado is not None else None
+        for resultado in resultados
+    ]
+
+    pendentes = [indice for indice, resultado in enumerate(resultados) if resultado is None]
+    processados = processar_lote_com_llm([notas[indice]['dados_nota'] for indice in pendentes], context)
+    for indice, (resultado_json, metricas_nota) in zip(pendentes, processados):
+        resultados[indice], metricas[indice] = resultado_json, metricas_nota
+        if metricas_nota["status"] == "ok":
+            salvar_no_cache(caches[indice], chaves[indice], resultado_json)
+
+    logger.info(f"✅ Lote processado em {round((time.monotonic() - inicio) * 1000)} ms.")
+    return {
+        "resultados": [
+            {
+                "result_json": resultado_json,
+                "file_name": nota['file_name'],
+                "bucket_name": nota['bucket_name'],
+                "sha256": nota.get('sha256'),
+                "llm_metricas": metricas_nota
+            }
+            for nota, resultado_json, metricas_nota in zip(notas, resultados, metricas)
+        ]
+    }
 
 def lambda_handler(event, context):
-    logger.info(f"ℹ️ Importando dados da Lambda NLTK.")
+    if 'notas' in event:
+        return processar_evento_lote(event, context)
+
+    # Nota já resolvida pela etapa de regex (acontece quando esta etapa está fundida a ela)
+    if 'result_json' in event:
+        return event
+
+    logger.info(f"ℹ️ Importando dados da Lambda de regex.")
     file_name = event['file_name']
     bucket_name = event['bucket_name']
-    nota_texto = event['important_data']
-    logger.info(f"✅ Dados importados:\n{nota_texto}")
+    registro = event['dados_nota']
+    logger.info(f"✅ Dados importados:\n{registro}")
 
-    resultado_json = processar_nota_com_llm(nota_texto)
+    inicio = time.monotonic()
+    cache = get_cache(bucket_name)
+    chave = chave_cache(registro)
+    resultado_json = buscar_no_cache(cache, chave)
+    if resultado_json is not None:
+        logger.info(f"✅ Resultado da LLM encontrado no cache.")
+        metricas = {"tentativas": 0, "latencias_ms": [], "status": "cache"}
+    else:
+        resultado_json, metricas = processar_nota_com_llm(registro, context)
+        # Só resultados validados vão para o cache
+        if metricas["status"] == "ok":
+            salvar_no_cache(cache, chave, resultado_json)
+    metricas["latencia_ms"] = round((time.monotonic() - inicio) * 1000)
     logger.info(f"✅ JSON FINAL:\n{resultado_json}")
+    logger.info(f"ℹ️ Métricas da LLM: {metricas}")
     # Retorna o Json após o processo completo da LLM
     return {
         "result_json": resultado_json,
         "file_name": file_name,
-        "bucket_name": bucket_name
+        "bucket_name": bucket_name,
+        "sha256": event.get('sha256'),
+        "llm_metricas": metricas
     }
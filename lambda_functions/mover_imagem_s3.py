@@ -1,9 +1,111 @@
+import os
+import json
+import time
 import boto3
 import logging
+import threading
+from botocore.exceptions import ClientError
 
 logger = logging.getLogger()
 
-s3 = boto3.client('s3')
+class LazyClient:
+    """
+    Cliente criado no primeiro uso, fora da importação do módulo (cold start)
+
+    O lock garante um único cliente quando threads fazem o primeiro acesso ao mesmo tempo.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return getattr(self._client, name)
+
+s3 = LazyClient(lambda: boto3.client('s3'))
+
+# A imagem não é mais copiada para dinheiro/ ou outros/: o resultado da extração é
+# gravado em RESULTADOS_PREFIX (chave pelo SHA-256 da imagem) e a classificação vira um
+# registro pequeno em CLASSIFICACAO_PREFIX/<pasta>/, que aponta para a imagem original
+RESULTADOS_PREFIX = os.environ.get('RESULTADOS_PREFIX', 'resultados/')
+CLASSIFICACAO_PREFIX = os.environ.get('CLASSIFICACAO_PREFIX', 'classificacao/')
+
+# Índice das notas processadas, particionado por data de emissão e forma de pagamento
+# (indice/data_emissao=AAAA-MM-DD/forma_pgto=<forma>/). Cada nota grava uma parte JSONL
+# pequena; tools/indice.py compacta as partes de cada partição e consulta o índice.
+# Linhas com "removido" marcam notas que mudaram de partição
+INDICE_PREFIX = os.environ.get('INDICE_PREFIX', 'indice/')
+
+# Pasta de classificação de cada forma de pagamento
+PASTAS = {
+    "dinheiropix": "dinheiro",
+    "outros": "outros",
+}
+
+# Situação do resultado: "validado" quando resolvido pela regex (que só dispensa a LLM com
+# os campos válidos) ou validado pela LLM (status ok ou cache); "parcial" quando a LLM não
+# conseguiu validar todos os campos. Só resultados validados são reaproveitados pela API
+def status_resultado(event):
+    status_llm = (event.get("llm_metricas") or {}).get("status")
+    return "validado" if status_llm in (None, "ok", "cache") else "parcial"
+
+# Identificador da nota: SHA-256 da imagem ou, sem ele, a chave do arquivo sem "/"
+def identificador_nota(file_name, sha256=None):
+    return sha256 or file_name.replace("/", "_")
+
+# Lê o registro gravado no processamento anterior da nota (None na primeira vez)
+def ler_registro_anterior(bucket_name, resultado_key):
+    try:
+        response = s3.get_object(Bucket=bucket_name, Key=resultado_key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+    return json.loads(response['Body'].read())
+
+# Converte a data de emissão (DD/MM/AAAA) para a partição do índice (AAAA-MM-DD)
+def particao_data(data_emissao):
+    try:
+        dia, mes, ano = data_emissao.split("/")
+        return f"{int(ano):04d}-{int(mes):02d}-{int(dia):02d}"
+    except (AttributeError, ValueError):
+        return "desconhecida"
+
+# Partição do índice de um resultado
+def particao_indice(result_json):
+    return (
+        f"{INDICE_PREFIX}data_emissao={particao_data(result_json.get('data_emissao'))}/"
+        f"forma_pgto={result_json.get('forma_pgto') or 'outros'}/"
+    )
+
+def gravar_parte(bucket_name, key, linha):
+    s3.put_object(
+        Bucket=bucket_name,
+        Key=key,
+        Body=(json.dumps(linha, ensure_ascii=False) + "\n").encode('utf-8'),
+        ContentType='application/x-ndjson'
+    )
+
+# Grava a linha da nota no índice particionado. Se o reprocessamento mudou a partição
+# (data de emissão ou forma de pagamento), grava na partição anterior uma marca de
+# remoção mais recente, que substitui a parte antiga e anula a linha já compactada
+def gravar_indice(bucket_name, nota_id, registro, anterior=None):
+    result_json = registro["result_json"]
+    particao = particao_indice(result_json)
+    linha = {"id": nota_id, **{chave: registro[chave] for chave in ("file_name", "sha256", "processado_em")}}
+    linha.update(result_json)
+    gravar_parte(bucket_name, f"{particao}parte-{nota_id}.jsonl", linha)
+
+    if anterior and anterior.get("result_json"):
+        particao_anterior = particao_indice(anterior["result_json"])
+        if particao_anterior != particao:
+            remocao = {"id": nota_id, "removido": True, "processado_em": registro["processado_em"]}
+            gravar_parte(bucket_name, f"{particao_anterior}parte-{nota_id}.jsonl", remocao)
 
 def lambda_handler(event, context):
     try:
@@ -13,39 +115,61 @@ def lambda_handler(event, context):
 
         file_name = event["file_name"]
         bucket_name = event["bucket_name"]
+        sha256 = event.get("sha256")
 
         forma_pgto = result_json["forma_pgto"]
 
-        # Define a pasta de destino com base na forma de pagamento
-        destino_key = f"{forma_pgto}/{file_name}"
-
-        if forma_pgto == "dinheiropix":
-           destino_key = f"dinheiro/{file_name}"
+        # Define a pasta de classificação com base na forma de pagamento
+        pasta = PASTAS.get(forma_pgto, forma_pgto or "outros")
+        nota_id = identificador_nota(file_name, sha256)
+        resultado_key = f"{RESULTADOS_PREFIX}{nota_id}.json"
+        logger.info(f"ℹ️ Classificando {file_name} em {pasta}")
 
-        # Define a pasta de destino com base na forma de pagamento
-        logger.info(f"ℹ️ Definindo destino como {destino_key}")
+        # Reprocessamentos podem mudar a classificação da nota
+        anterior = ler_registro_anterior(bucket_name, resultado_key)
 
-        # Copia o arquivo para a pasta correspondente
-        logger.info(f"ℹ️ Copiando o arquivo para a pasta correspondente.")
-        s3.copy_object(
+        # Grava o resultado completo da extração
+        logger.info(f"ℹ️ Gravando o resultado em {resultado_key}.")
+        registro = {
+            "file_name": file_name,
+            "sha256": sha256,
+            "pasta": pasta,
+            "status": status_resultado(event),
+            # Sempre posterior ao processamento anterior, mesmo no mesmo segundo: a marca de
+            # remoção da partição anterior precisa ser mais recente que a linha antiga
+            "processado_em": max(int(time.time()), (anterior or {}).get("processado_em", 0) + 1),
+            "result_json": result_json
+        }
+        s3.put_object(
             Bucket=bucket_name,
-            CopySource={'Bucket': bucket_name, 'Key': file_name},
-            Key=destino_key
+            Key=resultado_key,
+            Body=json.dumps(registro, ensure_ascii=False).encode('utf-8'),
+            ContentType='application/json'
         )
 
-        # Remove o arquivo da pasta raiz
-        logger.info(f"ℹ️ Deletando o arquivo da pasta raiz.")
-        s3.delete_object(
+        # Grava o registro de classificação, lido no lugar das antigas pastas
+        s3.put_object(
             Bucket=bucket_name,
-            Key=file_name
+            Key=f"{CLASSIFICACAO_PREFIX}{pasta}/{nota_id}.json",
+            Body=json.dumps({"file_name": file_name, "resultado": resultado_key}).encode('utf-8'),
+            ContentType='application/json'
         )
 
+        # Remove o registro da pasta anterior, para a nota não aparecer nas duas
+        pasta_anterior = (anterior or {}).get("pasta")
+        if pasta_anterior and pasta_anterior != pasta:
+            logger.info(f"ℹ️ Nota reclassificada de {pasta_anterior} para {pasta}.")
+            s3.delete_object(Bucket=bucket_name, Key=f"{CLASSIFICACAO_PREFIX}{pasta_anterior}/{nota_id}.json")
+
+        # Acrescenta a nota ao índice consultável
+        gravar_indice(bucket_name, nota_id, registro, anterior)
+
         # Retorna os dados para a próxima etapa
-        logger.info(f"ℹ️ Deletando o arquivo da pasta raiz.")
+        logger.info(f"✅ Nota classificada em {pasta}.")
         return result_json
 
     except Exception as e:
         logger.info(f"❌ Erro de exceção...")
         return {
             "error": str(e)  # Retorna um erro caso ocorra uma exceção
-        }
\ No newline at end of file
+        }
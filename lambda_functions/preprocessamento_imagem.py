@@ -0,0 +1,136 @@
+import io
+import os
+import hashlib
+import logging
+import boto3
+import threading
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+class LazyClient:
+    """
+    Cliente criado no primeiro uso, fora da importação do módulo (cold start)
+
+    O lock garante um único cliente quando threads fazem o primeiro acesso ao mesmo tempo.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return getattr(self._client, name)
+
+s3 = LazyClient(lambda: boto3.client('s3'))
+
+# Pré-processamento das fotos antes do Textract: corrige a orientação (EXIF), recorta a
+# área clara do cupom, converte para tons de cinza, reduz para PREPROC_DPI considerando a
+# largura de um cupom (PREPROC_LARGURA_MM) e regrava como JPEG. O derivado fica em
+# DERIVADOS_PREFIX, com chave pelo SHA-256 da imagem original; a original não é alterada
+DERIVADOS_PREFIX = os.environ.get('DERIVADOS_PREFIX', 'derivados/')
+PREPROC_DPI = int(os.environ.get('PREPROC_DPI', '300'))
+PREPROC_LARGURA_MM = float(os.environ.get('PREPROC_LARGURA_MM', '80'))
+PREPROC_QUALIDADE = int(os.environ.get('PREPROC_QUALIDADE', '85'))
+# Pixels acima deste tom (0-255, após o autocontraste) são considerados papel no recorte
+PREPROC_LIMIAR_PAPEL = int(os.environ.get('PREPROC_LIMIAR_PAPEL', '160'))
+# Recortes menores que esta fração da imagem são descartados (provável erro de detecção)
+PREPROC_AREA_MINIMA = float(os.environ.get('PREPROC_AREA_MINIMA', '0.2'))
+PREPROC_MARGEM = 0.02
+
+# PDFs e TIFFs (multipágina) seguem direto para o job assíncrono do Textract
+EXTENSOES_IMAGEM = ('.png', '.jpg', '.jpeg')
+
+def largura_alvo():
+    """Largura em pixels do cupom na resolução desejada"""
+    return round(PREPROC_LARGURA_MM / 25.4 * PREPROC_DPI)
+
+def area_do_cupom(imagem):
+    """Retorna a caixa (esquerda, topo, direita, base) da área clara da imagem, ou None"""
+    from PIL import ImageOps
+
+    mascara = ImageOps.autocontrast(imagem).point(lambda tom: 255 if tom > PREPROC_LIMIAR_PAPEL else 0)
+    caixa = mascara.getbbox()
+    if not caixa:
+        return None
+
+    largura, altura = imagem.size
+    esquerda, topo, direita, base = caixa
+    if (direita - esquerda) * (base - topo) < PREPROC_AREA_MINIMA * largura * altura:
+        return None
+
+    margem_x, margem_y = int(largura * PREPROC_MARGEM), int(altura * PREPROC_MARGEM)
+    return (
+        max(0, esquerda - margem_x),
+        max(0, topo - margem_y),
+        min(largura, direita + margem_x),
+        min(altura, base + margem_y),
+    )
+
+def preprocessar_imagem(conteudo):
+    """Aplica orientação, recorte, tons de cinza e redução; retorna os bytes do JPEG derivado"""
+    # Pillow vem do layer PILLOW; importado aqui para o módulo carregar sem ele
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(conteudo)) as original:
+        imagem = ImageOps.exif_transpose(original).convert('L')
+
+    caixa = area_do_cupom(imagem)
+    if caixa:
+        imagem = imagem.crop(caixa)
+
+    largura, altura = imagem.size
+    alvo = largura_alvo()
+    if largura > alvo:
+        imagem = imagem.resize((alvo, max(1, round(altura * alvo / largura))), Image.LANCZOS)
+
+    saida = io.BytesIO()
+    imagem.save(saida, format='JPEG', quality=PREPROC_QUALIDADE, optimize=True, dpi=(PREPROC_DPI, PREPROC_DPI))
+    return saida.getvalue()
+
+def derivado_existe(bucket_name, key):
+    try:
+        s3.head_object(Bucket=bucket_name, Key=key)
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return False
+        raise
+
+def lambda_handler(event, context):
+    bucket_name = event['bucket_name']
+    file_name = event['file_name']
+
+    if not file_name.lower().endswith(EXTENSOES_IMAGEM):
+        logger.info(f"ℹ️ {file_name} não é uma imagem; seguindo sem pré-processamento.")
+        return event
+
+    try:
+        conteudo = s3.get_object(Bucket=bucket_name, Key=file_name)['Body'].read()
+        # O SHA-256 da original segue no evento: o cache do Textract continua pela imagem enviada
+        sha256 = event.get('sha256') or hashlib.sha256(conteudo).hexdigest()
+        derivado_key = f"{DERIVADOS_PREFIX}{sha256}.jpg"
+
+        if derivado_existe(bucket_name, derivado_key):
+            logger.info(f"ℹ️ Derivado de {file_name} já existe em {derivado_key}.")
+            return {**event, 'sha256': sha256, 'textract_key': derivado_key}
+
+        derivado = preprocessar_imagem(conteudo)
+        if len(derivado) >= len(conteudo):
+            logger.info(f"ℹ️ Derivado de {file_name} não é menor que a original; usando a original.")
+            return {**event, 'sha256': sha256}
+
+        s3.put_object(Bucket=bucket_name, Key=derivado_key, Body=derivado, ContentType='image/jpeg')
+        logger.info(f"✅ {file_name} pré-processada: {len(conteudo)} -> {len(derivado)} bytes ({derivado_key}).")
+        return {**event, 'sha256': sha256, 'textract_key': derivado_key}
+
+    except Exception as e:
+        # O pré-processamento é opcional: em caso de falha o Textract lê a original
+        logger.warning(f"⚠️ Falha no pré-processamento de {file_name}: {e}")
+        return event
@@ -1,5 +1,7 @@
 import re
+import os
 import json
+import time
 import logging
 
 logger = logging.getLogger()
@@ -16,48 +18,253 @@ REGEX_PATTERNS = {
     "VALOR": r"TOTAL R\$ :\s*([\d,.]+)",
     "FORMA_PGTO": r"\b(Pix|Dinheiro|Cartão|Crédito|Débito)\b"}
 
-# Extrai um campo usando regex e retorna o primeiro valor encontrado ou um valor default.
-def extract_field(pattern, text, default="<none>"):
-    match = re.search(pattern, text, re.IGNORECASE)
-    return match.group(0) if match else default
+# Padrões compilados uma única vez, na importação do módulo
+COMPILED_PATTERNS = {campo: re.compile(padrao, re.IGNORECASE) for campo, padrao in REGEX_PATTERNS.items()}
 
-# Processa o texto da nota fiscal e extrai os dados na ordem correta.
+# Campos localizados por um literal âncora: o literal é buscado no texto em minúsculas
+# (str.find) e o padrão só é testado (match) na posição de cada ocorrência.
+# Valor: (literal, deslocamento do literal em relação ao início do match)
+ANCHORED_FIELDS = {
+    "DATA": ("/", 2),
+    "SERIE_NF": ("sat no", 0),
+    "VALOR": ("total r$ :", 0),
+}
+
+# Campos sem literal âncora, buscados diretamente com o padrão compilado. O endereço
+# só é buscado quando o texto contém "cep", evitando o backtracking do padrão
+SEARCHED_FIELDS = ("CNPJ", "ENDERECO_EMISSOR", "CPF", "NUMERO_NF")
+FIELD_PREFILTERS = {"ENDERECO_EMISSOR": "cep"}
+
+# Forma de pagamento só é usada em minúsculas, então é buscada no texto já convertido
+FORMA_PGTO_PATTERN = re.compile(r"\b(pix|dinheiro|cartão|crédito|débito)\b")
+RUN_PATTERN = re.compile(r"[\w\s]+")
+LTDA_LITERAL = " ltda"
+
+# Notas com todos os campos presentes e válidos (confiança >= mínima) seguem direto para
+# a etapa final, sem passar pela LLM
+DISPENSAR_LLM = os.environ.get('REGEX_DISPENSAR_LLM', 'true').lower() == 'true'
+CONFIANCA_MINIMA = float(os.environ.get('REGEX_CONFIANCA_MINIMA', '1.0'))
+METRICAS_NAMESPACE = os.environ.get('METRICAS_NAMESPACE', 'NotasFiscais')
+
+# Formato esperado de cada campo do registro (None: basta estar presente)
+FORMATOS_CAMPOS = {
+    "nome_emissor": None,
+    "CNPJ_emissor": re.compile(r"\d{14}"),
+    "endereco_emissor": None,
+    "CNPJ_CPF_consumidor": re.compile(r"\d{11}|\d{14}"),
+    "data_emissao": re.compile(r"(0[1-9]|[12]\d|3[01])/(0[1-9]|1[0-2])/\d{4}"),
+    "numero_nota_fiscal": re.compile(r"\d{6}|\d{9}"),
+    "serie_nota_fiscal": re.compile(r"\d{3}"),
+    "valor_total": re.compile(r"\d+(\.\d{2})?"),
+    "forma_pgto": re.compile(r"dinheiropix|outros"),
+}
+
+# Campos que precisam ser válidos para dispensar a LLM, qualquer que seja a confiança mínima
+CAMPOS_DISPENSA = ("CNPJ_emissor", "CNPJ_CPF_consumidor", "valor_total")
+
+# Retorna as posições de todas as ocorrências de um literal no texto.
+def find_all(text, literal):
+    positions = []
+    position = text.find(literal)
+    while position >= 0:
+        positions.append(position)
+        position = text.find(literal, position + 1)
+    return positions
+
+# Localiza o primeiro match de um padrão testando apenas as posições do literal âncora.
+def match_anchored(pattern, text, lowered, literal, offset):
+    for position in find_all(lowered, literal):
+        if position >= offset:
+            match = pattern.match(text, position - offset)
+            if match:
+                return match.group(0)
+    return None
+
+# Equivalente linear de NOME_EMISSOR ("([\w\s]+) LTDA"): o match começa no início do
+# primeiro trecho de [\w\s] que contém " LTDA" (após ao menos um caractere) e termina
+# na última ocorrência de " LTDA" desse trecho, sem o backtracking quadrático do padrão.
+def scan_nome_emissor(text, lowered):
+    occurrences = find_all(lowered, LTDA_LITERAL)
+    if not occurrences:
+        return None
+    for run in RUN_PATTERN.finditer(text):
+        start, end = run.span()
+        inside = [position for position in occurrences if start + 1 <= position <= end - len(LTDA_LITERAL)]
+        if inside:
+            return text[start:inside[-1] + len(LTDA_LITERAL)]
+        if end > occurrences[-1]:
+            break
+    return None
+
+# Extrai os campos da nota com os padrões pré-compilados: o nome e os campos de
+# ANCHORED_FIELDS são testados só nas posições dos literais; os de SEARCHED_FIELDS e a
+# forma de pagamento são buscados no texto. Retorna o primeiro valor encontrado de cada
+# campo (o mesmo de um re.search por padrão de REGEX_PATTERNS) ou None.
+def scan_fields(text):
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # Alguns caracteres Unicode mudam de tamanho em lower(); as posições das âncoras
+        # deixariam de corresponder ao texto original
+        fields = {}
+        for campo, pattern in COMPILED_PATTERNS.items():
+            match = pattern.search(text)
+            fields[campo] = match.group(0) if match else None
+        return fields
+
+    fields = {"NOME_EMISSOR": scan_nome_emissor(text, lowered)}
+
+    for campo in SEARCHED_FIELDS:
+        prefilter = FIELD_PREFILTERS.get(campo)
+        match = None
+        if prefilter is None or prefilter in lowered:
+            match = COMPILED_PATTERNS[campo].search(text)
+        fields[campo] = match.group(0) if match else None
+
+    for campo, (literal, offset) in ANCHORED_FIELDS.items():
+        fields[campo] = match_anchored(COMPILED_PATTERNS[campo], text, lowered, literal, offset)
+
+    match = FORMA_PGTO_PATTERN.search(lowered)
+    fields["FORMA_PGTO"] = match.group(0) if match else None
+    return fields
+
+# Mantém apenas os dígitos de um CNPJ/CPF.
+def somente_digitos(valor):
+    return re.sub(r"\D", "", valor) if valor is not None else None
+
+# Converte o valor total ("TOTAL R$ : 1.234,56") para decimal com ponto ("1234.56").
+def normalizar_valor(valor):
+    if valor is None:
+        return None
+    numero = valor.split(":", 1)[-1].strip()
+    if "," in numero:
+        numero = numero.replace(".", "").replace(",", ".")
+    return numero or None
+
+# Processa o texto da nota fiscal e monta o registro da nota, com as mesmas chaves do JSON
+# final. Campos não encontrados ficam como None.
 def processar_nota(text):
     logger.info("🔄 Iniciando processamento da nota fiscal.")
-    
-    forma_pgto = extract_field(REGEX_PATTERNS["FORMA_PGTO"], text, "Outros")
-    forma_pgto = "dinheiroPix" if forma_pgto.lower() in ["pix", "dinheiro"] else "outros"
-
-    structured_data = {
-        "Nome do Emissor": extract_field(REGEX_PATTERNS["NOME_EMISSOR"], text),
-        "CNPJ do Emissor": extract_field(REGEX_PATTERNS["CNPJ"], text),
-        "Endereço do Emissor": extract_field(REGEX_PATTERNS["ENDERECO_EMISSOR"], text),
-        "CNPJ/CPF do Consumidor": extract_field(REGEX_PATTERNS["CPF"], text),
-        "Data de Emissão": extract_field(REGEX_PATTERNS["DATA"], text),
-        "Número da Nota Fiscal": extract_field(REGEX_PATTERNS["NUMERO_NF"], text),
-        "Série da Nota Fiscal": extract_field(REGEX_PATTERNS["SERIE_NF"], text),
-        "Valor Total": extract_field(REGEX_PATTERNS["VALOR"], text),
-        "Forma de Pagamento": forma_pgto
+
+    fields = scan_fields(text)
+
+    forma_pgto = (fields["FORMA_PGTO"] or "").lower()
+    forma_pgto = "dinheiropix" if forma_pgto in ["pix", "dinheiro"] else "outros"
+
+    registro = {
+        "nome_emissor": fields["NOME_EMISSOR"],
+        "CNPJ_emissor": somente_digitos(fields["CNPJ"]),
+        "endereco_emissor": fields["ENDERECO_EMISSOR"],
+        "CNPJ_CPF_consumidor": somente_digitos(fields["CPF"]),
+        "data_emissao": fields["DATA"],
+        "numero_nota_fiscal": fields["NUMERO_NF"],
+        # O padrão da série termina nos três dígitos capturados
+        "serie_nota_fiscal": fields["SERIE_NF"][-3:] if fields["SERIE_NF"] else None,
+        "valor_total": normalizar_valor(fields["VALOR"]),
+        "forma_pgto": forma_pgto
     }
-    logger.info(f"✅ Dados extraídos com sucesso: {structured_data}")
-    return structured_data
+    logger.info(f"✅ Dados extraídos com sucesso: {registro}")
+    return registro
+
+
+# Confere os dígitos verificadores de um CPF (11 dígitos) ou CNPJ (14 dígitos)
+def documento_valido(digitos):
+    if len(set(digitos)) == 1:
+        return False
+    if len(digitos) == 11:
+        pesos = [list(range(10, 1, -1)), list(range(11, 1, -1))]
+    else:
+        pesos = [[5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]]
+    for posicao, peso in zip((len(digitos) - 2, len(digitos) - 1), pesos):
+        resto = sum(int(d) * p for d, p in zip(digitos, peso)) % 11
+        if int(digitos[posicao]) != (0 if resto < 2 else 11 - resto):
+            return False
+    return True
+
+# Confere se o campo está presente, no formato esperado e, para CNPJ/CPF, com dígitos
+# verificadores corretos
+def campo_valido(campo, valor):
+    formato = FORMATOS_CAMPOS[campo]
+    if valor is None or (formato is not None and not formato.fullmatch(valor)):
+        return False
+    if campo in ("CNPJ_emissor", "CNPJ_CPF_consumidor") and not documento_valido(valor):
+        return False
+    return True
 
+# Calcula a confiança do registro: fração dos campos válidos
+def calcular_confianca(registro):
+    validos = sum(campo_valido(campo, registro.get(campo)) for campo in FORMATOS_CAMPOS)
+    return round(validos / len(FORMATOS_CAMPOS), 2)
+
+# A LLM só é dispensada com confiança suficiente e com os campos que montar_resultado
+# formata (documentos e valor) válidos, mesmo com REGEX_CONFIANCA_MINIMA abaixo de 1.0
+def pode_dispensar_llm(registro, confianca):
+    if not DISPENSAR_LLM or confianca < CONFIANCA_MINIMA:
+        return False
+    return all(campo_valido(campo, registro.get(campo)) for campo in CAMPOS_DISPENSA)
+
+def formatar_cnpj_cpf(valor):
+    if valor is None:
+        return None
+    if len(valor) == 14:
+        return f"{valor[:2]}.{valor[2:5]}.{valor[5:8]}/{valor[8:12]}-{valor[12:]}"
+    elif len(valor) == 11:
+        return f"{valor[:3]}.{valor[3:6]}.{valor[6:9]}-{valor[9:]}"
+    return valor
+
+# Monta o JSON final a partir do registro, no mesmo formato produzido pela etapa da LLM
+def montar_resultado(registro):
+    resultado = dict(registro)
+    resultado["CNPJ_emissor"] = formatar_cnpj_cpf(registro["CNPJ_emissor"])
+    resultado["CNPJ_CPF_consumidor"] = formatar_cnpj_cpf(registro["CNPJ_CPF_consumidor"])
+    valor = registro.get("valor_total")
+    if valor is not None:
+        valor = re.sub(r'^0+(\d+)', r'\1', valor)
+        resultado["valor_total"] = valor if "." in valor else valor + ".00"
+    return resultado
+
+# Publica no CloudWatch (Embedded Metric Format) a confiança e se a LLM foi dispensada;
+# a média de LLMDispensada é a taxa de notas que não passam pela LLM
+def publicar_metricas(confianca, dispensada):
+    print(json.dumps({
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [{
+                "Namespace": METRICAS_NAMESPACE,
+                "Dimensions": [[]],
+                "Metrics": [
+                    {"Name": "ConfiancaRegex", "Unit": "None"},
+                    {"Name": "LLMDispensada", "Unit": "Count"},
+                ]
+            }]
+        },
+        "ConfiancaRegex": confianca,
+        "LLMDispensada": int(dispensada),
+    }))
 
 # Função principal executada pela AWS Lambda. Recebe o evento com os dados da nota fiscal,
-# processa as informações extraindo os campos relevantes e retorna os dados formatados.
+# processa as informações extraindo os campos relevantes e retorna o registro da nota.
 def lambda_handler(event, context):
     logger.info("🔄 Recebendo evento Lambda.")
     data = event["important_data"]
     
     logger.info("🔄 Extraindo dados da nota fiscal.")
-    dados_extraidos = processar_nota(data)
+    dados_nota = processar_nota(data)
+    confianca = calcular_confianca(dados_nota)
 
-    important_data = "\n".join([f"{chave}: {valor}" for chave, valor in dados_extraidos.items()])
-
-    logger.info("✅ Extração concluída com sucesso.")
-    return{
+    logger.info(f"✅ Extração concluída com sucesso (confiança {confianca}).")
+    output = {
         "statusCode": 200,
-        "important_data": important_data,
+        "dados_nota": dados_nota,
+        "confianca": confianca,
         "file_name": event["file_name"],
         "bucket_name": event["bucket_name"],
-    }
\ No newline at end of file
+        "sha256": event.get("sha256"),
+    }
+
+    # Nota completa e válida: o resultado final já sai desta etapa e a LLM é dispensada
+    dispensada = pode_dispensar_llm(dados_nota, confianca)
+    if dispensada:
+        logger.info("ℹ️ Nota completa, dispensando a etapa da LLM.")
+        output["result_json"] = montar_resultado(dados_nota)
+    publicar_metricas(confianca, dispensada)
+    return output
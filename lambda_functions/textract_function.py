@@ -1,25 +1,196 @@
 import boto3
 import json
 import logging
+import os
+import time
+import base64
+import hashlib
+import tempfile
+import threading
+from botocore.exceptions import ClientError
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-client = boto3.client("textract", region_name="us-east-1")
+class LazyClient:
+    """
+    Cliente criado no primeiro uso, fora da importação do módulo (cold start)
 
-def process_document(bucket_name, object_name):
+    O lock garante um único cliente quando threads fazem o primeiro acesso ao mesmo tempo.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._client = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return getattr(self._client, name)
+
+# Respostas do cache não chamam o Textract, então os clientes só são criados quando necessário
+client = LazyClient(lambda: boto3.client("textract", region_name="us-east-1"))
+s3 = LazyClient(lambda: boto3.client("s3"))
+
+# Configuração do cache de resultados do Textract (chaveado pelo SHA-256 da imagem)
+TEXTRACT_CACHE = os.environ.get('TEXTRACT_CACHE', 's3')  # s3, local ou off
+TEXTRACT_CACHE_PREFIX = os.environ.get('TEXTRACT_CACHE_PREFIX', 'cache/textract/')
+TEXTRACT_CACHE_DIR = os.environ.get('TEXTRACT_CACHE_DIR', '/tmp/textract-cache')
+TEXTRACT_CACHE_TTL = int(os.environ.get('TEXTRACT_CACHE_TTL', str(30 * 24 * 3600)))
+TEXTRACT_CACHE_MAX_BYTES = int(os.environ.get('TEXTRACT_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))  # só o cache local
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Perfis de extração: API do Textract e recursos solicitados. O pipeline só consome
+# blocos LINE, então o padrão é o detect_document_text (mais barato e mais rápido)
+TEXTRACT_PROFILES = {
+    'linhas': {'api': 'detect_document_text', 'feature_types': None},
+    'formularios': {'api': 'analyze_document', 'feature_types': ['FORMS']},
+    'tabelas': {'api': 'analyze_document', 'feature_types': ['TABLES']},
+    'formularios_tabelas': {'api': 'analyze_document', 'feature_types': ['FORMS', 'TABLES']},
+}
+TEXTRACT_PROFILE = os.environ.get('TEXTRACT_PROFILE', 'linhas')
+
+# Documentos grandes (acima do limite síncrono de 5 MB) e PDFs/TIFFs multipágina usam
+# as APIs assíncronas; a Step Function aguarda e consulta o job até o término
+TEXTRACT_SYNC_MAX_BYTES = int(os.environ.get('TEXTRACT_SYNC_MAX_BYTES', str(5 * 1024 * 1024)))
+TEXTRACT_ASYNC_EXTENSIONS = ('.pdf', '.tif', '.tiff')
+TEXTRACT_MAX_POLLS = int(os.environ.get('TEXTRACT_MAX_POLLS', '60'))
+TEXTRACT_PAGE_SIZE = 1000
+
+class TextractError(Exception):
+    """Falha ao extrair o texto do documento
+
+    A exceção faz a Task falhar (erro "TextractError" na Step Function): no lote, o
+    Catch recebe a entrada da Task, que ainda contém o file_name do arquivo.
+    """
+
+class S3TextractCache:
+    """
+    Cache das linhas extraídas guardado em um prefixo do próprio bucket
+
+    Sem limite de tamanho: as entradas são removidas pela regra de expiração do prefixo
+    cache/ (CACHE_TTL_DAYS), configurada no deploy.
+    """
+
+    def __init__(self, bucket_name, prefix=TEXTRACT_CACHE_PREFIX, ttl=TEXTRACT_CACHE_TTL):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def get(self, key):
+        try:
+            response = s3.get_object(Bucket=self.bucket_name, Key=f"{self.prefix}{key}.json")
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                return None
+            raise
+        entry = json.loads(response['Body'].read())
+        if time.time() - entry['created_at'] > self.ttl:
+            return None
+        return entry['lines']
+
+    def put(self, key, lines):
+        s3.put_object(
+            Bucket=self.bucket_name,
+            Key=f"{self.prefix}{key}.json",
+            Body=json.dumps({'created_at': time.time(), 'lines': lines}).encode('utf-8'),
+            ContentType='application/json'
+        )
+
+class LocalDiskTextractCache:
+    """Cache das linhas extraídas em disco local (testes e execução local)"""
+
+    def __init__(self, directory=TEXTRACT_CACHE_DIR, ttl=TEXTRACT_CACHE_TTL, max_bytes=TEXTRACT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        if time.time() - entry['created_at'] > self.ttl:
+            os.remove(path)
+            return None
+        # Atualiza o horário de acesso para a remoção priorizar entradas menos usadas
+        os.utime(path)
+        return entry['lines']
+
+    def put(self, key, lines):
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as f:
+            json.dump({'created_at': time.time(), 'lines': lines}, f)
+        os.replace(temp_path, self._path(key))
+        self.evict()
+
+    def evict(self):
+        """Remove as entradas menos usadas até o diretório caber em max_bytes"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                stat = os.stat(os.path.join(self.directory, name))
+                entries.append((stat.st_mtime, stat.st_size, name))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.directory, name))
+            total -= size
+
+def get_cache(bucket_name):
+    """Retorna o backend de cache configurado (ou None se desativado)"""
+    if TEXTRACT_CACHE == 'off':
+        return None
+    if TEXTRACT_CACHE == 'local':
+        return LocalDiskTextractCache()
+    return S3TextractCache(bucket_name)
+
+def get_document_sha256(bucket_name, object_name, event=None, head=None):
+    """Obtém o SHA-256 da imagem, evitando baixá-la quando o S3 já guarda o checksum"""
+    if event and event.get('sha256'):
+        return event['sha256']
+
+    if head is None:
+        head = s3.head_object(Bucket=bucket_name, Key=object_name, ChecksumMode='ENABLED')
+    checksum = head.get('ChecksumSHA256')
+    # Checksums de uploads multipart são compostos ("<hash>-<partes>") e não servem como chave
+    if checksum and '-' not in checksum:
+        return base64.b64decode(checksum).hex()
+
+    sha256 = hashlib.sha256()
+    body = s3.get_object(Bucket=bucket_name, Key=object_name)['Body']
+    for chunk in iter(lambda: body.read(HASH_CHUNK_SIZE), b''):
+        sha256.update(chunk)
+    return sha256.hexdigest()
+
+def process_document(bucket_name, object_name, profile=TEXTRACT_PROFILE):
     try:
-        logger.info(f"Processando o documento {object_name} no bucket {bucket_name}")
-        # Chama o Textract diretamente para processar o documento no S3
-        response = client.analyze_document(
-            Document={
+        logger.info(f"Processando o documento {object_name} no bucket {bucket_name} (perfil {profile})")
+        profile_config = TEXTRACT_PROFILES[profile]
+        params = {
+            'Document': {
                 'S3Object': {
                     'Bucket': bucket_name,
                     'Name': object_name
                 }
-            },
-            FeatureTypes=['FORMS', 'TABLES']
-        )
+            }
+        }
+        if profile_config['feature_types']:
+            params['FeatureTypes'] = profile_config['feature_types']
+
+        # Chama o Textract diretamente para processar o documento no S3
+        response = getattr(client, profile_config['api'])(**params)
         logger.info(f"Documento processado com sucesso: {object_name}")
         # Retorna a resposta completa do Textract
         return response
@@ -28,6 +199,59 @@ def process_document(bucket_name, object_name):
         logger.info(f"Erro ao processar o documento no S3: {e}")
         return None
 
+def requires_async_job(object_name, size):
+    """Verifica se o documento precisa das APIs assíncronas do Textract"""
+    return object_name.lower().endswith(TEXTRACT_ASYNC_EXTENSIONS) or size > TEXTRACT_SYNC_MAX_BYTES
+
+def start_document_job(bucket_name, object_name, profile=TEXTRACT_PROFILE):
+    """Inicia um job assíncrono do Textract e retorna (JobId, API usada)"""
+    profile_config = TEXTRACT_PROFILES[profile]
+    params = {
+        'DocumentLocation': {
+            'S3Object': {
+                'Bucket': bucket_name,
+                'Name': object_name
+            }
+        }
+    }
+    if profile_config['feature_types']:
+        params['FeatureTypes'] = profile_config['feature_types']
+        response = client.start_document_analysis(**params)
+        api = 'analysis'
+    else:
+        response = client.start_document_text_detection(**params)
+        api = 'text_detection'
+
+    logger.info(f"Job assíncrono do Textract iniciado para {object_name}: {response['JobId']}")
+    return response['JobId'], api
+
+def get_job_page(job_id, api, next_token=None):
+    """Obtém uma página do resultado de um job assíncrono"""
+    params = {'JobId': job_id, 'MaxResults': TEXTRACT_PAGE_SIZE}
+    if next_token:
+        params['NextToken'] = next_token
+    if api == 'analysis':
+        return client.get_document_analysis(**params)
+    return client.get_document_text_detection(**params)
+
+def iter_job_blocks(job_id, api, first_page=None):
+    """Percorre os blocos de um job página a página (NextToken), sem acumular as respostas"""
+    page = first_page or get_job_page(job_id, api)
+    while True:
+        yield from page.get('Blocks', [])
+        next_token = page.get('NextToken')
+        if not next_token:
+            break
+        page = get_job_page(job_id, api, next_token)
+
+def extract_lines(blocks):
+    """Extrai o texto dos blocos LINE de um iterável de blocos"""
+    return [
+        block["Text"]
+        for block in blocks
+        if block.get("BlockType") == "LINE" and "Text" in block
+    ]
+
 def extract_important_data(textract_response):
     #Filtra e exibe apenas as informações importantes extraídas de uma nota fiscal.
     logger.info("Extraindo dados importantes do documento processado")
@@ -35,39 +259,114 @@ def extract_important_data(textract_response):
         print("Nenhuma resposta do Textract foi retornada.")
         return
 
-    important_data = []
+    # Extrai apenas o texto relevante
+    return extract_lines(textract_response.get("Blocks", []))
+
+def save_to_cache(cache, sha256, important_data):
+    """Grava as linhas no cache sem interromper o processamento em caso de falha"""
+    if cache and sha256:
+        try:
+            cache.put(sha256, important_data)
+        except Exception as e:
+            logger.warning(f"Falha ao gravar o cache do Textract: {e}")
+
+def build_output(event, important_data, sha256):
+    """Monta a saída do estado com o texto extraído"""
+    return {
+        'important_data': "\n".join(important_data),
+        'file_name': event['file_name'],
+        'bucket_name': event['bucket_name'],
+        'sha256': sha256
+    }
+
+def poll_document_job(event):
+    """Consulta um job assíncrono; enquanto não terminar devolve o evento para nova espera"""
+    job_id = event['textract_job_id']
+    api = event['textract_api']
+    polls = event.get('textract_polls', 0) + 1
+
+    first_page = get_job_page(job_id, api)
+    status = first_page['JobStatus']
+    logger.info(f"Job {job_id} do Textract com status {status} (consulta {polls})")
 
-    for block in textract_response.get("Blocks", []):
-        if block.get("BlockType") == "LINE" and "Text" in block:
-            # Extrai apenas o texto relevante
-            important_data.append(block["Text"])
+    if status == 'IN_PROGRESS':
+        if polls >= TEXTRACT_MAX_POLLS:
+            raise TextractError(f'Job do Textract {job_id} excedeu o número máximo de consultas')
+        return {**event, 'textract_status': 'IN_PROGRESS', 'textract_polls': polls}
 
-    return important_data
+    if status == 'FAILED':
+        raise TextractError(f"Falha no job do Textract: {first_page.get('StatusMessage', job_id)}")
+
+    # SUCCEEDED ou PARTIAL_SUCCESS: percorre todas as páginas do resultado
+    important_data = extract_lines(iter_job_blocks(job_id, api, first_page))
+    cache = get_cache(event['bucket_name'])
+    save_to_cache(cache, event.get('sha256'), important_data)
+    return build_output(event, important_data, event.get('sha256'))
 
 def lambda_handler(event, context):
-    
+
+    # Consulta de um job assíncrono já iniciado
+    if event.get('textract_job_id'):
+        return poll_document_job(event)
+
     # Processa o documento e obtém a resposta bruta do Textract
     bucket_name = event['bucket_name']
     file_name = event['file_name']
+    # Imagem derivada pelo pré-processamento (menor e em tons de cinza), quando houver
+    document_key = event.get('textract_key') or file_name
+    profile = event.get('textract_profile') or TEXTRACT_PROFILE
+
+    if profile not in TEXTRACT_PROFILES:
+        raise ValueError(f'Perfil do Textract inválido: {profile}')
 
     logger.info("Iniciando o processamento do evento")
-    
-    response = process_document(bucket_name, file_name)
 
-    if not response:
+    try:
+        head = s3.head_object(Bucket=bucket_name, Key=document_key, ChecksumMode='ENABLED')
+    except ClientError as e:
+        logger.info(f"Erro ao consultar o documento no S3: {e}")
+        raise TextractError(f'Documento {document_key} não encontrado no S3') from e
+
+    # Consulta o cache pelo conteúdo da imagem antes de chamar o Textract
+    cache = get_cache(bucket_name)
+    sha256 = event.get('sha256')
+    important_data = None
+    if cache:
+        try:
+            sha256 = get_document_sha256(bucket_name, document_key, event, head)
+            important_data = cache.get(sha256)
+        except Exception as e:
+            logger.warning(f"Falha ao consultar o cache do Textract: {e}")
+
+    if important_data is not None:
+        logger.info(f"Resultado do Textract encontrado no cache ({sha256})")
+        return build_output(event, important_data, sha256)
+
+    # Documentos grandes ou multipágina seguem pelo job assíncrono
+    if requires_async_job(document_key, head['ContentLength']):
+        try:
+            job_id, api = start_document_job(bucket_name, document_key, profile)
+        except Exception as e:
+            logger.info(f"Erro ao iniciar o job assíncrono do Textract: {e}")
+            raise TextractError('Falha ao processar o documento com o Textract') from e
         return {
-            'statusCode': 500,
-            'body': json.dumps('Falha ao processar o documento com o Textract')
+            'file_name': file_name,
+            'bucket_name': bucket_name,
+            'sha256': sha256,
+            'textract_job_id': job_id,
+            'textract_api': api,
+            'textract_status': 'IN_PROGRESS',
+            'textract_polls': 0
         }
 
+    response = process_document(bucket_name, document_key, profile)
+
+    if not response:
+        raise TextractError('Falha ao processar o documento com o Textract')
+
     # Extrai apenas as informações importantes
     important_data = extract_important_data(response)
-
-    string_important_data = "\n".join(important_data)
+    save_to_cache(cache, sha256, important_data)
 
     # Retorna as informações extraídas
-    return {
-        'important_data': string_important_data,
-        'file_name' : file_name,
-        'bucket_name': bucket_name
-    }
\ No newline at end of file
+    return build_output(event, important_data, sha256)
@@ -0,0 +1,41 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from tests.dados import RESPOSTA_LLM  # noqa: E402
+
+@pytest.fixture(scope='session')
+def modules():
+    from tools.pipeline_local import load_lambda_modules
+    return load_lambda_modules()
+
+@pytest.fixture
+def stand_ins(modules, monkeypatch):
+    """S3, Textract e Groq locais instalados nos módulos das Lambdas (cache da LLM em memória vazio)"""
+    from tools.stand_ins import FakeGroq, FakeS3, FakeTextract, install_stand_ins
+
+    monkeypatch.setattr(modules['llm'], 'memoria_cache', modules['llm'].MemoriaLLMCache())
+    s3 = FakeS3()
+    textract = FakeTextract()
+    groq = FakeGroq(lambda messages: RESPOSTA_LLM)
+    install_stand_ins(modules, s3=s3, textract=textract, groq=groq)
+    return s3, textract, groq
+
+@pytest.fixture
+def api(modules, stand_ins, monkeypatch):
+    """Módulo da API com o S3 local; as execuções da Step Function ficam registradas em api.started"""
+    api = modules['integracao']
+    started = []
+
+    def execute_step_function(context, bucket_name, file_names, **kwargs):
+        started.append({'file_names': file_names, **kwargs})
+        return {'statusCode': 202}
+
+    monkeypatch.setattr(api, 'execute_step_function', execute_step_function)
+    monkeypatch.setattr(api, 'started', started, raising=False)
+    return api
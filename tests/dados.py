@@ -0,0 +1,38 @@
+# tests/dados.py
+"""Textos e respostas simuladas usados nos testes do pipeline"""
+
+# Texto OCR de um cupom com CNPJ do emissor inválido (a nota passa pela LLM)
+OCR_NOTA = """SUPERMERCADO BOM PRECO LTDA
+CNPJ: 12.345.678/0001-90
+RUA DAS FLORES, 123, CENTRO CEP 58000-000
+CONSUMIDOR CPF 123.456.789-09
+EXTRATO No 123456
+SAT No 001
+TOTAL R$ : 45,90
+Dinheiro 50,00
+EMISSAO 12/03/2024 10:33:12
+"""
+
+RESPOSTA_LLM = (
+    '{"nome_emissor": "SUPERMERCADO BOM PRECO LTDA", "CNPJ_emissor": "12345678000190", '
+    '"endereco_emissor": "RUA DAS FLORES, 123", "CNPJ_CPF_consumidor": "12345678909", '
+    '"data_emissao": "12/03/2024", "numero_nota_fiscal": "123456", "serie_nota_fiscal": "001", '
+    '"valor_total": "45,90", "forma_pgto": "dinheiropix"}'
+)
+
+def evento_multipart(arquivos, boundary='limite-teste', query=None):
+    """Evento do API Gateway com os arquivos [(nome, conteúdo)] em multipart/form-data"""
+    corpo = b''
+    for nome, conteudo in arquivos:
+        corpo += (
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="file"; filename="{nome}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n'
+        ).encode() + conteudo + b'\r\n'
+    corpo += f'--{boundary}--\r\n'.encode()
+    return {
+        'httpMethod': 'POST',
+        'headers': {'Content-Type': f'multipart/form-data; boundary={boundary}'},
+        'body': corpo.decode('latin-1'),
+        'queryStringParameters': query,
+    }
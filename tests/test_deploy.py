@@ -0,0 +1,142 @@
+# tests/test_deploy.py
+import threading
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+import deploy
+from infrastructure.orchestration import retry_on_iam_propagation, run_steps
+
+def erro_cliente(code, message):
+    return ClientError({'Error': {'Code': code, 'Message': message}}, 'CreateFunction')
+
+def test_etapas_comecam_depois_das_dependencias():
+    eventos = []
+    lock = threading.Lock()
+
+    def etapa(nome, valor):
+        def executar(results):
+            with lock:
+                eventos.append(('inicio', nome))
+            time.sleep(0.01)
+            with lock:
+                eventos.append(('fim', nome))
+            return valor(results)
+        return executar
+
+    steps = {
+        'c': (['a', 'b'], etapa('c', lambda results: results['a'] + results['b'])),
+        'a': ([], etapa('a', lambda results: 1)),
+        'b': ([], etapa('b', lambda results: 2)),
+        'd': (['c'], etapa('d', lambda results: results['c'] * 10)),
+    }
+
+    results, timings = run_steps(steps)
+
+    assert results == {'a': 1, 'b': 2, 'c': 3, 'd': 30}
+    assert set(timings) == set(steps)
+    for nome, (deps, _) in steps.items():
+        for dep in deps:
+            assert eventos.index(('fim', dep)) < eventos.index(('inicio', nome))
+
+def test_falha_interrompe_as_etapas_dependentes():
+    executadas = []
+
+    def falhar(results):
+        raise RuntimeError('falha no bucket')
+
+    steps = {
+        's3': ([], falhar),
+        'iam': ([], lambda results: executadas.append('iam')),
+        'ingestao': (['s3', 'iam'], lambda results: executadas.append('ingestao')),
+    }
+
+    with pytest.raises(RuntimeError, match='falha no bucket'):
+        run_steps(steps)
+    assert 'ingestao' not in executadas
+
+def test_dependencias_inexistentes_ou_circulares_sao_rejeitadas():
+    with pytest.raises(ValueError, match='inexistentes'):
+        run_steps({'a': (['x'], lambda results: None)})
+    with pytest.raises(ValueError, match='circulares'):
+        run_steps({'a': (['b'], lambda results: None), 'b': (['a'], lambda results: None)})
+
+def test_repete_enquanto_a_role_nao_propagou():
+    tentativas = []
+
+    def criar():
+        tentativas.append(1)
+        if len(tentativas) < 3:
+            raise erro_cliente('InvalidParameterValueException', 'The role defined for the function cannot be assumed by Lambda.')
+        return 'arn:criada'
+
+    assert retry_on_iam_propagation(criar, 'teste', interval=0) == 'arn:criada'
+    assert len(tentativas) == 3
+
+def test_outros_erros_e_prazo_esgotado_nao_sao_repetidos():
+    tentativas = []
+
+    def criar(code, message):
+        def executar():
+            tentativas.append(code)
+            raise erro_cliente(code, message)
+        return executar
+
+    with pytest.raises(ClientError):
+        retry_on_iam_propagation(criar('ResourceConflictException', 'Function already exist'), 'teste', interval=0)
+    assert tentativas == ['ResourceConflictException']
+
+    tentativas.clear()
+    with pytest.raises(ClientError):
+        retry_on_iam_propagation(criar('AccessDeniedException', 'Neither the global service principal could assume the role'),
+                                 'teste', timeout=0, interval=0)
+    assert tentativas == ['AccessDeniedException']
+
+def test_grafo_do_deploy_com_clientes_falsos(monkeypatch):
+    chamadas = []
+    lock = threading.Lock()
+
+    def registrar(nome, retorno=None):
+        def executar(*args, **kwargs):
+            with lock:
+                chamadas.append((nome, args, kwargs))
+            return retorno(*args, **kwargs) if retorno else None
+        return executar
+
+    monkeypatch.setattr(deploy, 'create_s3_bucket', registrar('s3'))
+    monkeypatch.setattr(deploy, 'create_iam_roles', registrar('iam', lambda iam: ({'RoleS3': 'arn:role'}, 'arn:role-sf')))
+    monkeypatch.setattr(deploy, 'create_layers', registrar('layers', lambda client: {'GROQ': 'arn:layer'}))
+    monkeypatch.setattr(deploy, 'deploy_lambda_function',
+                        registrar('lambda', lambda client, spec, roles, layers: f"arn:{spec['name']}"))
+    monkeypatch.setattr(deploy, 'create_step_function', registrar('step_function'))
+    monkeypatch.setattr(deploy, 'create_rest_api', registrar('api'))
+    monkeypatch.setattr(deploy, 'configure_ingestion_notifications', registrar('ingestao'))
+    clients = {name: object() for name in ('s3', 'lambda', 'stepfunctions', 'iam', 'apigateway')}
+
+    steps = deploy.build_deploy_steps(clients)
+    specs = deploy.build_lambda_specs()
+    pipeline = [lambda_type for lambda_type, _ in deploy.build_pipeline_groups()]
+
+    assert set(steps) >= {'s3', 'iam', 'layers', 'step_function', 'api', 'ingestao'} | {f'lambda:{t}' for t in specs}
+    assert all(set(steps[f'lambda:{t}'][0]) == {'iam', 'layers'} for t in specs)
+    assert set(steps['step_function'][0]) == {'iam'} | {f'lambda:{t}' for t in pipeline}
+    assert steps['api'][0] == ['lambda:integracao']
+    assert set(steps['ingestao'][0]) == {'s3', 'lambda:ingestao'}
+
+    run_steps(steps)
+
+    # As Lambdas recebem as roles e os layers criados antes delas
+    lambdas = [args for nome, args, _ in chamadas if nome == 'lambda']
+    assert len(lambdas) == len(specs)
+    assert all(roles == {'RoleS3': 'arn:role'} and layers == {'GROQ': 'arn:layer'} for _, _, roles, layers in lambdas)
+
+    # As Step Functions recebem o ARN de cada Lambda do pipeline
+    step_functions = [args for nome, args, _ in chamadas if nome == 'step_function']
+    assert step_functions
+    for _, role, arns in step_functions:
+        assert role == 'arn:role-sf'
+        assert arns == {t: f"arn:{specs[t]['name']}" for t in pipeline}
+
+    api = next(args for nome, args, _ in chamadas if nome == 'api')
+    assert api[2] == f"arn:{specs['integracao']['name']}"
@@ -0,0 +1,113 @@
+# tests/test_infraestrutura.py
+import io
+import os
+import zipfile
+
+import pytest
+from botocore.exceptions import ClientError
+
+from infrastructure import lambdas, layers
+
+def test_estagio_fundido_usa_role_que_cobre_todas_as_etapas():
+    specs = lambdas.build_lambda_specs({'llm_mover': ['llm', 'mover_imagem'], 'textract_regex': ['textract', 'regex']})
+
+    assert specs['llm_mover']['role'] == 'RoleS3'
+    assert specs['textract_regex']['role'] == 'RoleS3Textract'
+
+    # A role do Textract cobre também as etapas que só usam o S3
+    specs = lambdas.build_lambda_specs({'tudo': ['textract', 'regex', 'llm', 'mover_imagem']})
+    assert specs['tudo']['role'] == 'RoleS3Textract'
+
+def test_estagio_fundido_sem_role_comum_e_rejeitado(monkeypatch):
+    monkeypatch.setitem(lambdas.LAMBDA_ROLES, 'mover_imagem', 'RoleStep')
+    monkeypatch.setitem(lambdas.LAMBDA_ROLES, 'llm', 'RoleS3Textract')
+
+    with pytest.raises(ValueError, match='llm_mover'):
+        lambdas.build_lambda_specs({'llm_mover': ['llm', 'mover_imagem']})
+
+class FakeLambda:
+    """Cliente Lambda com uma função e um layer implantados (ou nenhum)"""
+
+    def __init__(self, function=None, layer=None):
+        self.function = function
+        self.layer = layer
+
+    def get_function(self, FunctionName):
+        if self.function is None:
+            raise ClientError({'Error': {'Code': 'ResourceNotFoundException', 'Message': ''}}, 'GetFunction')
+        return self.function
+
+    def list_layer_versions(self, LayerName, MaxItems):
+        return {'LayerVersions': [self.layer] if self.layer else []}
+
+    def get_layer_version(self, LayerName, VersionNumber):
+        return self.layer
+
+def funcao_implantada(spec, role_arn, layer_arns, zip_content):
+    return {
+        'Configuration': {
+            'FunctionArn': f"arn:aws:lambda:us-east-1:123:function:{spec['name']}",
+            'Role': role_arn,
+            'Handler': spec['handler'],
+            'Timeout': spec['timeout'],
+            'Environment': {'Variables': dict(spec['environment'])},
+            'Layers': [{'Arn': layer_arns[layer]} for layer in spec['layers']],
+            'CodeSha256': lambdas.code_sha256(zip_content),
+        },
+        'Concurrency': {'ReservedConcurrentExecutions': spec['reserved_concurrency']},
+    }
+
+def test_zip_da_lambda_e_identico_entre_builds():
+    spec = lambdas.build_lambda_specs({'textract_regex': ['textract', 'regex']})['textract_regex']
+    primeiro = lambdas.build_lambda_zip(spec)
+
+    # Datas de modificação diferentes não mudam o ZIP
+    caminho = os.path.join(os.path.dirname(lambdas.__file__), '..', 'lambda_functions', spec['files'][0])
+    stat = os.stat(caminho)
+    try:
+        os.utime(caminho, (stat.st_atime, stat.st_mtime + 3600))
+        segundo = lambdas.build_lambda_zip(spec)
+    finally:
+        os.utime(caminho, (stat.st_atime, stat.st_mtime))
+
+    assert primeiro == segundo
+    with zipfile.ZipFile(io.BytesIO(primeiro)) as zipf:
+        assert zipf.namelist() == sorted(spec['files'])
+        assert all(info.date_time == lambdas.ZIP_DATE_TIME for info in zipf.infolist())
+
+def test_plano_pula_lambda_sem_alteracoes():
+    spec = lambdas.build_lambda_specs()['llm']
+    role_arn = 'arn:aws:iam::123:role/RoleS3'
+    layer_arns = {layer: f"arn:layer:{layer}:1" for layer in spec['layers']}
+    implantada = funcao_implantada(spec, role_arn, layer_arns, lambdas.build_lambda_zip(spec))
+
+    plano = lambdas.plan_lambda_function(FakeLambda(implantada), spec, role_arn, layer_arns)
+    assert plano['action'] == 'unchanged'
+
+    implantada['Configuration']['Environment']['Variables']['LLM_CACHE'] = 'off'
+    implantada['Configuration']['CodeSha256'] = 'outro'
+    plano = lambdas.plan_lambda_function(FakeLambda(implantada), spec, role_arn, layer_arns)
+    assert plano['action'] == 'update'
+    assert plano['code_changed'] and plano['config_changes'] == ['Environment']
+
+    assert lambdas.plan_lambda_function(FakeLambda(), spec, role_arn, layer_arns)['action'] == 'create'
+
+def test_plano_pula_layer_sem_alteracoes(tmp_path):
+    zip_path = tmp_path / 'groq.zip'
+    zip_path.write_bytes(b'conteudo do layer')
+    config = {'zip_file': str(zip_path), 'compatible_runtimes': ['python3.12']}
+    publicado = {
+        'Version': 3,
+        'LayerVersionArn': 'arn:layer:GROQ:3',
+        'Content': {'CodeSha256': lambdas.code_sha256(b'conteudo do layer')},
+        'CompatibleRuntimes': ['python3.12'],
+    }
+
+    plano = layers.plan_layer(FakeLambda(layer=publicado), 'GROQ', config)
+    assert plano['action'] == 'unchanged' and plano['layer_arn'] == 'arn:layer:GROQ:3'
+
+    zip_path.write_bytes(b'novo conteudo')
+    plano = layers.plan_layer(FakeLambda(layer=publicado), 'GROQ', config)
+    assert (plano['action'], plano['reason']) == ('publish', 'conteúdo alterado')
+
+    assert layers.plan_layer(FakeLambda(), 'GROQ', config)['action'] == 'publish'
@@ -0,0 +1,109 @@
+# tests/test_integracao_api.py
+import base64
+import io
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from tests.dados import evento_multipart
+
+def test_start_exige_o_job_id_completo(api, stand_ins):
+    s3, _, _ = stand_ins
+    job_id = str(uuid.uuid4())
+    s3.put_object(Bucket='bucket-teste', Key=f"uploads/{job_id}.jpg", Body=b'imagem')
+
+    response = api.start_uploaded_job({}, None, 'bucket-teste', job_id[:1])
+
+    assert response['statusCode'] == 400
+    assert api.started == []
+
+def test_start_usa_somente_o_objeto_do_job(api, stand_ins):
+    s3, _, _ = stand_ins
+    job_id = str(uuid.uuid4())
+    s3.put_object(Bucket='bucket-teste', Key=f"uploads/{job_id}.jpg.extra", Body=b'outro')
+    assert api.start_uploaded_job({}, None, 'bucket-teste', job_id)['statusCode'] == 404
+
+    s3.put_object(Bucket='bucket-teste', Key=f"uploads/{job_id}.jpg", Body=b'imagem')
+    assert api.start_uploaded_job({}, None, 'bucket-teste', job_id)['statusCode'] == 202
+    assert api.started[0]['file_names'] == [f"uploads/{job_id}.jpg"]
+
+@pytest.mark.parametrize('lambda_type', ['integracao', 'textract', 'llm', 'mover_imagem', 'preprocessamento', 'ingestao'])
+def test_cliente_sob_demanda_e_criado_uma_vez_entre_threads(modules, lambda_type):
+    criados = []
+    lock = threading.Lock()
+
+    def factory():
+        time.sleep(0.01)
+        with lock:
+            criados.append(object())
+        return 'cliente'
+
+    client = modules[lambda_type].LazyClient(factory)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(lambda _: client.upper(), range(8)))
+
+    assert len(criados) == 1
+
+def test_multipart_com_varias_partes_e_campos_sem_arquivo(api):
+    binario = b'\x89PNG\r\n--quase-limite\r\n\x00\xff'
+    corpo = (
+        b'--limite\r\nContent-Disposition: form-data; name="descricao"\r\n\r\ntexto\r\n'
+        b'--limite\r\nContent-Disposition: form-data; name="file"; filename="nota fiscal.png"\r\n'
+        b'Content-Type: image/png\r\n\r\n' + binario + b'\r\n'
+        b'--limite\r\nContent-Disposition: form-data; name="file"; filename=b.pdf\r\n\r\n%PDF\r\n'
+        b'--limite--\r\n'
+    )
+    evento = {
+        'headers': {'content-type': 'multipart/form-data; boundary="limite"'},
+        'body': base64.b64encode(corpo).decode(),
+        'isBase64Encoded': True,
+    }
+
+    valido, arquivos = api.validate_and_extract_files(evento)
+
+    assert valido
+    assert [(nome, bytes(conteudo)) for nome, conteudo in arquivos] == [('nota fiscal.png', binario), ('b.pdf', b'%PDF')]
+
+def test_multipart_rejeita_extensao_e_nome_duplicado(api):
+    valido, mensagem = api.validate_and_extract_files(evento_multipart([('a.txt', b'x')]))
+    assert not valido and 'imagem' in mensagem
+
+    valido, mensagem = api.validate_and_extract_files(evento_multipart([('a.jpg', b'x'), ('a.jpg', b'y')]))
+    assert not valido and 'duplicado' in mensagem
+
+def test_imagem_enviada_direto_no_corpo(api):
+    evento = {'headers': {'Content-Type': 'image/png', 'X-File-Name': 'cupom.png'}, 'body': 'png'}
+    assert api.validate_and_extract_files(evento)[1][0][0] == 'cupom.png'
+
+    # Sem nome, gera um UUID com a extensão do Content-Type
+    valido, arquivos = api.validate_and_extract_files({'headers': {'Content-Type': 'image/png'}, 'body': 'png'})
+    assert valido and arquivos[0][0].endswith('.png') and bytes(arquivos[0][1]) == b'png'
+
+    evento = {'headers': {'Content-Type': 'image/png'}, 'body': 'png', 'queryStringParameters': {'file_name': 'a.gif'}}
+    assert not api.validate_and_extract_files(evento)[0]
+
+def test_corpo_acima_do_limite_responde_413(api, monkeypatch):
+    monkeypatch.setattr(api, 'MAX_UPLOAD_BYTES', 30)
+
+    # Base64: 40 caracteres correspondem a 30 bytes
+    assert api.check_body_size({'body': 'A' * 40, 'isBase64Encoded': True})
+    assert not api.check_body_size({'body': 'A' * 44, 'isBase64Encoded': True})
+    assert not api.check_body_size({'body': 'A' * 31})
+
+    response = api.lambda_handler(evento_multipart([('a.jpg', b'x' * 100)]), SimpleNamespace(aws_request_id='req-teste'))
+    assert response['statusCode'] == 413
+    assert api.started == []
+
+def test_leitor_de_memoryview_sem_copias(api):
+    leitor = api.MemoryViewReader(memoryview(b'0123456789'))
+
+    assert len(leitor) == 10
+    assert leitor.read(4) == b'0123'
+    assert leitor.seek(-2, io.SEEK_END) == 8
+    assert leitor.read() == b'89'
+    leitor.seek(0)
+    assert leitor.read() == b'0123456789'
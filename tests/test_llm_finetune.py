@@ -0,0 +1,247 @@
+# tests/test_llm_finetune.py
+import asyncio
+import json
+
+import pytest
+
+from tests.dados import RESPOSTA_LLM
+
+REGISTRO = {
+    'nome_emissor': 'SUPERMERCADO BOM PRECO LTDA',
+    'CNPJ_emissor': None,
+    'endereco_emissor': None,
+    'CNPJ_CPF_consumidor': None,
+    'data_emissao': '12/03/2024',
+    'numero_nota_fiscal': '123456',
+    'serie_nota_fiscal': '001',
+    'valor_total': None,
+    'forma_pgto': 'dinheiropix',
+}
+
+RESPOSTA = {
+    'nome_emissor': 'SUPERMERCADO BOM PRECO LTDA',
+    'CNPJ_emissor': '11222333000181',
+    'endereco_emissor': 'RUA DAS FLORES, 123',
+    'CNPJ_CPF_consumidor': None,
+    'data_emissao': '12/03/2024',
+    'numero_nota_fiscal': '123456',
+    'serie_nota_fiscal': '001',
+    'valor_total': '45,90',
+    'forma_pgto': 'dinheiropix',
+}
+
+def test_validacao_aceita_nota_sem_documento_do_consumidor(modules):
+    dados = dict(RESPOSTA)
+
+    assert modules['llm'].validar_nota_fiscal(dados, REGISTRO) == 1
+    assert dados['CNPJ_CPF_consumidor'] is None
+    assert dados['CNPJ_emissor'] == '11.222.333/0001-81'
+
+def test_validacao_confere_o_cnpj_do_emissor_e_nao_o_do_consumidor(modules):
+    dados = {**RESPOSTA, 'CNPJ_emissor': '123', 'CNPJ_CPF_consumidor': '12345678909'}
+
+    assert modules['llm'].campos_invalidos(dados, REGISTRO) == ['CNPJ_emissor']
+
+@pytest.mark.parametrize('valor, esperado', [
+    ('45.90', '45.90'),
+    ('45,90', '45.90'),
+    ('045', '45.00'),
+])
+def test_validacao_nao_duplica_os_centavos_do_total(modules, valor, esperado):
+    dados = {**RESPOSTA, 'valor_total': valor}
+
+    assert modules['llm'].validar_nota_fiscal(dados, REGISTRO) == 1
+    assert dados['valor_total'] == esperado
+
+def test_validacao_usa_o_total_da_regex_com_centavos(modules):
+    dados = {**RESPOSTA, 'valor_total': '99,99'}
+
+    modules['llm'].validar_nota_fiscal(dados, {**REGISTRO, 'valor_total': '45.90'})
+
+    assert dados['valor_total'] == '45.90'
+
+def test_resultado_parcial_mantem_os_campos_validos(modules):
+    llm = modules['llm']
+    tentativas = [
+        # Só o nome é válido
+        {'nome_emissor': 'SUPERMERCADO', 'serie_nota_fiscal': '1', 'forma_pgto': 'cartao'},
+        # Mais campos válidos; série e data inválidas
+        {
+            'nome_emissor': 'SUPERMERCADO BOM PRECO', 'CNPJ_emissor': '11222333000181',
+            'endereco_emissor': 'RUA DAS FLORES, 123', 'data_emissao': '2024-03-12',
+            'serie_nota_fiscal': '01', 'valor_total': '45,90', 'forma_pgto': 'outros',
+        },
+    ]
+
+    dados = llm.resultado_parcial(tentativas, REGISTRO)
+
+    # Campos válidos da melhor tentativa são mantidos
+    assert dados['nome_emissor'] == 'SUPERMERCADO BOM PRECO'
+    assert dados['CNPJ_emissor'] == '11.222.333/0001-81'
+    assert dados['valor_total'] == '45.90'
+    assert dados['forma_pgto'] == 'outros'
+    # Campos inválidos e lacunas vêm da etapa de regex
+    assert dados['data_emissao'] == '12/03/2024'
+    assert dados['serie_nota_fiscal'] == '001'
+    assert dados['numero_nota_fiscal'] == '123456'
+    assert dados['CNPJ_CPF_consumidor'] is None
+
+def test_resultado_parcial_sem_tentativas_usa_a_regex(modules):
+    dados = modules['llm'].resultado_parcial([], {**REGISTRO, 'serie_nota_fiscal': '1', 'forma_pgto': None})
+
+    assert dados['numero_nota_fiscal'] == '123456'
+    assert dados['serie_nota_fiscal'] is None
+    assert dados['forma_pgto'] == 'outros'
+
+def test_chave_do_cache_normaliza_espacos_e_muda_com_modelo_e_prompt(modules, monkeypatch):
+    llm = modules['llm']
+    chave = llm.chave_cache(REGISTRO)
+
+    assert llm.chave_cache({**REGISTRO, 'nome_emissor': ' SUPERMERCADO  BOM\nPRECO LTDA '}) == chave
+    assert llm.chave_cache({**REGISTRO, 'serie_nota_fiscal': '002'}) != chave
+
+    with monkeypatch.context() as m:
+        m.setattr(llm, 'PROMPT_VERSION', 'outra-versao')
+        assert llm.chave_cache(REGISTRO) != chave
+    with monkeypatch.context() as m:
+        m.setattr(llm, 'LLM_MODEL', 'outro-modelo')
+        assert llm.chave_cache(REGISTRO) != chave
+
+def test_cache_em_memoria_expira_e_descarta_o_menos_usado(modules, monkeypatch):
+    llm = modules['llm']
+    agora = 1_000_000.0
+    monkeypatch.setattr(llm.time, 'time', lambda: agora)
+    cache = llm.MemoriaLLMCache(max_entries=2, ttl=60)
+
+    cache.put('a', {'n': 1})
+    cache.put('b', {'n': 2})
+    cache.get('a')
+    cache.put('c', {'n': 3})
+    assert cache.get('b') is None
+    assert cache.get('a') == {'n': 1}
+
+    agora += 61
+    assert cache.get('a') is None
+
+def test_cache_s3_separa_versoes_do_prompt_e_expira(modules, stand_ins, monkeypatch):
+    llm = modules['llm']
+    s3, _, _ = stand_ins
+    agora = 1_000_000.0
+    monkeypatch.setattr(llm.time, 'time', lambda: agora)
+    cache = llm.S3LLMCache('bucket-teste', ttl=60)
+
+    cache.put('chave', {'n': 1})
+    assert ('bucket-teste', f"cache/llm/{llm.PROMPT_VERSION}/chave.json") in s3.objects
+    assert cache.get('chave') == {'n': 1}
+    assert cache.get('outra') is None
+
+    with monkeypatch.context() as m:
+        m.setattr(llm, 'PROMPT_VERSION', 'outra-versao')
+        assert cache.get('chave') is None
+
+    agora += 61
+    assert cache.get('chave') is None
+
+def test_cache_sqlite_remove_versoes_antigas_e_expiradas_ao_abrir(modules, monkeypatch, tmp_path):
+    llm = modules['llm']
+    caminho = str(tmp_path / 'cache.sqlite')
+    agora = 1_000_000.0
+    monkeypatch.setattr(llm.time, 'time', lambda: agora)
+
+    cache = llm.SQLiteLLMCache(caminho, ttl=60)
+    cache.put('chave', {'n': 1})
+    assert cache.get('chave') == {'n': 1}
+
+    agora += 61
+    assert cache.get('chave') is None
+    agora -= 61
+
+    monkeypatch.setattr(llm, 'PROMPT_VERSION', 'outra-versao')
+    cache = llm.SQLiteLLMCache(caminho, ttl=60)
+    assert cache.connection.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0] == 0
+
+def evento_lote(*registros):
+    return {'notas': [
+        {'dados_nota': registro, 'file_name': f"imagens/{indice}.jpg", 'bucket_name': 'bucket-teste'}
+        for indice, registro in enumerate(registros)
+    ]}
+
+def test_nota_assincrona_sem_semaforo(modules, stand_ins):
+    from tools.stand_ins import FakeAsyncGroq
+    _, _, groq = stand_ins
+
+    dados, metricas = asyncio.run(modules['llm'].processar_nota_com_llm_async(FakeAsyncGroq(groq), REGISTRO))
+
+    assert metricas['status'] == 'ok'
+    assert dados['numero_nota_fiscal'] == '123456'
+
+def test_lote_usa_o_cache_antes_da_llm(modules, stand_ins):
+    llm = modules['llm']
+    _, _, groq = stand_ins
+    llm.memoria_cache.put(llm.chave_cache(REGISTRO), {'numero_nota_fiscal': '123456'})
+
+    resultados = llm.processar_evento_lote(evento_lote(REGISTRO), None)['resultados']
+
+    assert resultados[0]['llm_metricas']['status'] == 'cache'
+    assert resultados[0]['result_json'] == {'numero_nota_fiscal': '123456'}
+    assert groq.calls == []
+
+def test_lote_agrupa_notas_curtas_e_refaz_as_invalidas_individualmente(modules, stand_ins, monkeypatch):
+    llm = modules['llm']
+    _, _, groq = stand_ins
+    monkeypatch.setattr(llm, 'LLM_NOTAS_POR_PROMPT', 2)
+    prompts = []
+
+    def responder(messages):
+        prompts.append(messages[0]['content'])
+        if messages[0]['content'] == llm.SYSTEM_PROMPT_AGRUPADO:
+            # A segunda nota volta sem os campos obrigatórios
+            return f'[{RESPOSTA_LLM}, {{"serie_nota_fiscal": "1"}}]'
+        return RESPOSTA_LLM
+
+    groq.responder = responder
+    segunda = {**REGISTRO, 'numero_nota_fiscal': '654321'}
+
+    resultados = llm.processar_evento_lote(evento_lote(REGISTRO, segunda), None)['resultados']
+
+    assert prompts == [llm.SYSTEM_PROMPT_AGRUPADO, llm.SYSTEM_PROMPT]
+    assert resultados[0]['llm_metricas']['agrupada'] is True
+    assert 'agrupada' not in resultados[1]['llm_metricas']
+    assert [resultado['llm_metricas']['status'] for resultado in resultados] == ['ok', 'ok']
+    assert [resultado['result_json']['numero_nota_fiscal'] for resultado in resultados] == ['123456', '654321']
+
+    # Os resultados validados ficam no cache: o mesmo lote não chama a LLM de novo
+    resultados = llm.processar_evento_lote(evento_lote(REGISTRO, segunda), None)['resultados']
+    assert [resultado['llm_metricas']['status'] for resultado in resultados] == ['cache', 'cache']
+    assert len(prompts) == 2
+
+def test_reparo_pede_so_os_campos_invalidos_e_mantem_os_validados(modules, stand_ins, monkeypatch):
+    llm = modules['llm']
+    _, _, groq = stand_ins
+    monkeypatch.setattr(llm, 'LLM_BACKOFF_SEGUNDOS', 0)
+    registro = {**REGISTRO, 'serie_nota_fiscal': None, 'data_emissao': None}
+    mensagens = []
+
+    def responder(messages):
+        mensagens.append(messages)
+        if len(mensagens) == 1:
+            return json.dumps({**RESPOSTA, 'serie_nota_fiscal': '01', 'data_emissao': '2024-03-12'})
+        # Campos não pedidos na resposta do reparo são ignorados
+        return json.dumps({'serie_nota_fiscal': '001', 'data_emissao': '12/03/2024', 'nome_emissor': 'OUTRO'})
+
+    groq.responder = responder
+
+    dados, metricas = llm.processar_nota_com_llm(registro)
+
+    sistema, usuario = mensagens[1][0]['content'], mensagens[1][1]['content']
+    campos_pedidos = usuario.split('Campos a corrigir:')[1]
+    assert sistema == llm.SYSTEM_PROMPT_REPARO
+    assert '- serie_nota_fiscal:' in campos_pedidos and '- data_emissao:' in campos_pedidos
+    assert campos_pedidos.count('\n- ') == 2
+
+    assert metricas['status'] == 'ok' and metricas['tentativas'] == 2
+    assert dados['serie_nota_fiscal'] == '001'
+    assert dados['data_emissao'] == '12/03/2024'
+    assert dados['nome_emissor'] == 'SUPERMERCADO BOM PRECO LTDA'
+    assert dados['CNPJ_emissor'] == '11.222.333/0001-81'
+    assert dados['valor_total'] == '45.90'
@@ -0,0 +1,57 @@
+# tests/test_mover_imagem.py
+from datetime import date
+
+from tools.classificacao import listar_notas
+from tools.indice import compactar, consultar, deduplicar, sem_removidos
+
+RESULTADO = {
+    "nome_emissor": "SUPERMERCADO BOM PRECO LTDA",
+    "CNPJ_emissor": "11.222.333/0001-81",
+    "data_emissao": "12/03/2024",
+    "numero_nota_fiscal": "123456",
+    "valor_total": "45.90",
+    "forma_pgto": "dinheiropix",
+}
+
+def mover(modules, result_json):
+    evento = {'result_json': result_json, 'file_name': 'a.jpg', 'bucket_name': 'bucket-teste', 'sha256': 'abc'}
+    return modules['mover_imagem'].lambda_handler(evento, None)
+
+def test_reclassificacao_remove_a_pasta_anterior(modules, stand_ins):
+    s3, _, _ = stand_ins
+    mover(modules, RESULTADO)
+    mover(modules, {**RESULTADO, "forma_pgto": "outros"})
+
+    assert listar_notas(s3, 'bucket-teste', 'dinheiro') == []
+    assert [nota['file_name'] for nota in listar_notas(s3, 'bucket-teste', 'outros')] == ['a.jpg']
+
+def test_nota_que_muda_de_particao_aparece_uma_vez_no_indice(modules, stand_ins):
+    s3, _, _ = stand_ins
+    mover(modules, RESULTADO)
+    compactar(s3, 'bucket-teste', min_partes=1)
+    mover(modules, {**RESULTADO, "data_emissao": "13/03/2024"})
+
+    notas = consultar(s3, 'bucket-teste', cnpj="11222333000181")
+    assert [nota['data_emissao'] for nota in notas] == ["13/03/2024"]
+    assert consultar(s3, 'bucket-teste', de=date(2024, 3, 12), ate=date(2024, 3, 12)) == []
+
+    compactar(s3, 'bucket-teste', min_partes=1)
+    assert [nota['data_emissao'] for nota in consultar(s3, 'bucket-teste')] == ["13/03/2024"]
+
+def test_mudanca_de_forma_na_mesma_data_mantem_a_nota(modules, stand_ins, monkeypatch):
+    s3, _, _ = stand_ins
+    # Os dois processamentos no mesmo segundo: a marca e a linha nova têm o mesmo processado_em
+    monkeypatch.setattr(modules['mover_imagem'].time, 'time', lambda: 1700000000.0)
+    mover(modules, {**RESULTADO, "forma_pgto": "outros"})
+    mover(modules, RESULTADO)
+
+    assert [nota['forma_pgto'] for nota in consultar(s3, 'bucket-teste')] == ["dinheiropix"]
+    compactar(s3, 'bucket-teste', min_partes=1)
+    assert [nota['forma_pgto'] for nota in consultar(s3, 'bucket-teste')] == ["dinheiropix"]
+
+def test_deduplicar_prefere_a_linha_da_nota_no_empate():
+    nova = {"id": "abc", "processado_em": 10, "forma_pgto": "dinheiropix"}
+    marca = {"id": "abc", "processado_em": 10, "removido": True}
+
+    assert sem_removidos(deduplicar([nova, marca])) == [nova]
+    assert sem_removidos(deduplicar([marca, nova])) == [nova]
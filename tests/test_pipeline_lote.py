@@ -0,0 +1,18 @@
+# tests/test_pipeline_lote.py
+import pytest
+
+from tests.dados import OCR_NOTA
+from tools.pipeline_local import build_local_pipeline
+
+@pytest.mark.parametrize('fused_stages', [{}, {'textract_regex': ['textract', 'regex']}], ids=['separados', 'fundidos'])
+def test_lote_com_arquivo_ausente_retorna_erro_por_arquivo(modules, stand_ins, fused_stages):
+    s3, textract, _ = stand_ins
+    s3.put_object(Bucket='bucket-teste', Key='a.jpg', Body=b'imagem')
+    textract.ocr_texts['a.jpg'] = OCR_NOTA
+
+    pipeline = build_local_pipeline(modules, fused_stages=fused_stages)
+    resultados = pipeline.run({'files': ['a.jpg', 'ausente.jpg'], 'bucket_name': 'bucket-teste'})
+
+    assert resultados[0]['numero_nota_fiscal'] == '123456'
+    assert resultados[1]['file_name'] == 'ausente.jpg'
+    assert resultados[1]['error'] == 'TextractError'
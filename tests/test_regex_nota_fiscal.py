@@ -0,0 +1,58 @@
+# tests/test_regex_nota_fiscal.py
+import pytest
+
+from benchmarks.regex_scanner import legacy_fields, synthetic_note
+from tests.dados import OCR_NOTA
+
+# Cupom com CNPJ válido e sem o CPF do consumidor (8 de 9 campos válidos)
+OCR_SEM_CONSUMIDOR = (
+    OCR_NOTA
+    .replace("12.345.678/0001-90", "11.222.333/0001-81")
+    .replace("CONSUMIDOR CPF 123.456.789-09\n", "")
+)
+
+def test_registro_parcial_nao_dispensa_llm_com_confianca_minima_menor(modules, monkeypatch):
+    regex = modules['regex']
+    monkeypatch.setattr(regex, 'CONFIANCA_MINIMA', 0.5)
+
+    output = regex.lambda_handler(
+        {'important_data': OCR_SEM_CONSUMIDOR, 'file_name': 'a.jpg', 'bucket_name': 'bucket-teste'}, None
+    )
+
+    assert output['dados_nota']['CNPJ_CPF_consumidor'] is None
+    assert 0.5 <= output['confianca'] < 1.0
+    assert 'result_json' not in output
+
+def test_montar_resultado_com_campos_ausentes(modules):
+    regex = modules['regex']
+    registro = regex.processar_nota(OCR_SEM_CONSUMIDOR)
+    registro['valor_total'] = None
+
+    resultado = regex.montar_resultado(registro)
+
+    assert resultado['CNPJ_emissor'] == "11.222.333/0001-81"
+    assert resultado['CNPJ_CPF_consumidor'] is None
+    assert resultado['valor_total'] is None
+
+def campos_comparaveis(campos):
+    """A forma de pagamento é buscada no texto em minúsculas por scan_fields"""
+    return {**campos, 'FORMA_PGTO': campos['FORMA_PGTO'] and campos['FORMA_PGTO'].lower()}
+
+@pytest.mark.parametrize('texto', [
+    OCR_NOTA,
+    synthetic_note(20),
+    synthetic_note(20, with_ltda=False),
+    # Sem CEP: o endereço não é buscado
+    'MERCADO X LTDA\nRUA A, 10\nTOTAL R$ : 9,90\nPIX',
+    # "LTDA" no início de um trecho e várias ocorrências no mesmo trecho
+    'LTDA\nCOMERCIO LTDA E FILHOS LTDA\n01/02/2024 e 31/12/2023',
+    # Âncoras sem o padrão na posição e âncora no início do texto
+    '/ sat no x SAT No. 0012 TOTAL R$ : \nSAT No 045 TOTAL R$ : 1.234,56 Débito',
+    # Caracteres que mudam de tamanho em lower()
+    'İSTANBUL LTDA CNPJ 12345678000190 SAT No 001',
+    '',
+])
+def test_scan_fields_igual_ao_extrator_por_campo(modules, texto):
+    esperado = legacy_fields(texto)
+
+    assert campos_comparaveis(modules['regex'].scan_fields(texto)) == campos_comparaveis(esperado)
@@ -0,0 +1,74 @@
+# tests/test_resultados.py
+import hashlib
+import json
+from types import SimpleNamespace
+
+from tests.dados import OCR_NOTA, evento_multipart
+from tools.pipeline_local import build_local_pipeline
+
+def processar(modules, s3, textract, conteudo, ocr):
+    """Processa o conteúdo pelo pipeline local, como a API grava (imagens/<sha256>)"""
+    sha256 = hashlib.sha256(conteudo).hexdigest()
+    key = f"imagens/{sha256}.jpg"
+    s3.put_object(Bucket='bucket-teste', Key=key, Body=conteudo)
+    textract.ocr_texts[key] = ocr
+    build_local_pipeline(modules).run({'file_name': key, 'bucket_name': 'bucket-teste', 'sha256': sha256})
+    return sha256
+
+def test_resultado_validado_e_reaproveitado_com_nome_original(modules, stand_ins, api):
+    s3, textract, _ = stand_ins
+    for conteudo in (b'nota-1', b'nota-2'):
+        processar(modules, s3, textract, conteudo, OCR_NOTA)
+
+    uploads, _ = api.upload_files_to_s3('bucket-teste', [('a.jpg', b'nota-1'), ('b.jpg', b'nota-2')])
+    body = json.loads(api.previous_results_response(uploads)['body'])
+
+    assert [resultado['file_name'] for resultado in body['results']] == ['a.jpg', 'b.jpg']
+    assert body['results'][0]['result']['numero_nota_fiscal'] == '123456'
+
+def test_resultado_parcial_nao_e_reaproveitado(modules, stand_ins, api, monkeypatch):
+    s3, textract, groq = stand_ins
+    monkeypatch.setattr(modules['llm'], 'LLM_BACKOFF_SEGUNDOS', 0)
+    # A LLM nunca devolve um JSON válido: o resultado fica parcial
+    groq.responder = lambda messages: 'sem json'
+    sha256 = processar(modules, s3, textract, b'nota-parcial', OCR_NOTA)
+
+    registro = json.loads(s3.objects[('bucket-teste', f"resultados/{sha256}.json")]['Body'])
+    assert registro['status'] == 'parcial'
+    assert api.get_previous_result('bucket-teste', sha256) is None
+
+def test_lote_executado_responde_com_nome_original(api):
+    execution = {
+        'input': json.dumps({'files': ['imagens/abc.jpg'], 'original_names': ['a.jpg'], 'bucket_name': 'bucket-teste'}),
+        'output': json.dumps([{'numero_nota_fiscal': '123456'}]),
+    }
+
+    assert api.format_execution_output(execution)['results'][0]['file_name'] == 'a.jpg'
+
+def test_lote_misto_executa_so_os_arquivos_novos(modules, stand_ins, api, monkeypatch):
+    s3, textract, _ = stand_ins
+    monkeypatch.setenv('S3_BUCKET_NAME', 'bucket-teste')
+    processar(modules, s3, textract, b'nota-1', OCR_NOTA)
+    nova = f"imagens/{hashlib.sha256(b'nota-nova').hexdigest()}.jpg"
+
+    contexto = SimpleNamespace(aws_request_id='req-teste')
+    api.lambda_handler(evento_multipart([('a.jpg', b'nota-nova'), ('b.jpg', b'nota-1')]), contexto)
+
+    execucao = api.started[0]
+    assert execucao['file_names'] == [nova]
+    assert execucao['original_names'] == ['a.jpg', 'b.jpg']
+    assert execucao['previous_results'][0] is None
+    assert execucao['previous_results'][1]['numero_nota_fiscal'] == '123456'
+
+    # A saída da execução (só o arquivo novo) volta intercalada com o resultado gravado
+    execution = {
+        'input': json.dumps({
+            'files': execucao['file_names'],
+            'original_names': execucao['original_names'],
+            'previous_results': execucao['previous_results'],
+        }),
+        'output': json.dumps([{'numero_nota_fiscal': '999'}]),
+    }
+    resultados = api.format_execution_output(execution)['results']
+    assert [resultado['file_name'] for resultado in resultados] == ['a.jpg', 'b.jpg']
+    assert [resultado['result']['numero_nota_fiscal'] for resultado in resultados] == ['999', '123456']
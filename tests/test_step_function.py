@@ -0,0 +1,34 @@
+# tests/test_step_function.py
+import pytest
+
+from infrastructure.step_function import build_definition
+from tests.dados import OCR_NOTA
+from tools.pipeline_local import build_local_pipeline
+
+# Cupom com todos os campos válidos: a etapa de regex dispensa a LLM
+OCR_COMPLETO = OCR_NOTA.replace("12.345.678/0001-90", "11.222.333/0001-81")
+
+LAYOUTS = {
+    'tudo_fundido': {'pipeline': ['textract', 'regex', 'llm', 'mover_imagem']},
+    'llm_mover': {'llm_mover': ['llm', 'mover_imagem']},
+}
+
+def test_choice_apos_a_ultima_task_termina_em_succeed():
+    states = build_definition({'pipeline': 'local:pipeline'}, fused_stages=LAYOUTS['tudo_fundido'])['States']
+
+    assert states['TextractConcluido']['Default'] == 'Concluido'
+    assert states['Concluido'] == {'Type': 'Succeed'}
+
+@pytest.mark.parametrize('fused_stages', LAYOUTS.values(), ids=LAYOUTS.keys())
+def test_nota_completa_nao_chama_a_llm(modules, stand_ins, fused_stages):
+    s3, textract, groq = stand_ins
+    s3.put_object(Bucket='bucket-teste', Key='a.jpg', Body=b'imagem')
+    textract.ocr_texts['a.jpg'] = OCR_COMPLETO
+
+    pipeline = build_local_pipeline(modules, fused_stages=fused_stages)
+    pipeline.run({'file_name': 'a.jpg', 'bucket_name': 'bucket-teste'})
+
+    tasks = [entry['state'] for entry in pipeline.report if entry['type'] == 'Task']
+    assert groq.calls == []
+    assert tasks[-1].endswith('MoverIMG')
+    assert len(tasks) == len(set(tasks))
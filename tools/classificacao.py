@@ -0,0 +1,62 @@
+# tools/classificacao.py
+"""
+Lista as notas classificadas em uma pasta (dinheiro ou outros)
+
+As imagens não são mais movidas para dinheiro/ e outros/: cada nota processada tem um
+registro em classificacao/<pasta>/ que aponta para a imagem original e para o
+resultado em resultados/. Esta ferramenta lê a classificação por esses registros.
+
+Uso:
+    python -m tools.classificacao dinheiro [--resultados]
+"""
+import argparse
+import json
+
+CLASSIFICACAO_PREFIX = 'classificacao/'
+
+def list_keys(s3_client, bucket_name, prefix):
+    """Lista todas as chaves sob o prefixo, seguindo a paginação do list_objects_v2"""
+    kwargs = {'Bucket': bucket_name, 'Prefix': prefix}
+    while True:
+        response = s3_client.list_objects_v2(**kwargs)
+        for entry in response.get('Contents', []):
+            if not entry['Key'].endswith('/'):
+                yield entry['Key']
+        if not response.get('IsTruncated'):
+            return
+        kwargs['ContinuationToken'] = response['NextContinuationToken']
+
+def read_json(s3_client, bucket_name, key):
+    return json.loads(s3_client.get_object(Bucket=bucket_name, Key=key)['Body'].read())
+
+def listar_notas(s3_client, bucket_name, pasta, com_resultados=False):
+    """
+    Retorna os registros das notas de uma pasta de classificação
+
+    Args:
+        pasta: 'dinheiro' ou 'outros'
+        com_resultados: Se True, inclui o JSON extraído de cada nota (uma leitura a mais por nota)
+    """
+    notas = []
+    for key in list_keys(s3_client, bucket_name, f"{CLASSIFICACAO_PREFIX}{pasta}/"):
+        registro = read_json(s3_client, bucket_name, key)
+        if com_resultados:
+            registro['result_json'] = read_json(s3_client, bucket_name, registro['resultado'])['result_json']
+        notas.append(registro)
+    return notas
+
+def main(argv=None):
+    from config.settings import BUCKET_NAME
+    from deploy import get_boto3_client
+
+    parser = argparse.ArgumentParser(description='Lista as notas classificadas em uma pasta')
+    parser.add_argument('pasta', choices=['dinheiro', 'outros'])
+    parser.add_argument('--bucket', default=BUCKET_NAME)
+    parser.add_argument('--resultados', action='store_true', help='Inclui o JSON extraído de cada nota')
+    args = parser.parse_args(argv)
+
+    notas = listar_notas(get_boto3_client('s3'), args.bucket, args.pasta, args.resultados)
+    print(json.dumps(notas, indent=2, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,209 @@
+# tools/empacotar.py
+"""
+Monta layers mínimos a partir dos imports reais de cada Lambda
+
+Analisa (ast) os imports dos arquivos de cada Lambda implantada (build_lambda_specs),
+inclusive os feitos dentro de funções, e separa a biblioteca padrão, os módulos já
+fornecidos pelo runtime (boto3/botocore), os arquivos do próprio zip e as dependências
+de terceiros. Cada layer de LAYERS_CONFIG é montado só com as distribuições instaladas
+que as Lambdas que o usam importam (mais as dependências delas), sem __pycache__,
+testes e stubs (.pyi). As dependências de uma Lambda vão para o primeiro layer dela.
+
+Pacotes com extensões compiladas (ex.: pydantic_core) devem ser empacotados com a
+mesma versão de Python do runtime (PYTHON_VERSION) e em Linux x86_64.
+
+Uso:
+    python -m tools.empacotar            # relatório por Lambda e por layer
+    python -m tools.empacotar --gerar    # grava os zips dos layers em layers/
+"""
+import argparse
+import ast
+import importlib.metadata
+import os
+import re
+import sys
+import zipfile
+
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
+LAMBDA_DIR = os.path.join(ROOT_DIR, 'lambda_functions')
+LAYERS_DIR = os.path.join(ROOT_DIR, 'layers')
+
+# Módulos e distribuições incluídos no runtime Python da Lambda
+RUNTIME_MODULES = {'boto3', 'botocore', 's3transfer', 'jmespath', 'dateutil', 'urllib3', 'six'}
+RUNTIME_DISTRIBUTIONS = {'boto3', 'botocore', 's3transfer', 'jmespath', 'python-dateutil', 'urllib3', 'six'}
+
+# Arquivos que não precisam ir para o layer
+EXCLUDED_PARTS = {'__pycache__', 'tests', 'test'}
+EXCLUDED_SUFFIXES = ('.pyc', '.pyi')
+
+# Data fixa das entradas do zip: o mesmo conteúdo gera o mesmo arquivo
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+def imports_do_arquivo(path):
+    """Nomes de primeiro nível importados pelo arquivo (imports absolutos, em qualquer escopo)"""
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read(), filename=path)
+    nomes = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            nomes.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            nomes.add(node.module.split('.')[0])
+    return nomes
+
+def classificar(nome, locais):
+    if nome in locais:
+        return 'local'
+    if nome in sys.stdlib_module_names:
+        return 'padrao'
+    if nome in RUNTIME_MODULES:
+        return 'runtime'
+    return 'terceiros'
+
+def analisar_lambda(spec):
+    """Imports dos arquivos da Lambda agrupados por origem"""
+    locais = {filename.replace('.py', '') for filename in spec['files']}
+    grupos = {'padrao': set(), 'runtime': set(), 'local': set(), 'terceiros': set()}
+    for filename in spec['files']:
+        for nome in imports_do_arquivo(os.path.join(LAMBDA_DIR, filename)):
+            grupos[classificar(nome, locais)].add(nome)
+    return {grupo: sorted(nomes) for grupo, nomes in grupos.items()}
+
+def normalizar(nome):
+    return re.sub(r'[-_.]+', '-', nome).lower()
+
+def dependencias(distribuicao):
+    """Dependências obrigatórias (sem extras) de uma distribuição instalada"""
+    try:
+        from packaging.requirements import Requirement
+    except ImportError:
+        Requirement = None
+
+    nomes = []
+    for requisito in distribuicao.requires or []:
+        if Requirement is not None:
+            requirement = Requirement(requisito)
+            if requirement.marker and not requirement.marker.evaluate({'extra': ''}):
+                continue
+            nomes.append(requirement.name)
+        elif 'extra ==' not in requisito:
+            nomes.append(re.match(r'[A-Za-z0-9_.-]+', requisito).group(0))
+    return nomes
+
+def distribuicoes_necessarias(modulos):
+    """
+    Fecho das distribuições instaladas que fornecem os módulos, sem as do runtime
+
+    Returns:
+        Tupla (dicionário nome normalizado -> distribuição, módulos não instalados)
+    """
+    por_modulo = importlib.metadata.packages_distributions()
+    pendentes = []
+    nao_instalados = []
+    for modulo in modulos:
+        if modulo in por_modulo:
+            pendentes.extend(por_modulo[modulo])
+        else:
+            nao_instalados.append(modulo)
+
+    encontradas = {}
+    while pendentes:
+        nome = normalizar(pendentes.pop())
+        if nome in encontradas or nome in RUNTIME_DISTRIBUTIONS:
+            continue
+        try:
+            distribuicao = importlib.metadata.distribution(nome)
+        except importlib.metadata.PackageNotFoundError:
+            nao_instalados.append(nome)
+            continue
+        encontradas[nome] = distribuicao
+        pendentes.extend(dependencias(distribuicao))
+    return encontradas, nao_instalados
+
+def arquivos_do_layer(distribuicoes):
+    """Lista ordenada de (caminho absoluto, caminho dentro do layer)"""
+    arquivos = {}
+    for distribuicao in distribuicoes.values():
+        for arquivo in distribuicao.files or []:
+            partes = arquivo.parts
+            if partes[0] == '..' or EXCLUDED_PARTS & set(partes) or arquivo.name.endswith(EXCLUDED_SUFFIXES):
+                continue
+            caminho = str(distribuicao.locate_file(arquivo))
+            if os.path.isfile(caminho):
+                arquivos['/'.join(('python',) + partes)] = caminho
+    return sorted((caminho, destino) for destino, caminho in arquivos.items())
+
+def tamanho_arquivos(arquivos):
+    return sum(os.path.getsize(caminho) for caminho, _ in arquivos)
+
+def gravar_zip(arquivos, destino):
+    """Grava o zip com ordem e datas fixas"""
+    with zipfile.ZipFile(destino, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for caminho, nome in sorted(arquivos, key=lambda arquivo: arquivo[1]):
+            info = zipfile.ZipInfo(nome, ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            with open(caminho, 'rb') as f:
+                zipf.writestr(info, f.read())
+
+def planejar_layers(specs):
+    """
+    Distribui as dependências de terceiros de cada Lambda pelos layers configurados
+
+    Returns:
+        Tupla (layer -> módulos de terceiros, Lambdas com dependências sem layer)
+    """
+    modulos_por_layer = {}
+    sem_layer = {}
+    for lambda_type, spec in specs.items():
+        terceiros = analisar_lambda(spec)['terceiros']
+        if not terceiros:
+            continue
+        if not spec['layers']:
+            sem_layer[lambda_type] = terceiros
+            continue
+        modulos_por_layer.setdefault(spec['layers'][0], set()).update(terceiros)
+    return modulos_por_layer, sem_layer
+
+def main(argv=None):
+    from config.settings import LAYERS_CONFIG, PYTHON_VERSION
+    from infrastructure.lambdas import build_lambda_specs
+
+    parser = argparse.ArgumentParser(description='Monta layers mínimos a partir dos imports das Lambdas')
+    parser.add_argument('--gerar', action='store_true', help='Grava os zips dos layers em layers/')
+    args = parser.parse_args(argv)
+
+    specs = build_lambda_specs()
+    for lambda_type, spec in specs.items():
+        grupos = analisar_lambda(spec)
+        print(f"ℹ️ {spec['name']}: terceiros={grupos['terceiros'] or '-'} runtime={grupos['runtime'] or '-'} layers={spec['layers'] or '-'}")
+
+    modulos_por_layer, sem_layer = planejar_layers(specs)
+    for lambda_type, modulos in sem_layer.items():
+        print(f"⚠️ {specs[lambda_type]['name']} importa {modulos} sem layer configurado")
+
+    usados = {layer for spec in specs.values() for layer in spec['layers']}
+    for layer in sorted(usados - set(modulos_por_layer)):
+        print(f"⚠️ Layer {layer} anexado sem nenhum import que precise dele")
+
+    versao_local = f"python{sys.version_info.major}.{sys.version_info.minor}"
+    if args.gerar and versao_local != PYTHON_VERSION:
+        print(f"⚠️ Empacotando com {versao_local}; o runtime usa {PYTHON_VERSION} (extensões compiladas podem não carregar)")
+
+    for layer, modulos in sorted(modulos_por_layer.items()):
+        distribuicoes, nao_instalados = distribuicoes_necessarias(sorted(modulos))
+        arquivos = arquivos_do_layer(distribuicoes)
+        print(
+            f"✅ Layer {layer}: {len(distribuicoes)} distribuições, {len(arquivos)} arquivos, "
+            f"{tamanho_arquivos(arquivos) / 1024 / 1024:.1f} MB descompactado"
+        )
+        if nao_instalados:
+            print(f"⚠️ Não instalados localmente (instale antes de gerar): {sorted(nao_instalados)}")
+            continue
+        if args.gerar and layer in LAYERS_CONFIG:
+            destino = os.path.join(LAYERS_DIR, LAYERS_CONFIG[layer]['zip_file'])
+            gravar_zip(arquivos, destino)
+            print(f"✅ {destino}: {os.path.getsize(destino) / 1024 / 1024:.1f} MB")
+
+if __name__ == '__main__':
+    main()
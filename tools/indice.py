@@ -0,0 +1,189 @@
+# tools/indice.py
+"""
+Compacta e consulta o índice das notas processadas
+
+O MoverIMG grava cada nota como uma parte JSONL pequena em
+indice/data_emissao=AAAA-MM-DD/forma_pgto=<forma>/parte-<id>.jsonl. A compactação
+junta as partes de cada partição em um único arquivo JSONL gzip (compacto-*.jsonl.gz)
+e remove as partes lidas; a consulta lista apenas as partições do período pedido, sem
+listar nem baixar imagens ou resultados. Uma nota reprocessada que muda de partição
+deixa na partição anterior uma marca de remoção, que anula a linha antiga.
+
+Uso:
+    python -m tools.indice compactar [--min-partes 2]
+    python -m tools.indice consultar [--cnpj 12345678000190] [--mes 2024-03] [--de 2024-03-01 --ate 2024-03-15] [--forma dinheiropix]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import re
+from datetime import date, timedelta
+
+from tools.classificacao import list_keys
+
+INDICE_PREFIX = 'indice/'
+PARTE_PREFIX = 'parte-'
+COMPACTO_PREFIX = 'compacto-'
+
+def particao_de(key):
+    """Prefixo da partição (indice/data_emissao=.../forma_pgto=.../) de uma chave do índice"""
+    return key.rsplit('/', 1)[0] + '/'
+
+def ler_linhas(s3_client, bucket_name, key):
+    body = s3_client.get_object(Bucket=bucket_name, Key=key)['Body'].read()
+    if key.endswith('.gz'):
+        body = gzip.decompress(body)
+    return [json.loads(line) for line in body.decode('utf-8').splitlines() if line.strip()]
+
+def deduplicar(linhas):
+    """
+    Mantém a linha mais recente de cada nota (reprocessamentos gravam a mesma nota de novo)
+
+    A linha mais recente pode ser uma marca de remoção ("removido"), gravada quando a
+    nota muda de partição; use sem_removidos para descartá-las. A marca tem o mesmo
+    processado_em da linha nova (resolução de segundos), então, no empate, a linha da
+    nota prevalece sobre a marca.
+    """
+    def ordem(linha):
+        return linha.get('processado_em', 0), not linha.get('removido')
+
+    por_id = {}
+    for linha in linhas:
+        atual = por_id.get(linha['id'])
+        if atual is None or ordem(linha) >= ordem(atual):
+            por_id[linha['id']] = linha
+    return sorted(por_id.values(), key=lambda linha: linha['id'])
+
+def sem_removidos(linhas):
+    return [linha for linha in linhas if not linha.get('removido')]
+
+def compactar_particao(s3_client, bucket_name, particao, keys):
+    """
+    Junta os arquivos da partição em um único arquivo compactado
+
+    Somente os arquivos lidos são removidos, então partes gravadas durante a
+    compactação ficam para a próxima execução.
+    """
+    # As marcas de remoção anulam as linhas antigas lidas junto com elas e não são mantidas
+    linhas = sem_removidos(deduplicar([linha for key in keys for linha in ler_linhas(s3_client, bucket_name, key)]))
+    body = ''.join(json.dumps(linha, ensure_ascii=False) + '\n' for linha in linhas).encode('utf-8')
+    nome = hashlib.sha256(body).hexdigest()[:16]
+    destino = f"{particao}{COMPACTO_PREFIX}{nome}.jsonl.gz"
+
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=destino,
+        Body=gzip.compress(body, mtime=0),
+        ContentType='application/x-ndjson',
+        ContentEncoding='gzip'
+    )
+    for key in keys:
+        if key != destino:
+            s3_client.delete_object(Bucket=bucket_name, Key=key)
+    return destino, len(linhas)
+
+def compactar(s3_client, bucket_name, prefix=INDICE_PREFIX, min_partes=2):
+    """
+    Compacta as partições com pelo menos min_partes arquivos
+
+    Returns:
+        Lista de (arquivo compactado, número de notas, arquivos substituídos)
+    """
+    particoes = {}
+    for key in list_keys(s3_client, bucket_name, prefix):
+        particoes.setdefault(particao_de(key), []).append(key)
+
+    compactados = []
+    for particao, keys in sorted(particoes.items()):
+        if len(keys) < min_partes:
+            continue
+        destino, total = compactar_particao(s3_client, bucket_name, particao, keys)
+        print(f"✅ {particao}: {len(keys)} arquivos -> {destino} ({total} notas)")
+        compactados.append((destino, total, len(keys)))
+    return compactados
+
+def dias(inicio, fim):
+    dia = inicio
+    while dia <= fim:
+        yield dia
+        dia += timedelta(days=1)
+
+def prefixos_consulta(prefix=INDICE_PREFIX, de=None, ate=None, forma=None):
+    """
+    Prefixos a listar para a consulta (poda de partições)
+
+    Com período, lista uma partição por dia em vez do índice inteiro; com forma de
+    pagamento, desce até a subpartição.
+    """
+    sufixo = f"forma_pgto={forma}/" if forma else ''
+    if de is None and ate is None:
+        # Sem período a data não poda; a forma é filtrada pelas chaves listadas
+        return [prefix]
+    inicio = de or ate
+    fim = ate or de
+    return [f"{prefix}data_emissao={dia.isoformat()}/{sufixo}" for dia in dias(inicio, fim)]
+
+def periodo_do_mes(mes):
+    """'2024-03' -> (date(2024, 3, 1), date(2024, 3, 31))"""
+    ano, numero = (int(parte) for parte in mes.split('-'))
+    inicio = date(ano, numero, 1)
+    proximo = date(ano + numero // 12, numero % 12 + 1, 1)
+    return inicio, proximo - timedelta(days=1)
+
+def so_digitos(valor):
+    return re.sub(r'\D', '', valor or '')
+
+def consultar(s3_client, bucket_name, cnpj=None, de=None, ate=None, forma=None, prefix=INDICE_PREFIX):
+    """
+    Retorna as notas do índice que atendem aos filtros
+
+    Args:
+        cnpj: CNPJ do emissor, com ou sem pontuação
+        de, ate: Período da data de emissão (datetime.date, inclusivo)
+        forma: Forma de pagamento ('dinheiropix' ou 'outros')
+    """
+    cnpj = so_digitos(cnpj)
+    linhas = []
+    for prefixo in prefixos_consulta(prefix, de, ate, forma):
+        for key in list_keys(s3_client, bucket_name, prefixo):
+            if forma and f"/forma_pgto={forma}/" not in key:
+                continue
+            linhas.extend(ler_linhas(s3_client, bucket_name, key))
+    # A deduplicação vem antes dos filtros: a marca de remoção não tem os campos da nota
+    return [
+        linha for linha in sem_removidos(deduplicar(linhas))
+        if not cnpj or so_digitos(linha.get('CNPJ_emissor')) == cnpj
+    ]
+
+def main(argv=None):
+    from config.settings import BUCKET_NAME
+    from deploy import get_boto3_client
+
+    parser = argparse.ArgumentParser(description='Compacta e consulta o índice das notas processadas')
+    parser.add_argument('--bucket', default=BUCKET_NAME)
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    parser_compactar = subparsers.add_parser('compactar', help='Junta as partes de cada partição')
+    parser_compactar.add_argument('--min-partes', type=int, default=2)
+
+    parser_consultar = subparsers.add_parser('consultar', help='Consulta as notas do índice')
+    parser_consultar.add_argument('--cnpj', help='CNPJ do emissor')
+    parser_consultar.add_argument('--mes', help='Mês de emissão (AAAA-MM)')
+    parser_consultar.add_argument('--de', type=date.fromisoformat, help='Data de emissão inicial (AAAA-MM-DD)')
+    parser_consultar.add_argument('--ate', type=date.fromisoformat, help='Data de emissão final (AAAA-MM-DD)')
+    parser_consultar.add_argument('--forma', choices=['dinheiropix', 'outros'])
+    args = parser.parse_args(argv)
+
+    s3_client = get_boto3_client('s3')
+    if args.comando == 'compactar':
+        compactados = compactar(s3_client, args.bucket, min_partes=args.min_partes)
+        print(f"ℹ️ {len(compactados)} partições compactadas.")
+        return
+
+    de, ate = periodo_do_mes(args.mes) if args.mes else (args.de, args.ate)
+    notas = consultar(s3_client, args.bucket, cnpj=args.cnpj, de=de, ate=ate, forma=args.forma)
+    print(json.dumps(notas, indent=2, ensure_ascii=False))
+
+if __name__ == '__main__':
+    main()
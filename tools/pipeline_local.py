@@ -0,0 +1,356 @@
+# tools/pipeline_local.py
+"""
+Executor local do pipeline de notas fiscais
+
+Interpreta a mesma definição gerada por infrastructure.step_function.build_definition
+e chama o lambda_handler de cada módulo em processo, com substitutos locais para
+S3, Textract e Groq. Mede o tempo e o tamanho do payload de cada estado.
+
+Uso:
+    python -m tools.pipeline_local nota.jpg [nota2.jpg ...] [--llm-resposta resposta.json]
+
+O texto OCR de cada imagem é lido de um arquivo .txt com o mesmo nome (nota.txt).
+"""
+import argparse
+import copy
+import functools
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), '..'))
+LAMBDA_DIR = os.path.join(ROOT_DIR, 'lambda_functions')
+LOCAL_ARN_PREFIX = 'local:'
+
+class LocalExecutionFailed(Exception):
+    """Execução local terminou em um estado Fail ou com erro não tratado"""
+
+    def __init__(self, error, cause):
+        super().__init__(f"{error}: {cause}")
+        self.error = error
+        self.cause = cause
+
+class LocalContext:
+    """Contexto mínimo de Lambda repassado aos handlers"""
+
+    def __init__(self, function_name, timeout_seconds=30):
+        self.function_name = function_name
+        self.aws_request_id = str(uuid.uuid4())
+        self.invoked_function_arn = f"arn:aws:lambda:us-east-1:000000000000:function:{function_name}"
+        self._deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+def get_path(data, path, context_object=None):
+    """Resolve um caminho JSONPath simples ($.a.b ou $$.Map.Item.Value)"""
+    if path.startswith('$$'):
+        data, path = context_object or {}, path[1:]
+    if path == '$':
+        return data
+    value = data
+    for key in path[2:].split('.'):
+        if isinstance(value, list):
+            value = value[int(key)]
+        elif isinstance(value, dict) and key in value:
+            value = value[key]
+        else:
+            raise KeyError(path)
+    return value
+
+def set_path(data, path, value):
+    """Grava o valor no caminho JSONPath (ResultPath) e retorna o novo documento"""
+    if path is None:
+        return data
+    if path == '$':
+        return value
+    result = copy.deepcopy(data) if isinstance(data, dict) else {}
+    target = result
+    keys = path[2:].split('.')
+    for key in keys[:-1]:
+        target = target.setdefault(key, {})
+    target[keys[-1]] = value
+    return result
+
+def resolve_parameters(template, data, context_object=None):
+    """Aplica um bloco Parameters/ItemSelector/ResultSelector"""
+    if isinstance(template, dict):
+        resolved = {}
+        for key, value in template.items():
+            if key.endswith('.$'):
+                resolved[key[:-2]] = get_path(data, value, context_object)
+            else:
+                resolved[key] = resolve_parameters(value, data, context_object)
+        return resolved
+    if isinstance(template, list):
+        return [resolve_parameters(item, data, context_object) for item in template]
+    return template
+
+def evaluate_rule(rule, data):
+    """Avalia uma regra de um estado Choice"""
+    if 'And' in rule:
+        return all(evaluate_rule(sub_rule, data) for sub_rule in rule['And'])
+    if 'Or' in rule:
+        return any(evaluate_rule(sub_rule, data) for sub_rule in rule['Or'])
+    if 'Not' in rule:
+        return not evaluate_rule(rule['Not'], data)
+
+    try:
+        value = get_path(data, rule['Variable'])
+        present = True
+    except (KeyError, IndexError, ValueError):
+        value, present = None, False
+
+    comparators = {
+        'IsPresent': lambda expected: present == expected,
+        'IsNull': lambda expected: present and (value is None) == expected,
+        'StringEquals': lambda expected: isinstance(value, str) and value == expected,
+        'BooleanEquals': lambda expected: isinstance(value, bool) and value == expected,
+        'NumericEquals': lambda expected: _is_number(value) and value == expected,
+        'NumericLessThan': lambda expected: _is_number(value) and value < expected,
+        'NumericLessThanEquals': lambda expected: _is_number(value) and value <= expected,
+        'NumericGreaterThan': lambda expected: _is_number(value) and value > expected,
+        'NumericGreaterThanEquals': lambda expected: _is_number(value) and value >= expected,
+    }
+    for operator, comparator in comparators.items():
+        if operator in rule:
+            return comparator(rule[operator])
+    raise NotImplementedError(f"Operador de Choice não suportado: {rule}")
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def payload_size(payload):
+    return len(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+
+class LocalStepFunction:
+    """Interpreta uma definição Amazon States Language chamando handlers em processo"""
+
+    def __init__(self, definition, handlers, execute_waits=False, task_overhead=0.0):
+        """
+        Args:
+            definition: Definição da state machine (dict)
+            handlers: Dicionário Resource -> função lambda_handler(event, context)
+            execute_waits: Se True, estados Wait dormem de verdade
+            task_overhead: Segundos somados a cada Task, simulando a invocação da Lambda
+                e a transição de estado da Step Function
+        """
+        self.definition = definition
+        self.handlers = handlers
+        self.execute_waits = execute_waits
+        self.task_overhead = task_overhead
+        self.report = []
+        self._lock = threading.Lock()
+
+    def run(self, execution_input):
+        self.report = []
+        return self._run_machine(self.definition, execution_input, {}, '')
+
+    def _record(self, state_path, state_type, started, payload_in, payload_out):
+        with self._lock:
+            self.report.append({
+                'state': state_path,
+                'type': state_type,
+                'seconds': time.perf_counter() - started,
+                'input_bytes': payload_size(payload_in),
+                'output_bytes': payload_size(payload_out),
+            })
+
+    def _run_machine(self, machine, data, context_object, path_prefix):
+        state_name = machine['StartAt']
+        while True:
+            state = machine['States'][state_name]
+            state_path = f"{path_prefix}{state_name}"
+            state_type = state['Type']
+            started = time.perf_counter()
+
+            if state_type == 'Choice':
+                next_state = next(
+                    (rule['Next'] for rule in state['Choices'] if evaluate_rule(rule, data)),
+                    state.get('Default')
+                )
+                if next_state is None:
+                    raise LocalExecutionFailed('States.NoChoiceMatched', state_path)
+                self._record(state_path, state_type, started, data, data)
+                state_name = next_state
+                continue
+
+            if state_type == 'Succeed':
+                self._record(state_path, state_type, started, data, data)
+                return data
+
+            if state_type == 'Fail':
+                raise LocalExecutionFailed(state.get('Error', 'States.Fail'), state.get('Cause', ''))
+
+            effective_input = get_path(data, state.get('InputPath', '$'))
+            if 'Parameters' in state:
+                effective_input = resolve_parameters(state['Parameters'], effective_input, context_object)
+
+            try:
+                if state_type == 'Task':
+                    result = self._run_task(state, effective_input)
+                elif state_type == 'Map':
+                    result = self._run_map(state, effective_input, state_path)
+                elif state_type == 'Pass':
+                    result = state.get('Result', effective_input)
+                elif state_type == 'Wait':
+                    if self.execute_waits:
+                        time.sleep(state.get('Seconds', 0))
+                    result = effective_input
+                else:
+                    raise NotImplementedError(f"Tipo de estado não suportado: {state_type}")
+            except Exception as e:
+                catcher = self._find_catcher(state, e)
+                if catcher is None:
+                    raise
+                error = getattr(e, 'error', type(e).__name__)
+                cause = getattr(e, 'cause', str(e))
+                self._record(state_path, state_type, started, effective_input, {'Error': error})
+                data = set_path(data, catcher.get('ResultPath', '$'), {'Error': error, 'Cause': cause})
+                state_name = catcher['Next']
+                continue
+
+            if 'ResultSelector' in state:
+                result = resolve_parameters(state['ResultSelector'], result, context_object)
+            self._record(state_path, state_type, started, effective_input, result)
+
+            data = set_path(data, state.get('ResultPath', '$'), result)
+            data = get_path(data, state.get('OutputPath', '$'))
+
+            if state.get('End'):
+                return data
+            state_name = state['Next']
+
+    def _find_catcher(self, state, error):
+        error_name = getattr(error, 'error', type(error).__name__)
+        for catcher in state.get('Catch', []):
+            if 'States.ALL' in catcher['ErrorEquals'] or error_name in catcher['ErrorEquals']:
+                return catcher
+        return None
+
+    def _run_task(self, state, effective_input):
+        resource = state['Resource']
+        if resource not in self.handlers:
+            raise LocalExecutionFailed('States.TaskFailed', f"Recurso sem handler local: {resource}")
+        context = LocalContext(resource.replace(LOCAL_ARN_PREFIX, ''), state.get('TimeoutSeconds', 30))
+        if self.task_overhead:
+            time.sleep(self.task_overhead)
+        # Entrada e saída passam por JSON, como no payload real entre estados
+        output = self.handlers[resource](json.loads(json.dumps(effective_input)), context)
+        return json.loads(json.dumps(output))
+
+    def _run_map(self, state, effective_input, state_path):
+        items = get_path(effective_input, state.get('ItemsPath', '$'))
+        processor = state.get('ItemProcessor') or state['Iterator']
+
+        def run_item(index, item):
+            context_object = {'Map': {'Item': {'Index': index, 'Value': item}}}
+            item_input = item
+            if 'ItemSelector' in state:
+                item_input = resolve_parameters(state['ItemSelector'], effective_input, context_object)
+            return self._run_machine(processor, item_input, context_object, f"{state_path}[{index}].")
+
+        max_workers = state.get('MaxConcurrency') or len(items) or 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(run_item, range(len(items)), items))
+
+def load_lambda_modules():
+    """Importa os módulos de cada Lambda configurada em LAMBDA_FILES"""
+    from config.settings import LAMBDA_FILES
+    from tools.stand_ins import ensure_groq_module
+
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    if LAMBDA_DIR not in sys.path:
+        sys.path.insert(0, LAMBDA_DIR)
+    ensure_groq_module()
+
+    return {
+        lambda_type: importlib.import_module(filename.replace('.py', ''))
+        for lambda_type, filename in LAMBDA_FILES.items()
+    }
+
+def build_local_pipeline(modules, execute_waits=False, fused_stages=None, task_overhead=0.0):
+    """
+    Monta o executor local sobre a definição real da Step Function
+
+    Estágios fundidos (padrão: FUSED_STAGES do settings) executam os handlers das
+    etapas em cadeia, como a Lambda estagio_fundido implantada.
+    """
+    from config.settings import FUSED_STAGES
+    from infrastructure.step_function import build_definition
+    import estagio_fundido
+
+    if fused_stages is None:
+        fused_stages = FUSED_STAGES
+    handlers_by_type = {lambda_type: module.lambda_handler for lambda_type, module in modules.items()}
+    for fused_type, stages in fused_stages.items():
+        stage_handlers = [modules[stage].lambda_handler for stage in stages]
+        handlers_by_type[fused_type] = functools.partial(estagio_fundido.executar_cadeia, stage_handlers)
+
+    lambda_arns = {lambda_type: f"{LOCAL_ARN_PREFIX}{lambda_type}" for lambda_type in handlers_by_type}
+    handlers = {lambda_arns[lambda_type]: handler for lambda_type, handler in handlers_by_type.items()}
+    return LocalStepFunction(
+        build_definition(lambda_arns, fused_stages=fused_stages),
+        handlers,
+        execute_waits,
+        task_overhead
+    )
+
+def print_report(report):
+    """Exibe o tempo e o tamanho dos payloads de cada estado"""
+    print(f"{'Estado':<40} {'Tipo':<8} {'Tempo (ms)':>11} {'Entrada (B)':>12} {'Saída (B)':>10}")
+    for entry in report:
+        print(
+            f"{entry['state']:<40} {entry['type']:<8} {entry['seconds'] * 1000:>11.2f} "
+            f"{entry['input_bytes']:>12} {entry['output_bytes']:>10}"
+        )
+    total = sum(entry['seconds'] for entry in report if entry['type'] == 'Task')
+    print(f"Tempo total em Tasks: {total * 1000:.2f} ms")
+
+def main(argv=None):
+    from tools.stand_ins import FakeGroq, FakeS3, FakeTextract, install_stand_ins
+
+    parser = argparse.ArgumentParser(description='Executa o pipeline de notas fiscais localmente')
+    parser.add_argument('images', nargs='+', help='Imagens das notas (texto OCR em <imagem>.txt)')
+    parser.add_argument('--bucket', default='bucket-local', help='Nome do bucket simulado')
+    parser.add_argument('--llm-resposta', help='Arquivo com a resposta simulada da LLM')
+    args = parser.parse_args(argv)
+
+    s3 = FakeS3()
+    textract = FakeTextract()
+    for image in args.images:
+        file_name = os.path.basename(image)
+        with open(image, 'rb') as f:
+            s3.put_object(Bucket=args.bucket, Key=file_name, Body=f.read())
+        ocr_path = os.path.splitext(image)[0] + '.txt'
+        if os.path.exists(ocr_path):
+            with open(ocr_path, encoding='utf-8') as f:
+                textract.ocr_texts[file_name] = f.read()
+
+    groq = FakeGroq()
+    if args.llm_resposta:
+        with open(args.llm_resposta, encoding='utf-8') as f:
+            llm_response = f.read()
+        groq = FakeGroq(lambda messages: llm_response)
+
+    modules = load_lambda_modules()
+    install_stand_ins(modules, s3=s3, textract=textract, groq=groq)
+    pipeline = build_local_pipeline(modules)
+
+    file_names = [os.path.basename(image) for image in args.images]
+    if len(file_names) == 1:
+        execution_input = {'file_name': file_names[0], 'bucket_name': args.bucket}
+    else:
+        execution_input = {'files': file_names, 'bucket_name': args.bucket}
+
+    output = pipeline.run(execution_input)
+    print(json.dumps(output, indent=2, ensure_ascii=False))
+    print_report(pipeline.report)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,224 @@
+# tools/stand_ins.py
+"""Substitutos locais de S3, Textract e Groq usados pelo executor local do pipeline"""
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import sys
+import types
+from botocore.exceptions import ClientError
+
+def _client_error(code, operation):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+class FakeS3:
+    """S3 em memória com as operações usadas pelas Lambdas"""
+
+    def __init__(self):
+        self.objects = {}
+        self.calls = []
+
+    def _read_body(self, body):
+        if hasattr(body, 'read'):
+            return body.read()
+        if isinstance(body, str):
+            return body.encode('utf-8')
+        return bytes(body)
+
+    def put_object(self, Bucket, Key, Body=b'', **kwargs):
+        self.calls.append('put_object')
+        body = self._read_body(Body)
+        checksum = None
+        if kwargs.get('ChecksumAlgorithm') == 'SHA256':
+            checksum = base64.b64encode(hashlib.sha256(body).digest()).decode()
+        self.objects[(Bucket, Key)] = {
+            'Body': body,
+            'Metadata': kwargs.get('Metadata', {}),
+            'ChecksumSHA256': checksum,
+        }
+        return {'ChecksumSHA256': checksum} if checksum else {}
+
+    def get_object(self, Bucket, Key, **kwargs):
+        self.calls.append('get_object')
+        if (Bucket, Key) not in self.objects:
+            raise _client_error('NoSuchKey', 'GetObject')
+        obj = self.objects[(Bucket, Key)]
+        return {
+            'Body': io.BytesIO(obj['Body']),
+            'ContentLength': len(obj['Body']),
+            'Metadata': obj['Metadata'],
+        }
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self.calls.append('head_object')
+        if (Bucket, Key) not in self.objects:
+            raise _client_error('404', 'HeadObject')
+        obj = self.objects[(Bucket, Key)]
+        response = {'ContentLength': len(obj['Body']), 'Metadata': obj['Metadata']}
+        if kwargs.get('ChecksumMode') == 'ENABLED' and obj.get('ChecksumSHA256'):
+            response['ChecksumSHA256'] = obj['ChecksumSHA256']
+        return response
+
+    def copy_object(self, Bucket, CopySource, Key, **kwargs):
+        self.calls.append('copy_object')
+        source = (CopySource['Bucket'], CopySource['Key'])
+        if source not in self.objects:
+            raise _client_error('NoSuchKey', 'CopyObject')
+        self.objects[(Bucket, Key)] = dict(self.objects[source])
+        return {}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self.calls.append('delete_object')
+        self.objects.pop((Bucket, Key), None)
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix='', MaxKeys=1000, **kwargs):
+        self.calls.append('list_objects_v2')
+        keys = sorted(key for bucket, key in self.objects if bucket == Bucket and key.startswith(Prefix))
+        contents = [
+            {'Key': key, 'Size': len(self.objects[(Bucket, key)]['Body'])}
+            for key in keys[:MaxKeys]
+        ]
+        return {'Contents': contents, 'KeyCount': len(contents), 'IsTruncated': len(keys) > MaxKeys}
+
+class FakeTextract:
+    """Textract que devolve blocos LINE a partir de textos OCR pré-definidos por objeto"""
+
+    def __init__(self, ocr_texts=None, pending_polls=0):
+        # Mapeia a chave do objeto no S3 para o texto OCR (uma linha por bloco LINE)
+        self.ocr_texts = ocr_texts or {}
+        # Número de consultas em que um job assíncrono ainda aparece como IN_PROGRESS
+        self.pending_polls = pending_polls
+        self.jobs = {}
+        self.calls = []
+
+    def _blocks(self, document):
+        key = document['S3Object']['Name']
+        text = self.ocr_texts.get(key, '')
+        blocks = [{'BlockType': 'PAGE', 'Id': 'page-1'}]
+        for index, line in enumerate(text.splitlines()):
+            blocks.append({'BlockType': 'LINE', 'Id': f'line-{index}', 'Text': line})
+        return {'Blocks': blocks, 'DocumentMetadata': {'Pages': 1}}
+
+    def analyze_document(self, Document, FeatureTypes=None, **kwargs):
+        self.calls.append('analyze_document')
+        return self._blocks(Document)
+
+    def detect_document_text(self, Document, **kwargs):
+        self.calls.append('detect_document_text')
+        return self._blocks(Document)
+
+    def _start_job(self, DocumentLocation):
+        job_id = f"job-{len(self.jobs) + 1}"
+        self.jobs[job_id] = {'document': DocumentLocation, 'polls': 0}
+        return {'JobId': job_id}
+
+    def start_document_text_detection(self, DocumentLocation, **kwargs):
+        self.calls.append('start_document_text_detection')
+        return self._start_job(DocumentLocation)
+
+    def start_document_analysis(self, DocumentLocation, FeatureTypes=None, **kwargs):
+        self.calls.append('start_document_analysis')
+        return self._start_job(DocumentLocation)
+
+    def _get_job(self, JobId, MaxResults=1000, NextToken=None):
+        job = self.jobs[JobId]
+        if NextToken is None:
+            job['polls'] += 1
+            if job['polls'] <= self.pending_polls:
+                return {'JobStatus': 'IN_PROGRESS'}
+
+        blocks = self._blocks(job['document'])['Blocks']
+        start = int(NextToken or 0)
+        page = {'JobStatus': 'SUCCEEDED', 'Blocks': blocks[start:start + MaxResults]}
+        if start + MaxResults < len(blocks):
+            page['NextToken'] = str(start + MaxResults)
+        return page
+
+    def get_document_text_detection(self, JobId, **kwargs):
+        self.calls.append('get_document_text_detection')
+        return self._get_job(JobId, **kwargs)
+
+    def get_document_analysis(self, JobId, **kwargs):
+        self.calls.append('get_document_analysis')
+        return self._get_job(JobId, **kwargs)
+
+class FakeGroq:
+    """Cliente Groq que responde com um JSON fixo ou gerado por uma função"""
+
+    def __init__(self, responder=None):
+        # responder recebe a lista de mensagens e devolve o texto da resposta
+        self.responder = responder or (lambda messages: json.dumps(EMPTY_LLM_RESPONSE))
+        self.calls = []
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, **kwargs):
+        self.calls.append(model)
+        content = self.responder(messages)
+        message = types.SimpleNamespace(content=content)
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=message)])
+
+class FakeAsyncGroq:
+    """Versão assíncrona do FakeGroq (mesmas respostas, com latência simulada opcional)"""
+
+    def __init__(self, groq=None, latency=0.0):
+        self.groq = groq or FakeGroq()
+        self.latency = latency
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._create))
+
+    async def _create(self, model, messages, **kwargs):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.groq._create(model, messages, **kwargs)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+EMPTY_LLM_RESPONSE = {
+    "nome_emissor": None,
+    "CNPJ_emissor": None,
+    "endereco_emissor": None,
+    "CNPJ_CPF_consumidor": None,
+    "data_emissao": None,
+    "numero_nota_fiscal": None,
+    "serie_nota_fiscal": None,
+    "valor_total": None,
+    "forma_pgto": "outros"
+}
+
+def ensure_groq_module():
+    """Registra um módulo 'groq' substituto quando o SDK não está instalado"""
+    try:
+        import groq  # noqa: F401
+    except ImportError:
+        module = types.ModuleType('groq')
+        module.Groq = lambda **kwargs: FakeGroq()
+        module.AsyncGroq = lambda **kwargs: FakeAsyncGroq()
+        sys.modules['groq'] = module
+
+def install_stand_ins(modules, s3=None, textract=None, groq=None):
+    """
+    Substitui os clientes das Lambdas importadas pelos substitutos locais
+
+    Args:
+        modules: Dicionário tipo da Lambda -> módulo importado
+        s3: Substituto do cliente S3
+        textract: Substituto do cliente Textract
+        groq: Substituto do cliente Groq
+    """
+    clients = {
+        'textract_function': textract,
+        'llm_finetune': groq,
+    }
+    for module in modules.values():
+        if s3 is not None and hasattr(module, 's3'):
+            module.s3 = s3
+        stand_in = clients.get(module.__name__)
+        if stand_in is not None and hasattr(module, 'client'):
+            module.client = stand_in
+        if groq is not None and hasattr(module, 'criar_cliente_async'):
+            module.criar_cliente_async = lambda: FakeAsyncGroq(groq)